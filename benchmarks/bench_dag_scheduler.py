@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DAG 调度器基准：用空操作函数构造合成 DAG，验证调度开销随节点数线性增长
+
+用法: python benchmarks/bench_dag_scheduler.py [最大节点数]
+"""
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from loguru import logger
+
+# 关闭日志输出，只测量调度本身
+logger.remove()
+
+from llm_flow_engine.executor import Executor
+from llm_flow_engine.workflow import WorkFlow
+
+
+async def noop(*args, **kwargs):
+    return 1
+
+
+def build_workflow(num_nodes: int, max_deps: int = 3, window: int = 64, seed: int = 42) -> WorkFlow:
+    """构造随机 DAG：每个节点依赖前 window 个节点中的至多 max_deps 个"""
+    rng = random.Random(seed)
+    executors = []
+    dep_map = {}
+    for i in range(num_nodes):
+        name = f"n{i}"
+        executors.append(Executor(name, 'task', noop))
+        if i == 0:
+            dep_map[name] = []
+            continue
+        candidates = range(max(0, i - window), i)
+        k = rng.randint(1, min(max_deps, len(candidates)))
+        dep_map[name] = [f"n{j}" for j in rng.sample(candidates, k)]
+    return WorkFlow(executors, force_sequential=False, dep_map=dep_map)
+
+
+async def measure(num_nodes: int, repeat: int = 3) -> float:
+    workflow = build_workflow(num_nodes)
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = await workflow.run()
+        best = min(best, time.perf_counter() - start)
+        assert len(results) == num_nodes
+        assert all(r.status == 'success' for r in results.values())
+    return best
+
+
+async def main(max_nodes: int):
+    sizes = []
+    n = max_nodes
+    while n >= 1000:
+        sizes.append(n)
+        n //= 2
+    sizes.reverse()
+
+    baseline = None
+    for size in sizes:
+        elapsed = await measure(size)
+        per_node = elapsed / size * 1e6
+        baseline = baseline or per_node
+        print(f"{size:>6} 个节点: 总耗时 {elapsed * 1000:9.1f} ms, 每节点 {per_node:7.1f} us "
+              f"(相对最小规模 {per_node / baseline:4.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+占位符解析微基准：对比预编译模板与旧版 resolve_placeholders（每次正则扫描）
+
+用法: python benchmarks/bench_placeholders.py
+"""
+import re
+import sys
+import timeit
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from loguru import logger
+
+# 与生产环境一致：关闭 DEBUG 输出，但旧实现仍会格式化日志参数
+logger.remove()
+logger.add(sys.stderr, level="WARNING")
+
+from llm_flow_engine.utils import compile_placeholders, render_placeholders
+
+
+def legacy_resolve_placeholders(value, context):
+    """旧版实现（逐次 re.findall + str.replace），仅用于对比"""
+    logger.debug(f"resolve_placeholders: value={value}, context keys={list(context.keys()) if isinstance(context, dict) else 'not dict'}")
+    if isinstance(value, str):
+        matches = re.findall(r'\$\{(\w+)\.(\w+)\}', value)
+        for node_name, attr in matches:
+            placeholder = f'${{{node_name}.{attr}}}'
+            resolved_value = None
+            full_key = f"{node_name}.{attr}"
+            if full_key in context:
+                resolved_value = context[full_key]
+            elif node_name in context:
+                node_output = context[node_name]
+                if isinstance(node_output, dict) and attr in node_output:
+                    resolved_value = node_output[attr]
+                elif hasattr(node_output, attr):
+                    resolved_value = getattr(node_output, attr)
+                elif attr == 'output':
+                    resolved_value = node_output
+            if resolved_value is not None:
+                if value.strip() == placeholder:
+                    return resolved_value
+                value = value.replace(placeholder, str(resolved_value))
+        return value
+    elif isinstance(value, dict):
+        return {k: legacy_resolve_placeholders(v, context) for k, v in value.items()}
+    elif isinstance(value, list):
+        return [legacy_resolve_placeholders(v, context) for v in value]
+    return value
+
+
+def build_case(num_nodes: int):
+    """构造一个类似多模型问答的 custom_vars 和运行上下文"""
+    context = {f"node{i}.output": f"answer from node {i} " * 20 for i in range(num_nodes)}
+    context["workflow_input"] = {"question": "what is a DAG?"}
+    custom_vars = {
+        "user_input": "请分析以下回答：\n" + "\n".join(f"{i}. ${{node{i}.output}}" for i in range(num_nodes)),
+        "whole": "${node0.output}",
+        "question": "${workflow_input.question}",
+        "model": "gemma3:4b",
+        "options": {"temperature": 0.7, "hint": "参考 ${node1.output}"},
+    }
+    return custom_vars, context
+
+
+def main():
+    number = 20000
+    for num_nodes in (2, 10, 50):
+        custom_vars, context = build_case(num_nodes)
+        compiled = compile_placeholders(custom_vars)
+        assert render_placeholders(compiled, context) == legacy_resolve_placeholders(custom_vars, context)
+
+        legacy = timeit.timeit(lambda: legacy_resolve_placeholders(custom_vars, context), number=number)
+        fast = timeit.timeit(lambda: render_placeholders(compiled, context), number=number)
+        print(f"{num_nodes:>3} 个引用: 旧实现 {legacy / number * 1e6:8.2f} us/次, "
+              f"预编译模板 {fast / number * 1e6:8.2f} us/次, 加速 {legacy / fast:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,11 @@ from .builtin_functions import BUILTIN_FUNCTIONS
 from .executor import Executor
 from .executor_result import ExecutorResult
 from .workflow import WorkFlow
+from .run_state import RunState
 from .dsl_loader import load_workflow_from_dsl
+from .llm_response import LLMResponse
+from .llm_errors import LLMError, LLMAPIError, LLMConnectionError
+from .circuit_breaker import CircuitOpenError
 from .model_config import ModelConfigProvider, default_model_provider, get_model_config, list_supported_models
 
 # 版本信息
@@ -22,6 +26,12 @@ __all__ = [
     'Executor', 
     'ExecutorResult',
     'WorkFlow',
+    'RunState',
+    'LLMResponse',
+    'LLMError',
+    'LLMAPIError',
+    'LLMConnectionError',
+    'CircuitOpenError',
     'load_workflow_from_dsl',
     'ModelConfigProvider',
     'default_model_provider',
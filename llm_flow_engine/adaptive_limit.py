@@ -0,0 +1,142 @@
+"""
+自适应并发控制 - 按 api_url 的 AIMD（加性增、乘性减）并发上限
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from loguru import logger
+from .engine_context import engine_component
+
+
+class AdaptiveLimiter:
+    """单个端点的自适应并发上限
+
+    - 响应正常且并发已被充分使用时，上限每个“窗口”加 1（每个成功请求加 1/limit）
+    - 遇到 429、5xx、超时或延迟突增（超过基线的 latency_tolerance 倍）时，上限乘以 backoff
+    - 同一拥塞窗口（一个基线延迟内）只下调一次，避免一次突发把上限压到底
+    - 等待者按到达顺序排队，上限提高时一次唤醒多个
+    """
+
+    def __init__(self, name: str, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0, smoothing: float = 0.1):
+        """
+        Args:
+            name: 端点名（api_url）
+            initial_limit: 初始并发上限
+            min_limit: 上限下界
+            max_limit: 上限上界
+            backoff: 拥塞时上限的乘数
+            latency_tolerance: 延迟超过基线多少倍视为延迟突增
+            smoothing: 基线延迟 EWMA 的平滑系数
+        """
+        self.name = name
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._samples = 0
+        self._waiters: deque = deque()
+        self._last_decrease = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.decreases = 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for fut in self._waiters if not fut.done())
+
+    async def acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 已经分配了名额，交还给下一个等待者
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+
+    def record(self, status: int, latency: float):
+        """根据响应状态码和延迟（到响应头的时间）调整上限"""
+        if status == 429 or status >= 500:
+            self.failures += 1
+            self._decrease(f"HTTP {status}")
+            return
+        if status >= 400:
+            # 其他客户端错误与端点负载无关
+            return
+        self.successes += 1
+        spike = (self.baseline is not None and self._samples >= 5
+                 and latency > self.baseline * self.latency_tolerance)
+        if self.baseline is None:
+            self.baseline = latency
+        else:
+            self.baseline += self.smoothing * (latency - self.baseline)
+        self._samples += 1
+        if spike:
+            self._decrease(f"延迟突增 {latency:.3f}s")
+        elif self.in_flight >= self.limit / 2:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def record_timeout(self):
+        self.failures += 1
+        self._decrease("请求超时")
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.baseline or 0.0):
+            return
+        old = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self._last_decrease = now
+        self.decreases += 1
+        logger.debug(f"端点 {self.name} 并发上限 {old} -> {int(self.limit)}（{reason}）")
+
+    def stats(self) -> Dict[str, Any]:
+        return {'limit': int(self.limit), 'in_flight': self.in_flight, 'waiting': self.waiting,
+                'baseline_latency': round(self.baseline, 4) if self.baseline is not None else None,
+                'successes': self.successes, 'failures': self.failures, 'decreases': self.decreases}
+
+
+class AdaptiveLimiterRegistry:
+    """按 api_url 创建自适应限流器，参数对所有端点相同"""
+
+    def __init__(self, **options):
+        self.options = options
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, api_url: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(api_url)
+        if limiter is None:
+            limiter = self._limiters[api_url] = AdaptiveLimiter(api_url, **self.options)
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+def get_adaptive_limiter(api_url: str) -> Optional[AdaptiveLimiter]:
+    """获取当前引擎中端点的自适应限流器，未启用或不在任何引擎内时返回 None"""
+    registry = engine_component('adaptive_limiters')
+    return registry.get(api_url) if registry is not None else None
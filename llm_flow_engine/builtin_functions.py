@@ -13,7 +13,8 @@ from .functions.core import (
 )
 
 from .functions.llm_api import (
-    llm_api_call, llm_simple_call, llm_chat_call
+    llm_api_call, llm_simple_call, llm_chat_call,
+    llm_api_stream, llm_chat_stream, get_stream_stats, get_coalescing_stats, llm_embed_call
 )
 
 # 为了保持完全的向后兼容性，也导出_set_model_provider函数
@@ -25,5 +26,6 @@ __all__ = [
     'http_request_get', 'http_request_post_json', 'http_request',
     'calculate', 'string_to_json', 'json_to_string', 
     'text_process', 'data_merge',
-    'llm_api_call', 'llm_simple_call', 'llm_chat_call'
+    'llm_api_call', 'llm_simple_call', 'llm_chat_call',
+    'llm_api_stream', 'llm_chat_stream', 'get_stream_stats', 'get_coalescing_stats', 'llm_embed_call'
 ]
@@ -0,0 +1,175 @@
+"""
+熔断器 - 按 api_url 统计错误率和慢调用，端点持续异常时快速失败，不再让请求排队等待超时
+"""
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from loguru import logger
+from .llm_errors import LLMError
+from .engine_context import engine_component
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(LLMError):
+    """端点熔断中，请求被直接拒绝；不做重试，避免在失效的后端上排队"""
+
+    retryable = False
+
+    def __init__(self, name: str, retry_in: float = 0.0):
+        super().__init__(f"端点 {name} 熔断中，{retry_in:.1f}s 后试探恢复")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """单个端点的熔断器
+
+    - closed：正常放行，记录最近 window 次调用的结果；至少 min_calls 次调用且失败比例达到
+      failure_rate 时打开。429、5xx、连接异常算失败，耗时超过 slow_call_threshold 的调用也算失败
+    - open：直接拒绝请求，open_duration 秒后进入半开
+    - half_open：最多放行 half_open_probes 个试探请求，试探成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 5,
+                 slow_call_threshold: Optional[float] = None, open_duration: float = 30.0,
+                 half_open_probes: int = 1):
+        """
+        Args:
+            name: 端点名（api_url）
+            failure_rate: 触发熔断的失败比例
+            window: 统计的最近调用次数
+            min_calls: 开始判断前需要的最少调用次数
+            slow_call_threshold: 慢调用阈值（秒），None 表示不按延迟判断
+            open_duration: 熔断持续时长（秒）
+            half_open_probes: 半开状态允许同时进行的试探请求数
+        """
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = max(1, int(min_calls))
+        self.slow_call_threshold = slow_call_threshold
+        self.open_duration = open_duration
+        self.half_open_probes = max(1, int(half_open_probes))
+        self._outcomes: deque = deque(maxlen=max(self.min_calls, int(window)))
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._probes = 0
+            logger.info(f"端点 {self.name} 熔断到期，进入半开状态")
+        return self._state
+
+    def available(self) -> bool:
+        """当前是否会放行请求（不占用试探名额）"""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and self._probes < self.half_open_probes)
+
+    def acquire(self) -> bool:
+        """
+        请求开始前调用，熔断中抛出 CircuitOpenError
+
+        Returns:
+            是否为半开状态的试探请求，需要原样传给 record
+        """
+        if not self.available():
+            self.rejected += 1
+            retry_in = max(0.0, self._opened_at + self.open_duration - time.monotonic())
+            raise CircuitOpenError(self.name, retry_in)
+        if self._state == HALF_OPEN:
+            self._probes += 1
+            return True
+        return False
+
+    def record(self, ok: Optional[bool], latency: Optional[float] = None, probe: bool = False):
+        """
+        记录一次调用结果
+
+        ok 为 None 表示请求被取消，只有已等待时间超过慢调用阈值时才算一次慢调用。
+        """
+        slow = (self.slow_call_threshold is not None and latency is not None
+                and latency > self.slow_call_threshold)
+        if probe:
+            self._probes = max(0, self._probes - 1)
+        if ok is None and not slow:
+            return
+        failed = ok is False or slow
+        self.calls += 1
+        if slow:
+            self.slow_calls += 1
+        if ok is False:
+            self.failures += 1
+        if probe:
+            if failed:
+                self._open("试探请求失败")
+            elif self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._outcomes.clear()
+                logger.info(f"端点 {self.name} 试探成功，熔断关闭")
+            return
+        if self._state != CLOSED:
+            # 熔断前发出的请求，结果不再影响当前状态
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= self.min_calls:
+            rate = sum(self._outcomes) / len(self._outcomes)
+            if rate >= self.failure_rate:
+                self._open(f"最近 {len(self._outcomes)} 次调用失败率 {rate:.0%}")
+
+    def _open(self, reason: str):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probes = 0
+        self._outcomes.clear()
+        self.opens += 1
+        logger.warning(f"端点 {self.name} 熔断 {self.open_duration}s（{reason}）")
+
+    def stats(self) -> Dict[str, Any]:
+        return {'state': self.state, 'calls': self.calls, 'failures': self.failures,
+                'slow_calls': self.slow_calls, 'rejected': self.rejected, 'opens': self.opens}
+
+
+class CircuitBreakerRegistry:
+    """按 api_url 创建熔断器，参数对所有端点相同；enabled=False 时不启用熔断"""
+
+    def __init__(self, enabled: bool = True, **options):
+        self.enabled = enabled
+        self.options = options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, api_url: str) -> Optional[CircuitBreaker]:
+        """获取端点的熔断器，未启用时返回 None"""
+        if not self.enabled:
+            return None
+        # 去掉查询参数（Google 的 API key 在 URL 中），同一端点共用一个熔断器
+        name = api_url.split('?', 1)[0]
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(name, **self.options)
+        return breaker
+
+    def available(self, api_url: str) -> bool:
+        breaker = self.get(api_url)
+        return breaker is None or breaker.available()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+
+# 不在任何引擎内时使用的默认熔断器注册表
+_default_circuit_breakers = CircuitBreakerRegistry()
+
+
+def get_circuit_breakers() -> CircuitBreakerRegistry:
+    """获取当前引擎的熔断器注册表，不在任何引擎内时使用默认注册表"""
+    return engine_component('circuit_breakers', _default_circuit_breakers)
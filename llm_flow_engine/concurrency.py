@@ -0,0 +1,132 @@
+"""
+并发控制 - 全局在途节点数限制和命名资源池（按模型、api_url、工具等）
+"""
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional
+from loguru import logger
+
+# 资源池中代表“全局在途节点数”的保留名称
+GLOBAL_POOL = '*'
+
+
+class ResourcePool:
+    """按优先级排队的计数资源池
+
+    名额不足时，优先级高的等待者先获得名额，同优先级先到先得。
+    等待的 future 在 acquire 时才创建，因此池对象不绑定事件循环，
+    可以在引擎初始化时创建并被多次运行共享。
+    """
+
+    def __init__(self, name: str, limit: int):
+        if limit < 1:
+            raise ValueError(f"资源池 {name} 的并发上限必须 >= 1: {limit}")
+        self.name = name
+        self.limit = limit
+        self.in_use = 0
+        # (-优先级, 序号, future) 组成的小顶堆
+        self._waiters: list = []
+        self._counter = itertools.count()
+        self._cancelled = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters) - self._cancelled
+
+    async def acquire(self, priority: float = 0.0):
+        if self.in_use < self.limit and not self.waiting:
+            self.in_use += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._counter), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 已经被分配了名额，转交给下一个等待者
+                self.release()
+            else:
+                # 延迟删除：堆中的已取消条目在 release 时跳过
+                self._cancelled += 1
+            raise
+
+    def release(self):
+        # 名额直接交给优先级最高的等待者
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                self._cancelled -= 1
+                continue
+            fut.set_result(None)
+            return
+        self.in_use -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {'limit': self.limit, 'in_use': self.in_use, 'waiting': self.waiting}
+
+
+class ResourcePools:
+    """一组命名资源池，未配置上限的资源名不受限制"""
+
+    def __init__(self, limits: Dict[str, int] = None, max_in_flight: Optional[int] = None):
+        """
+        Args:
+            limits: 资源名 -> 并发上限，例如 {"model:gemma3:4b": 2, "ollama": 4}
+            max_in_flight: 全局在途节点数上限，None 或 0 表示不限制
+        """
+        self._pools: Dict[str, ResourcePool] = {}
+        for name, limit in (limits or {}).items():
+            self._pools[name] = ResourcePool(name, int(limit))
+        if max_in_flight:
+            self._pools[GLOBAL_POOL] = ResourcePool(GLOBAL_POOL, int(max_in_flight))
+
+    def __bool__(self) -> bool:
+        return bool(self._pools)
+
+    def pools_for(self, resources: Iterable[str]) -> List[ResourcePool]:
+        """返回节点需要占用的资源池（按名称排序，保证所有节点加锁顺序一致）"""
+        return [self._pools[name] for name in sorted(set(resources)) if name in self._pools]
+
+    @property
+    def global_pool(self) -> Optional[ResourcePool]:
+        return self._pools.get(GLOBAL_POOL)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: pool.stats() for name, pool in self._pools.items()}
+
+
+@asynccontextmanager
+async def hold_slots(resources: Iterable[str], *pool_groups: Optional[ResourcePools], priority: float = 0.0):
+    """
+    为一个节点占用所需的资源名额
+
+    先按组、组内按名称依次获取命名资源池，最后获取全局在途名额：
+    所有节点的加锁顺序一致，不会死锁；等待命名资源时不占用全局名额，
+    需要不同资源的节点不会互相阻塞。名额紧张时 priority 高的节点先获得名额。
+    """
+    groups = [group for group in pool_groups if group]
+    if not groups:
+        yield
+        return
+
+    resources = tuple(resources)
+    ordered: List[ResourcePool] = []
+    for group in groups:
+        ordered.extend(group.pools_for(resources))
+    for group in groups:
+        if group.global_pool is not None:
+            ordered.append(group.global_pool)
+
+    acquired: List[ResourcePool] = []
+    try:
+        for pool in ordered:
+            if pool.in_use >= pool.limit:
+                logger.debug(f"资源池 {pool.name} 已满 ({pool.in_use}/{pool.limit})，排队等待")
+            await pool.acquire(priority)
+            acquired.append(pool)
+        yield
+    finally:
+        for pool in reversed(acquired):
+            pool.release()
@@ -1,16 +1,111 @@
+import hashlib
 import json
 try:
     import yaml
 except ImportError:
     yaml = None
 from .executor import Executor
-from .workflow import WorkFlow
+from .workflow import FAILURE_POLICIES, WorkFlow
 from typing import Union, Callable, Dict
 import re
-from .utils import resolve_placeholders
+from .utils import Template, compile_placeholders, resolve_placeholders
+from .result_cache import NodeCache, default_result_caches, function_id
+from .hedging import default_hedging
 from loguru import logger
 
-def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable], dsl_type: str = 'yaml'):
+def _collect_resources(exe_conf: dict, custom_vars: dict, model_provider=None) -> list:
+    """
+    收集节点占用的命名资源，用于并发限制
+
+    除了 DSL 中显式声明的 resources 外，还会根据静态参数自动添加:
+        model:<模型名>    - 节点使用的模型
+        api_url:<地址>    - 模型对应的 API 地址（需要提供 model_provider）
+        tool:<工具名>     - execute_tool 等调用的工具
+    只有配置了上限的资源名才会真正限流。
+    """
+    resources = exe_conf.get('resources', [])
+    if isinstance(resources, str):
+        resources = [resources]
+    resources = list(resources)
+
+    model = exe_conf.get('model') or custom_vars.get('model')
+    if isinstance(model, str) and '${' not in model:
+        resources.append(f"model:{model}")
+        if model_provider is not None:
+            api_url = model_provider.get_model_config(model).get('api_url')
+            if api_url:
+                resources.append(f"api_url:{api_url}")
+
+    tool_name = custom_vars.get('tool_name')
+    if isinstance(tool_name, str) and '${' not in tool_name:
+        resources.append(f"tool:{tool_name}")
+    return resources
+
+
+def _build_node_cache(cache_conf, exe_conf: dict, custom_vars: dict, model_provider=None,
+                      result_caches=None):
+    """
+    根据节点的 cache 配置创建 NodeCache
+
+    cache: true 表示使用内存缓存、不过期；也可以是 {ttl, backend: memory|sqlite, path}。
+    静态指定的模型配置在此时做成指纹并入缓存键，模型配置变化后旧结果不会被命中。
+    """
+    if not cache_conf:
+        return None
+    if cache_conf is True:
+        cache_conf = {}
+    registry = result_caches or default_result_caches
+    backend = registry.get(cache_conf.get('backend', 'memory'), cache_conf.get('path'))
+
+    salt = ''
+    model = exe_conf.get('model') or custom_vars.get('model')
+    if isinstance(model, str) and '${' not in model and model_provider is not None:
+        salt = json.dumps(model_provider.get_model_config(model), sort_keys=True, default=str)
+    return NodeCache(backend, cache_conf.get('ttl'), salt)
+
+
+def _build_hedge(exe_conf: dict, custom_vars: dict, workflow_key: str, model_provider=None, hedging=None):
+    """
+    根据节点或模型配置创建对冲策略
+
+    节点的 hedge 配置优先（false 表示关闭），否则使用静态模型配置中的 hedge。
+    hedge: true 使用默认参数，也可以是 {quantile, budget, delay, min_samples, window}。
+    节点级策略按 工作流定义/节点 共享统计（workflow_key 含 DSL 哈希，不同工作流互不影响），
+    模型级策略按模型共享。
+    """
+    hedge_conf = exe_conf.get('hedge')
+    key = f"node:{workflow_key}/{exe_conf['name']}"
+    if hedge_conf is None:
+        model = exe_conf.get('model') or custom_vars.get('model')
+        if isinstance(model, str) and '${' not in model and model_provider is not None:
+            hedge_conf = model_provider.get_model_config(model).get('hedge')
+            key = f"model:{model}"
+    if not hedge_conf:
+        return None
+    options = {} if hedge_conf is True else dict(hedge_conf)
+    try:
+        return (hedging or default_hedging).get(key, options)
+    except TypeError as e:
+        raise ValueError(f"执行器 {exe_conf['name']} 的 hedge 配置无效: {e}")
+
+
+def _depends_on(dep_map: Dict[str, list], node: str, target: str) -> bool:
+    """node 是否（传递地）依赖 target"""
+    stack = [node]
+    seen = set()
+    while stack:
+        current = stack.pop()
+        for dep in dep_map.get(current, ()):
+            if dep == target:
+                return True
+            if dep not in seen:
+                seen.add(dep)
+                stack.append(dep)
+    return False
+
+
+def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable], dsl_type: str = 'yaml',
+                           model_provider=None, result_caches=None, hedging=None, registry_version: int = 0):
     """
     从DSL定义加载工作流
     
@@ -18,6 +113,10 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
         dsl: str或dict，定义工作流结构
         func_map: 执行器名称->函数 的映射
         dsl_type: 'yaml' 或 'json'
+        model_provider: 模型配置提供者，用于推导节点占用的 api_url 资源（可选）
+        result_caches: 节点结果缓存注册表（可选，默认使用全局注册表）
+        hedging: 对冲策略注册表（可选，默认使用全局注册表）
+        registry_version: 函数注册表版本，与注册名一起计入节点结果缓存键，重新注册函数后旧结果不再命中
 
     DSL 格式:
         metadata:
@@ -33,7 +132,27 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
               func: str    # 函数名称
               depends_on: []  # 依赖的执行器列表
               custom_vars: {}  # 自定义变量
+              resources: []    # 占用的命名资源，用于并发限制（可选）
+              on_failure: str  # 该节点失败时的策略，覆盖工作流配置（可选）
+              stream_from: str # 以流式方式消费的上游节点（可选），该节点在上游开始时即启动，
+                               # 上游输出以 TokenStream（异步迭代器）作为位置参数传入
+              stream_buffer: int  # 流式输入的缓冲增量数，默认 64
+              cache:           # 结果缓存（可选），true 或:
+                  ttl: int         # 过期时间（秒），不设置表示不过期
+                  backend: str     # memory（默认，进程内 LRU）或 sqlite（磁盘）
+                  path: str        # sqlite 文件路径
+              hedge:           # 请求对冲（可选），true/false 或:
+                  quantile: float  # 触发对冲的延迟分位数，默认 0.95
+                  budget: float    # 副本占主请求的最大比例，默认 0.05
+                  delay: float     # 样本不足时的固定对冲延迟（秒）
               # ... 其他配置
+        on_failure: str    # 节点失败策略（可选，默认 continue）:
+                           #   continue        - 照常运行下游节点
+                           #   skip_dependents - 跳过所有下游节点，结果状态为 skipped
+                           #   cancel          - 取消在途节点（cancelled），其余节点记为 skipped
+        concurrency:       # 并发控制（可选）
+            max_in_flight: int   # 单次运行最多同时执行的节点数
+            pools: {}            # 资源名 -> 并发上限，如 {"model:gemma3:4b": 2}
         output:
             type: "end"    # 终止节点类型
             name: str      # 输出节点名称
@@ -68,6 +187,10 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
         workflow_context = {}
         logger.debug("工作流没有定义输入节点")
 
+    # 节点延迟历史和节点级对冲统计的键：工作流名（可读）+ DSL 内容哈希（区分未命名或同名的不同工作流）
+    digest = hashlib.sha256(json.dumps(dsl_obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:12]
+    workflow_key = f"{metadata.get('name') or description}@{digest}"
+
     # 初始化执行器列表和依赖图
     executors = []
     dep_map = {}
@@ -87,6 +210,9 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
         timeout = exe_conf.get('timeout', 60)
         retry = exe_conf.get('retry', 0)
         retry_interval = exe_conf.get('retry_interval', 1)
+        retry_backoff = exe_conf.get('retry_backoff', 2.0)
+        retry_max_interval = exe_conf.get('retry_max_interval', 30.0)
+        retry_jitter = exe_conf.get('retry_jitter', True)
         context = exe_conf.get('context', {})
         model = exe_conf.get('model')
         kb = exe_conf.get('kb')
@@ -94,23 +220,49 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
         custom_vars = exe_conf.get('custom_vars', {})
         intermediate = exe_conf.get('intermediate', {})
         context_params = exe_conf.get('context_params', {})
+        on_failure = exe_conf.get('on_failure')
+        if on_failure is not None and on_failure not in FAILURE_POLICIES:
+            raise ValueError(f"执行器 {name} 的失败策略无效: {on_failure}，可选值: {', '.join(FAILURE_POLICIES)}")
         logger.debug(f"解析占位符前的custom_vars: {exe_conf.get('custom_vars', {})}")
-        context.update(workflow_context)  # 合并工作流全局上下文
+        # 加载时只解析执行器自身 context 中的占位符；${workflow_input.key} 保留为模板，
+        # 运行时按合并了运行时输入的工作流输入解析，依赖它的 model、tool_name 不算静态参数
         custom_vars = {key: resolve_placeholders(val, context) for key, val in exe_conf.get('custom_vars', {}).items()}
+        context.update(workflow_context)  # 合并工作流全局上下文
         logger.debug(f"解析占位符后的custom_vars: {custom_vars}")
         exe = Executor(
             name, exec_type, func,
             timeout=timeout, retry=retry, retry_interval=retry_interval,
+            retry_backoff=retry_backoff, retry_max_interval=retry_max_interval, retry_jitter=retry_jitter,
             context=context, model=model, kb=kb, ext_dep=ext_dep,
-            custom_vars=custom_vars, intermediate=intermediate, context_params=context_params
+            custom_vars=custom_vars, intermediate=intermediate, context_params=context_params,
+            resources=_collect_resources(exe_conf, custom_vars, model_provider),
+            on_failure=on_failure,
+            stream_from=exe_conf.get('stream_from'),
+            stream_buffer=exe_conf.get('stream_buffer', 64),
+            cache=_build_node_cache(exe_conf.get('cache'), exe_conf, custom_vars, model_provider, result_caches),
+            hedge=_build_hedge(exe_conf, custom_vars, workflow_key, model_provider, hedging),
+            func_id=function_id(func, func_name, registry_version)
         )
         executors.append(exe)
         # 使用depends_on依赖声明
         depends_on = exe_conf.get('depends_on', [])
         if isinstance(depends_on, str):
             depends_on = [depends_on]
+        # 流式上游同时也是依赖
+        if exe.stream_from and exe.stream_from not in depends_on:
+            depends_on = list(depends_on) + [exe.stream_from]
         dep_map[name] = depends_on
 
+    executor_names = {exe.name for exe in executors}
+    for exe in executors:
+        if exe.stream_from and exe.stream_from not in executor_names:
+            raise ValueError(f"执行器 {exe.name} 的流式上游不存在: {exe.stream_from}")
+        # 流式上游要等下游的其它依赖完成后才启动，这些依赖不能反过来依赖流式上游
+        for dep in dep_map[exe.name]:
+            if dep != exe.stream_from and _depends_on(dep_map, dep, exe.stream_from):
+                raise ValueError(f"执行器 {exe.name} 的依赖 {dep} 依赖其流式上游 {exe.stream_from}，"
+                                 f"请改为普通依赖")
+
     # 处理输出节点
     workflow_output = dsl_obj.get('output', {})
     if workflow_output:
@@ -118,19 +270,18 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
         output_data = workflow_output.get('data', workflow_output) if 'data' in workflow_output else workflow_output
         logger.debug(f"工作流输出映射: {output_data}")
         
+        output_templates = {key: compile_placeholders(value) for key, value in output_data.items()}
+
         # 添加虚拟执行器来处理输出
         async def async_output_handler(*args, **kwargs):
             # 优先使用第一个位置参数作为结果
             if args:
                 return args[0]
-            # 如果没有位置参数,尝试从上下文获取结果
-            for key, value in output_data.items():
-                if isinstance(value, str) and value.startswith('${') and value.endswith('}'):
-                    result = value[2:-1].split('.')
-                    if len(result) > 1:
-                        executor_name, output_field = result
-                        if executor_name in workflow_context:
-                            return workflow_context[executor_name][output_field]
+            # 如果没有位置参数,尝试从上下文获取结果（支持嵌套路径）
+            for key, value in output_templates.items():
+                if isinstance(value, Template) and value.whole is not None:
+                    if value.whole.node_name in workflow_context:
+                        return value.render(workflow_context)
             return None
 
         output_executor = Executor(
@@ -161,16 +312,26 @@ def load_workflow_from_dsl(dsl: Union[str, dict], func_map: Dict[str, Callable],
         if output_deps:
             dep_map[output_executor.name] = output_deps
 
+    # 并发控制配置
+    concurrency = dsl_obj.get('concurrency', {}) or {}
+    max_in_flight = concurrency.get('max_in_flight')
+    pool_limits = concurrency.get('pools', {})
+    on_failure = dsl_obj.get('on_failure', 'continue')
+
     # 判断是否为DAG - 统一使用WorkFlow类处理
     is_dag = any(dep_map[name] for name in dep_map)
     if is_dag:
-        workflow = WorkFlow(executors, force_sequential=False, dep_map=dep_map)
+        workflow = WorkFlow(executors, force_sequential=False, dep_map=dep_map,
+                            max_in_flight=max_in_flight, pool_limits=pool_limits, on_failure=on_failure)
     else:
         force_sequential = dsl_obj.get('force_sequential', True)
-        workflow = WorkFlow(executors, force_sequential=force_sequential)
+        workflow = WorkFlow(executors, force_sequential=force_sequential,
+                            max_in_flight=max_in_flight, pool_limits=pool_limits, on_failure=on_failure)
 
     # 设置工作流属性
     workflow.metadata = metadata
+    workflow.name = metadata.get('name') or description
+    workflow.key = workflow_key
     workflow.input = workflow_input
     workflow.output = workflow_output
     workflow.global_context = workflow_context
@@ -0,0 +1,35 @@
+"""
+当前引擎 - 用 contextvar 记录当前任务所属的 FlowEngine，内置函数从中取得引擎级组件
+"""
+import contextvars
+from typing import Any, Optional
+
+# 当前任务所属的引擎，由 FlowEngine 在执行工作流和 async with 期间设置，子任务自动继承
+_current_engine: contextvars.ContextVar = contextvars.ContextVar('llm_flow_engine', default=None)
+
+
+def current_engine() -> Optional[Any]:
+    """返回当前任务所属的引擎，不在任何引擎内时返回 None"""
+    return _current_engine.get()
+
+
+def set_current_engine(engine: Optional[Any]) -> contextvars.Token:
+    """把引擎设为当前任务所属的引擎，返回用于恢复的 token - 由引擎调用"""
+    return _current_engine.set(engine)
+
+
+def reset_current_engine(token: contextvars.Token):
+    """恢复 set_current_engine 之前的引擎 - 由引擎调用"""
+    _current_engine.reset(token)
+
+
+def engine_component(name: str, default: Any = None) -> Any:
+    """
+    取当前引擎的组件（如 http_pool），不在任何引擎内时返回 default
+
+    组件属于创建它的引擎，多个引擎实例同时存在时互不影响。
+    """
+    engine = _current_engine.get()
+    if engine is None:
+        return default
+    return getattr(engine, name, default)
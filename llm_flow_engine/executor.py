@@ -1,21 +1,155 @@
 import asyncio
+import contextvars
+import inspect
+import random
 import time
-from typing import Any, Callable, Optional
+from collections import ChainMap
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Tuple
 from loguru import logger
 from .executor_result import ExecutorResult
-from .utils import resolve_placeholders
+from .result_cache import MISS, NodeCache, function_id
+from .hedging import HedgePolicy
+from .utils import compile_placeholders, resolve_placeholders
+
+# 节点本次调用的截止时间（loop.time()），由执行器在调用函数期间设置；
+# 下游（如 llm_api_call 的自适应并发和熔断）据此区分超时取消和其他取消（如对冲副本被取消）
+call_deadline: contextvars.ContextVar = contextvars.ContextVar('call_deadline', default=None)
+
+
+def call_deadline_expired() -> bool:
+    """当前调用是否已到执行器设置的截止时间 - 用于判断收到的取消是否由节点超时引起"""
+    deadline = call_deadline.get()
+    # 超时回调可能比截止时间早一个时钟精度触发，留出 1ms 余量
+    return deadline is not None and asyncio.get_running_loop().time() >= deadline - 0.001
+
+
+class CallBinding:
+    """执行器的调用适配器 - 在构建执行计划时一次性计算参数绑定规则
+
+    包括函数接受的参数名、是否接受 **kwargs、是否为协程函数，
+    以及上游位置参数的传递方式，运行时不再调用 inspect.signature。
+    """
+
+    # 上游位置参数的传递方式
+    MODE_DEFAULT = 'default'          # 上游输出按顺序填充位置参数
+    MODE_USER_INPUT = 'user_input'    # 只传入 user_input 一个位置参数（llm_simple_call）
+    MODE_KEEP_WORKFLOW_INPUT = 'keep_workflow_input'  # 保留 workflow_input 参数（text_process）
+
+    def __init__(self, func: Callable):
+        self.func_name = getattr(func, '__name__', type(func).__name__)
+        self.is_coroutine = asyncio.iscoroutinefunction(func)
+
+        param_names = set()
+        positional_names = []
+        accepts_var_args = False
+        accepts_var_kwargs = False
+        try:
+            for param in inspect.signature(func).parameters.values():
+                if param.kind == inspect.Parameter.VAR_KEYWORD:
+                    accepts_var_kwargs = True
+                elif param.kind == inspect.Parameter.VAR_POSITIONAL:
+                    accepts_var_args = True
+                else:
+                    param_names.add(param.name)
+                    if param.kind in (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD):
+                        positional_names.append(param.name)
+        except (TypeError, ValueError):
+            # 无法获取签名时不做任何过滤，按原样传递参数
+            accepts_var_args = True
+            logger.debug(f"无法获取函数 {self.func_name} 的签名，仅传递 custom_vars")
+        self.param_names: FrozenSet[str] = frozenset(param_names)
+        self.positional_names: Tuple[str, ...] = tuple(positional_names)
+        self.accepts_var_args = accepts_var_args
+        self.accepts_var_kwargs = accepts_var_kwargs
+
+        if self.func_name == 'llm_simple_call':
+            self.mode = self.MODE_USER_INPUT
+            # user_input 作为位置参数传递，prompt 不被 llm_simple_call 支持
+            self.dropped_kwargs = frozenset({'user_input', 'workflow_input', '_global_context', 'prompt'})
+        elif self.func_name == 'text_process':
+            self.mode = self.MODE_KEEP_WORKFLOW_INPUT
+            self.dropped_kwargs = frozenset({'_global_context'})
+        else:
+            self.mode = self.MODE_DEFAULT
+            self.dropped_kwargs = frozenset({'workflow_input', '_global_context'})
+
+        # 可以从运行时输入中接收的参数名
+        self.runtime_params: FrozenSet[str] = self.param_names - self.dropped_kwargs - {'on_token'}
+        # 函数显式声明 on_token 参数时，流式执行会注入 token 回调
+        self.accepts_on_token = 'on_token' in self.param_names
+
+    def bind(self, args: Tuple, resolved_vars: Dict[str, Any], runtime_kwargs: Dict[str, Any]) -> Tuple[Tuple, Dict[str, Any]]:
+        """
+        根据预先计算的规则生成最终调用参数
+
+        Args:
+            args: 上游节点输出（或工作流位置参数）
+            resolved_vars: 已解析占位符的 custom_vars
+            runtime_kwargs: 已解析占位符、且函数实际接受的运行时输入
+        """
+        dropped = self.dropped_kwargs
+        final_kwargs = {k: v for k, v in resolved_vars.items() if k not in dropped}
+        final_kwargs.update(runtime_kwargs)
+
+        if self.mode == self.MODE_USER_INPUT:
+            # LLM调用总是使用custom_vars中的user_input，而不是上游参数
+            # 因为user_input已经在workflow解析时包含了正确的占位符替换
+            user_input_value = resolved_vars.get('user_input')
+            if user_input_value is None:
+                # 如果没有user_input，则使用上游参数（但这应该很少发生）
+                if args and args[0] is not None:
+                    user_input_value = str(args[0])
+                else:
+                    user_input_value = ""
+            args = (user_input_value,)
+        elif args:
+            args = self._positional_from_upstream(args, final_kwargs)
+        return args, final_kwargs
+
+    def _positional_from_upstream(self, args: Tuple, final_kwargs: Dict[str, Any]) -> Tuple:
+        """上游输出按顺序填充位置参数，遇到已由关键字参数提供的位置即停止（关键字参数优先）"""
+        positional_names = self.positional_names
+        for i in range(min(len(args), len(positional_names))):
+            if positional_names[i] in final_kwargs:
+                return args[:i]
+        if len(args) > len(positional_names) and not self.accepts_var_args:
+            return args[:len(positional_names)]
+        return args
+
+    async def call(self, func: Callable, args: Tuple, kwargs: Dict[str, Any], timeout: Optional[float]) -> Any:
+        """调用目标函数，同步函数直接执行，协程函数受超时控制"""
+        awaitable = func(*args, **kwargs)
+        if not self.is_coroutine and not inspect.isawaitable(awaitable):
+            return awaitable
+        token = call_deadline.set(asyncio.get_running_loop().time() + timeout if timeout else None)
+        try:
+            # wait_for 在新任务中运行时复制当前上下文，被调用的函数能看到截止时间
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        finally:
+            call_deadline.reset(token)
+
 
 class Executor:
     def __init__(self, name: str, exec_type: str, func: Callable, *,
-                 timeout: int = 60, retry: int = 0, retry_interval: int = 1,
+                 timeout: int = 60, retry: int = 0, retry_interval: float = 1,
+                 retry_backoff: float = 2.0, retry_max_interval: float = 30.0, retry_jitter: bool = True,
                  context: dict = None, model=None, kb=None, ext_dep=None,
-                 custom_vars: dict = None, intermediate: dict = None, context_params: dict = None):
+                 custom_vars: dict = None, intermediate: dict = None, context_params: dict = None,
+                 resources: Tuple[str, ...] = (), on_failure: Optional[str] = None,
+                 stream_from: Optional[str] = None, stream_buffer: int = 64,
+                 cache: Optional[NodeCache] = None, hedge: Optional[HedgePolicy] = None,
+                 func_id: Optional[str] = None):
         self.name = name
         self.exec_type = exec_type
         self.func = func
         self.timeout = timeout
         self.retry = retry
+        # 重试等待：retry_interval * retry_backoff ** 第几次重试，不超过 retry_max_interval，
+        # retry_jitter 时在一半到全部之间随机，避免大量节点同时重试
         self.retry_interval = retry_interval
+        self.retry_backoff = retry_backoff
+        self.retry_max_interval = retry_max_interval
+        self.retry_jitter = retry_jitter
         self.context = context or {}
         self.model = model
         self.kb = kb
@@ -23,109 +157,116 @@ class Executor:
         self.custom_vars = custom_vars or {}
         self.intermediate = intermediate or {}
         self.context_params = context_params or {}
+        # 节点占用的命名资源（用于并发限制），例如 ("model:gemma3:4b", "ollama")
+        self.resources = tuple(resources)
+        # 失败策略（continue / skip_dependents / cancel），None 表示使用工作流的配置
+        self.on_failure = on_failure
+        # 流式输入：上游节点名，运行时以 TokenStream 代替该上游的输出传入；stream_buffer 为缓冲的增量数
+        self.stream_from = stream_from
+        self.stream_buffer = stream_buffer
+        # 结果缓存（DSL 中的 cache 配置），None 表示不缓存
+        self.cache = cache
+        # 请求对冲（DSL 或模型配置中的 hedge），None 表示不对冲
+        self.hedge = hedge
+        # 参数绑定规则和 custom_vars 占位符模板在构建时计算一次
+        self.binding = CallBinding(func)
+        self.vars_template = compile_placeholders(self.custom_vars)
+        # 函数标识，作为结果缓存键的一部分（DSL 加载时包含注册名和注册表版本）
+        self.func_id = func_id or function_id(func)
+
+    async def run(self, *args, _deadline: Optional[float] = None,
+                  _on_token: Optional[Callable[[str], Awaitable[None]]] = None, **kwargs) -> ExecutorResult:
+        """
+        运行执行器
 
-    async def run(self, *args, **kwargs) -> ExecutorResult:
+        Args:
+            _deadline: 所属运行的截止时间（loop.time() 时钟），每次尝试的超时不超过剩余预算，
+                预算不足时不再重试
+            _on_token: 异步 token 回调，只注入给显式声明了 on_token 参数的函数
+        """
         start = time.time()
         last_err = None
-        
-        logger.debug(f"执行器 {self.name} 的 custom_vars: {self.custom_vars}")
-        
+        binding = self.binding
+
         # 获取全局执行上下文（包含其他步骤的输出）
         global_context = kwargs.get('_global_context', {})
-        # 合并当前输入和全局上下文
-        execution_context = {**kwargs, **global_context}
-        logger.debug(f"执行器 {self.name} 的全局上下文: {list(global_context.keys())}")
-        
-        # 如果有位置参数传入（来自上游依赖），优先使用它们，否则使用custom_vars
-        # 处理参数，确保不会有重复的参数传递
-        final_kwargs = {k: v for k, v in self.custom_vars.items()}
-        
-        # 获取函数签名，过滤不需要的参数
-        import inspect
-        func_signature = inspect.signature(self.func)
-        func_param_names = set(func_signature.parameters.keys())
-        
-        # 只添加函数实际需要的参数
-        for key, value in kwargs.items():
-            if key in func_param_names:
-                final_kwargs[key] = value
-
-        # 如果 func 是 llm_simple_call，处理特殊情况
-        if self.func.__name__ == 'llm_simple_call':
-            # 移除 custom_vars 中可能存在的 user_input，因为它会作为位置参数传递
-            final_kwargs.pop('user_input', None)
-            # 移除不需要的参数，避免传递给llm_simple_call
-            final_kwargs.pop('workflow_input', None)
-            final_kwargs.pop('_global_context', None)
-            final_kwargs.pop('prompt', None)  # llm_simple_call 不支持 prompt 参数
-            
-            # LLM调用总是使用custom_vars中的user_input，而不是上游参数
-            # 因为user_input已经在workflow解析时包含了正确的占位符替换
-            user_input_value = self.custom_vars.get('user_input')
-            if user_input_value is None:
-                # 如果没有user_input，则使用上游参数（但这应该很少发生）
-                if args and args[0] is not None:
-                    user_input_value = str(args[0])
-                else:
-                    user_input_value = ""
-            
-            args = (user_input_value,)
-            logger.debug(f"执行器 {self.name} 开始运行，user_input: {args[0]}, 额外参数: {final_kwargs}")
-        elif self.func.__name__ == 'text_process':
-            # text_process 函数需要保留 workflow_input 参数
-            final_kwargs.pop('_global_context', None)
-            if args:
-                logger.debug(f"执行器 {self.name} 开始运行，上游参数: {args}, 额外参数: {final_kwargs}")
-            else:
-                logger.debug(f"执行器 {self.name} 开始运行，参数: {args}, {final_kwargs}")
-        else:
-            # 其他函数保持原有逻辑，但也移除不需要的参数
-            final_kwargs.pop('workflow_input', None)
-            final_kwargs.pop('_global_context', None)
-            if args:
-                logger.debug(f"执行器 {self.name} 开始运行，上游参数: {args}, 额外参数: {final_kwargs}")
-            else:
-                logger.debug(f"执行器 {self.name} 开始运行，参数: {args}, {final_kwargs}")
-
-        logger.debug(f"执行器 {self.name} 调用函数 {self.func.__name__} 的最终参数: args={args}, kwargs={final_kwargs}")
-        logger.debug(f"执行器 {self.name} 的最终参数检查: final_kwargs={final_kwargs}")
-        
+        # 合并当前输入和全局上下文（ChainMap 只做查找，不复制上下文，全局上下文优先）
+        execution_context = ChainMap(global_context, kwargs)
+
         # 在执行阶段解析占位符，使用包含全局上下文的execution_context
-        logger.debug(f"解析占位符前的参数: {final_kwargs}")
-        final_kwargs = {key: resolve_placeholders(val, execution_context) for key, val in final_kwargs.items()}
-        logger.debug(f"解析占位符后的参数: {final_kwargs}")
-        logger.debug(f"解析占位符后的参数检查: {final_kwargs}")
-        
-        # 在运行时重新解析 custom_vars
-        self.custom_vars = {key: resolve_placeholders(val, execution_context) for key, val in self.custom_vars.items()}
-        logger.debug(f"运行时重新解析后的 custom_vars: {self.custom_vars}")
-        
-        # 对于 llm_simple_call，需要在占位符解析后重新构建参数
-        if self.func.__name__ == 'llm_simple_call':
-            user_input_value = self.custom_vars.get('user_input')
-            if user_input_value is None:
-                # 如果没有user_input，则使用上游参数（但这应该很少发生）
-                if args and args[0] is not None:
-                    user_input_value = str(args[0])
-                else:
-                    user_input_value = ""
-            
-            args = (user_input_value,)
-            logger.debug(f"占位符解析后重新构建 llm_simple_call 参数，user_input: {args[0]}")
-        
-        
+        # （不回写到实例上，保证同一执行器可被多次复用）
+        resolved_vars = self.vars_template.render(execution_context)
+        # 只传递函数实际需要的运行时输入
+        runtime_kwargs = {key: resolve_placeholders(val, execution_context)
+                          for key, val in kwargs.items() if key in binding.runtime_params}
+        args, final_kwargs = binding.bind(args, resolved_vars, runtime_kwargs)
+
+        # 结果缓存：按函数、最终调用参数和模型配置的内容哈希查找
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.func_id, args, final_kwargs)
+            if cache_key is not None:
+                cached = await self.cache.get(cache_key)
+                if cached is not MISS:
+                    logger.success(f"执行器 {self.name} 命中结果缓存")
+                    return ExecutorResult(self.exec_type, start, time.time(), 'success', None, resolved_vars,
+                                          self.intermediate, self.context_params, cached, cache_hit=True)
+        cache_hit = False if cache_key is not None else None
+
+        if _on_token is not None and binding.accepts_on_token:
+            final_kwargs['on_token'] = _on_token
+        logger.debug(f"执行器 {self.name} 调用函数 {binding.func_name}，参数: args={args}, kwargs={final_kwargs}")
+
+        loop = asyncio.get_running_loop()
         for attempt in range(self.retry + 1):
+            timeout = self.timeout
+            if _deadline is not None:
+                remaining = _deadline - loop.time()
+                if remaining <= 0:
+                    last_err = last_err or '已超过运行截止时间'
+                    break
+                timeout = min(timeout, remaining) if timeout else remaining
             try:
-                result = await asyncio.wait_for(self.func(*args, **final_kwargs), timeout=self.timeout)
+                # 流式输出（注入了 on_token）时两个副本会交错写入增量，不做对冲
+                if self.hedge is not None and 'on_token' not in final_kwargs:
+                    result = await self.hedge.run(
+                        lambda attempt_timeout: binding.call(self.func, args, final_kwargs, attempt_timeout), timeout)
+                else:
+                    result = await binding.call(self.func, args, final_kwargs, timeout)
                 logger.debug(f"执行器 {self.name} 的函数返回值: {result}")
                 logger.success(f"执行器 {self.name} 运行成功，用时: {time.time() - start:.3f}s")
-                return ExecutorResult(self.exec_type, start, time.time(), 'success', None, self.custom_vars, self.intermediate, self.context_params, result)
+                if cache_key is not None:
+                    await self.cache.set(cache_key, result)
+                return ExecutorResult(self.exec_type, start, time.time(), 'success', None, resolved_vars, self.intermediate, self.context_params, result,
+                                      cache_hit=cache_hit)
             except Exception as e:
                 last_err = str(e)
                 logger.warning(f"执行器 {self.name} 第{attempt+1}次尝试失败: {last_err}")
                 if attempt < self.retry:
-                    logger.info(f"等待 {self.retry_interval}s 后重试...")
-                    await asyncio.sleep(self.retry_interval)
-                    
+                    if not getattr(e, 'retryable', True):
+                        logger.warning(f"执行器 {self.name} 的错误不可重试，停止重试")
+                        break
+                    delay = self._retry_delay(attempt, getattr(e, 'retry_after', None))
+                    if delay is None:
+                        logger.warning(f"执行器 {self.name} 上游要求的重试等待超过 {self.retry_max_interval}s，停止重试")
+                        break
+                    if _deadline is not None and _deadline - loop.time() <= delay:
+                        logger.warning(f"执行器 {self.name} 剩余时间不足，停止重试")
+                        break
+                    logger.info(f"等待 {delay:.2f}s 后重试...")
+                    await asyncio.sleep(delay)
+
         logger.error(f"执行器 {self.name} 所有重试均失败，最终错误: {last_err}")
-        return ExecutorResult(self.exec_type, start, time.time(), 'failed', last_err, self.custom_vars, self.intermediate, self.context_params, None)
+        return ExecutorResult(self.exec_type, start, time.time(), 'failed', last_err, resolved_vars, self.intermediate, self.context_params, None,
+                              cache_hit=cache_hit)
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[float]) -> Optional[float]:
+        """第 attempt 次失败后的等待时间；上游 Retry-After 作为下限，超过 retry_max_interval 时返回 None"""
+        delay = min(self.retry_max_interval, self.retry_interval * self.retry_backoff ** attempt)
+        if self.retry_jitter:
+            delay = random.uniform(delay / 2, delay)
+        if retry_after is not None:
+            if retry_after > self.retry_max_interval:
+                return None
+            delay = max(delay, retry_after)
+        return delay
@@ -3,7 +3,8 @@ from typing import Any, Optional
 
 class ExecutorResult:
     def __init__(self, exec_type: str, start_time: float, end_time: float, status: str, error: Optional[str],
-                 custom_vars: dict = None, intermediate: dict = None, context_params: dict = None, output: Any = None):
+                 custom_vars: dict = None, intermediate: dict = None, context_params: dict = None, output: Any = None,
+                 cache_hit: Optional[bool] = None):
         self.exec_time = end_time - start_time
         self.status = status
         self.error = error
@@ -12,6 +13,8 @@ class ExecutorResult:
         self.context_params = context_params or {}
         self.output = output
         self.exec_type = exec_type
+        # 结果缓存：True 命中，False 未命中，None 表示节点未启用缓存
+        self.cache_hit = cache_hit
 
     def to_dict(self):
         return {
@@ -21,5 +24,6 @@ class ExecutorResult:
             'custom_vars': self.custom_vars,
             'intermediate': self.intermediate,
             'context_params': self.context_params,
-            'output': self.output
+            'output': self.output,
+            'cache_hit': self.cache_hit
         }
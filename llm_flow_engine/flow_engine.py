@@ -4,23 +4,96 @@ LLM Flow DSL 执行引擎 - 核心入口
 """
 import asyncio
 import json
-from typing import Dict, Any, List
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, AsyncIterator, List, Optional
 from .dsl_loader import load_workflow_from_dsl
 from .builtin_functions import BUILTIN_FUNCTIONS, _set_model_provider
 from .model_config import ModelConfigProvider, default_model_provider
+from .plan_cache import PlanCache
+from .concurrency import ResourcePools
+from .latency_stats import LatencyStats
+from .http_pool import HttpClientPool
+from .result_cache import ResultCacheRegistry
+from .llm_cache import LLMResponseCache
+from .semantic_cache import SemanticCache
+from .rate_limit import RateLimiterRegistry
+from .adaptive_limit import AdaptiveLimiterRegistry
+from .load_balancer import LoadBalancer
+from .circuit_breaker import CircuitBreakerRegistry
+from .micro_batch import MicroBatcher
+from .hedging import HedgeRegistry
+from .engine_context import reset_current_engine, set_current_engine
 
 class FlowEngine:
-    def __init__(self, model_provider: ModelConfigProvider = None):
+    def __init__(self, model_provider: ModelConfigProvider = None, plan_cache_size: int = 128,
+                 max_concurrency: int = None, resource_limits: Dict[str, int] = None,
+                 http_options: Dict[str, Any] = None, llm_cache_options: Dict[str, Any] = None,
+                 semantic_cache_options: Dict[str, Any] = None, rate_limits: Dict[str, Dict[str, float]] = None,
+                 adaptive_concurrency: Dict[str, Any] = None, load_balancer_options: Dict[str, Any] = None,
+                 circuit_breaker_options: Dict[str, Any] = None, micro_batch: Dict[str, Any] = None):
         """
         初始化Flow引擎
         
         Args:
             model_provider: 自定义模型配置提供者，如果不提供则使用全局默认配置
+            plan_cache_size: 已编译工作流的缓存容量，0 表示禁用缓存
+            max_concurrency: 该引擎上所有运行合计的最大在途节点数，None 表示不限制
+            resource_limits: 引擎级命名资源池上限，所有运行共享，
+                例如 {"api_url:http://localhost:11434/api/chat": 4, "model:gemma3:4b": 2}
+            http_options: LLM 平台 HTTP 连接池参数（见 HttpClientPool），
+                例如 {"limit_per_host": 32, "keepalive_timeout": 60, "connect_timeout": 5}
+            llm_cache_options: LLM 响应缓存参数（见 LLMResponseCache），
+                默认不启用，例如 {"enabled": True, "path": "cache/llm.db", "max_bytes": 64 * 1024 * 1024}
+            semantic_cache_options: 语义缓存参数（见 SemanticCache），提供时为 llm_simple_call 和 rag_qa 启用，
+                必须指定 embed 函数或 embedding 模型，例如 {"embedding_model": "nomic-embed-text", "threshold": 0.9}
+            rate_limits: 按模型或端点的速率限制，覆盖模型配置中的 rpm / tpm，
+                例如 {"api_url:http://localhost:11434/api/chat": {"rpm": 120}}
+            adaptive_concurrency: 提供时为每个 api_url 启用 AIMD 自适应并发上限（参数见 AdaptiveLimiter），
+                例如 {"initial_limit": 4, "max_limit": 32}，{} 表示使用默认参数
+            load_balancer_options: 多端点模型的摘除参数（见 LoadBalancer），
+                例如 {"failure_threshold": 3, "cooldown": 30}
+            circuit_breaker_options: 按端点的熔断参数（见 CircuitBreaker），
+                例如 {"failure_rate": 0.5, "slow_call_threshold": 20, "open_duration": 30}，{"enabled": False} 关闭熔断
+            micro_batch: 提供时启用微批处理（参数见 MicroBatcher），embedding 模型的 embedding_text 调用
+                合并为批量请求，例如 {"max_batch": 64, "max_wait": 0.01}，{} 表示使用默认参数
         """
         self.builtin_functions = BUILTIN_FUNCTIONS.copy()
         self.model_provider = model_provider or default_model_provider
+        # 函数注册表版本号，注册表变化时递增，使旧的执行计划失效
+        self.registry_version = 0
+        self.plan_cache = PlanCache(plan_cache_size)
+        # 引擎级资源池，被该引擎上的所有运行共享
+        self.resource_pools = ResourcePools(resource_limits, max_concurrency)
+        # 节点耗时历史，用于并发受限时的关键路径优先调度
+        self.latency_stats = LatencyStats()
+        # 节点结果缓存（DSL 中 cache 配置的后端），被该引擎上的所有工作流共享
+        self.result_caches = ResultCacheRegistry()
+        # 请求对冲策略（DSL 或模型配置中的 hedge），延迟分位数和对冲预算被该引擎上的所有工作流共享
+        self.hedging = HedgeRegistry()
         
-        # 设置全局模型配置提供者，供内置函数使用
+        # 该引擎的 HTTP 连接池，被引擎内的所有 LLM 平台适配器复用，close() 时关闭
+        self.http_pool = HttpClientPool(**(http_options or {}))
+        # LLM 响应缓存（磁盘），需要通过 llm_cache_options={"enabled": True} 启用，第一次缓存请求时才打开数据库文件
+        self.llm_cache = LLMResponseCache(**(llm_cache_options or {}))
+        # 语义缓存（可选），相似提示词复用历史回答
+        self.semantic_cache = (SemanticCache(model_provider=self.model_provider, **semantic_cache_options)
+                               if semantic_cache_options is not None else None)
+        # 令牌桶限流器（模型配置 rpm / tpm 及 rate_limits），所有 LLM 调用共享
+        self.rate_limiters = RateLimiterRegistry(rate_limits)
+        # 按端点的自适应并发上限（可选）
+        self.adaptive_limiters = (AdaptiveLimiterRegistry(**adaptive_concurrency)
+                                  if adaptive_concurrency is not None else None)
+        # 多端点模型（endpoints / api_urls）的端点选择与健康状态
+        self.load_balancer = LoadBalancer(**(load_balancer_options or {}))
+        # 按端点的熔断器，熔断时快速失败并改用模型配置中的 fallbacks
+        self.circuit_breakers = CircuitBreakerRegistry(**(circuit_breaker_options or {}))
+        # 微批处理（可选），短时间内的向量化请求合并发送
+        self.micro_batcher = MicroBatcher(**micro_batch) if micro_batch is not None else None
+        # async with 进入时设置当前引擎的 token，退出时按栈恢复
+        self._context_tokens: List = []
+        
+        # 设置全局模型配置提供者，供不在任何引擎内调用的内置函数使用
         _set_model_provider(self.model_provider)
         
         # 将模型配置相关函数注入到内置函数中
@@ -32,6 +105,7 @@ class FlowEngine:
     def register_function(self, name: str, func):
         """注册自定义函数"""
         self.builtin_functions[name] = func
+        self.registry_version += 1
     
     def set_model_provider(self, provider: ModelConfigProvider):
         """设置模型配置提供者"""
@@ -43,37 +117,142 @@ class FlowEngine:
             'get_model_config': provider.get_model_config,
             'list_supported_models': provider.list_supported_models,
         })
+        self.registry_version += 1
     
     def add_model(self, model_name: str, config: dict):
         """添加新模型配置到当前引擎"""
         self.model_provider.add_model(model_name, config)
+        # 模型配置会影响节点占用的 api_url 资源，旧的执行计划需要重新构建
+        self.registry_version += 1
+    
+    def load_workflow(self, dsl: str, dsl_type: str = 'yaml'):
+        """
+        加载（或从缓存中取出）已编译的工作流
+        
+        相同的DSL文本在注册表未变化时只解析和构建一次，之后直接复用。
+        """
+        if not isinstance(dsl, str):
+            return load_workflow_from_dsl(dsl, self.builtin_functions, dsl_type, self.model_provider,
+                                          self.result_caches, self.hedging, self.registry_version)
+        key = PlanCache.make_key(dsl, dsl_type, self.registry_version)
+        workflow = self.plan_cache.get(key)
+        if workflow is None:
+            workflow = load_workflow_from_dsl(dsl, self.builtin_functions, dsl_type, self.model_provider,
+                                              self.result_caches, self.hedging, self.registry_version)
+            self.plan_cache.put(key, workflow)
+        return workflow
+    
+    def plan_cache_stats(self) -> Dict[str, int]:
+        """返回执行计划缓存的命中统计"""
+        return self.plan_cache.stats()
+    
+    def result_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """返回节点结果缓存各后端的命中统计"""
+        return self.result_caches.stats()
+    
+    def llm_cache_stats(self) -> Dict[str, Any]:
+        """返回 LLM 响应缓存的条目数、占用大小、命中和淘汰统计"""
+        return self.llm_cache.stats()
+    
+    def semantic_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """返回语义缓存的命名空间大小和命中统计，未启用时返回 None"""
+        return self.semantic_cache.stats() if self.semantic_cache is not None else None
+    
+    def rate_limit_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各限流器的配置、排队数和累计等待时间"""
+        return self.rate_limiters.stats()
+    
+    def adaptive_concurrency_stats(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """返回各端点当前的自适应并发上限、在途数、排队数和基线延迟，未启用时返回 None"""
+        return self.adaptive_limiters.stats() if self.adaptive_limiters is not None else None
+    
+    def endpoint_stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """返回多端点模型各端点的在途数、延迟 EWMA、失败和摘除情况"""
+        return self.load_balancer.stats()
+    
+    def circuit_breaker_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各端点熔断器的状态、调用数、失败数、慢调用数和拒绝数"""
+        return self.circuit_breakers.stats()
+    
+    def micro_batch_stats(self) -> Optional[Dict[str, Any]]:
+        """返回微批处理的批次数、条目数和平均/最大批次大小，未启用时返回 None"""
+        return self.micro_batcher.stats() if self.micro_batcher is not None else None
+    
+    def hedge_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回各对冲策略的当前对冲延迟、样本数、副本数和副本胜出次数"""
+        return self.hedging.stats()
+    
+    def concurrency_stats(self) -> Dict[str, Dict[str, int]]:
+        """返回引擎级资源池的占用情况（上限、在用、排队数）"""
+        return self.resource_pools.stats()
+    
+    async def close(self):
+        """关闭引擎持有的 HTTP 连接、响应缓存和节点结果缓存（在引擎所在的事件循环中调用）"""
+        await self.http_pool.close()
+        self.llm_cache.close()
+        self.result_caches.close()
+    
+    @contextmanager
+    def activate(self):
+        """
+        在当前上下文中使用该引擎
+        
+        执行工作流时自动生效；在引擎外直接调用 llm_api_call 等内置函数时，用
+        ``with engine.activate():`` 或 ``async with engine:`` 使调用使用该引擎的连接池、
+        缓存、限流器等组件。不在任何引擎内的调用使用各模块的默认组件。
+        """
+        token = set_current_engine(self)
+        try:
+            yield self
+        finally:
+            reset_current_engine(token)
+    
+    async def __aenter__(self):
+        self._context_tokens.append(set_current_engine(self))
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        reset_current_engine(self._context_tokens.pop())
+        await self.close()
     
-    async def execute_dsl(self, dsl: str, inputs: Dict[str, Any] = None, dsl_type: str = 'yaml') -> Dict[str, Any]:
+    def _new_run_state(self, workflow, inputs: Dict[str, Any], timeout: Optional[float]):
+        """创建一次运行的状态（独立的运行状态，共享引擎级资源池和耗时历史）"""
+        state = workflow.new_run_state(**(inputs or {}))
+        state.engine_pools = self.resource_pools
+        state.latency_stats = self.latency_stats
+        state.set_timeout(timeout)
+        return state
+    
+    async def execute_dsl(self, dsl: str, inputs: Dict[str, Any] = None, dsl_type: str = 'yaml',
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         执行DSL流程
         Args:
             dsl: DSL定义字符串
             inputs: 用户输入参数
             dsl_type: DSL类型 ('yaml' 或 'json')
+            timeout: 整个运行的时间预算（秒），每个节点的超时不超过剩余预算；
+                超时后取消所有在途节点并返回部分结果（success 为 False）
         Returns:
             包含执行结果和元信息的字典
+
+        调用方取消本协程时，所有在途节点和 HTTP 请求都会随之取消。
         """
         try:
-            # 解析并创建工作流
-            workflow = load_workflow_from_dsl(dsl, self.builtin_functions, dsl_type)
+            # 解析并创建工作流（命中缓存时直接复用已编译的工作流）
+            workflow = self.load_workflow(dsl, dsl_type)
             
             # 执行工作流
-            if inputs:
-                results = await workflow.run(**inputs)
-            else:
-                results = await workflow.run()
+            state = self._new_run_state(workflow, inputs, timeout)
+            with self.activate():
+                results = await workflow.run_with_state(state)
             
             return {
-                'success': True,
+                'success': not state.timed_out,
                 'dsl': dsl,
                 'inputs': inputs or {},
                 'results': results,
-                'error': None
+                'error': f"运行超过时间预算 {timeout}s，已返回部分结果" if state.timed_out else None
             }
         except Exception as e:
             return {
@@ -84,6 +263,57 @@ class FlowEngine:
                 'error': str(e)
             }
     
+    async def execute_dsl_stream(self, dsl: str, inputs: Dict[str, Any] = None, dsl_type: str = 'yaml',
+                                 timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式执行DSL流程，在运行过程中逐个产出事件字典
+        
+        事件类型（type 字段）:
+            node_started  - 节点开始执行（已获得并发名额），node 为节点名
+            node_token    - 节点产生的文本增量 delta（仅声明了 on_token 参数的函数，如 llm_simple_call）
+            node_finished - 节点结束，包含 status / output / error / exec_time
+                            （跳过和取消的节点同样会产生该事件）
+            run_finished  - 运行结束，最后一个事件，包含与 execute_dsl 返回值相同的字段
+        
+        参数与 execute_dsl 相同。调用方提前停止迭代时，运行会被取消。
+        """
+        try:
+            workflow = self.load_workflow(dsl, dsl_type)
+            state = self._new_run_state(workflow, inputs, timeout)
+        except Exception as e:
+            yield {'type': 'run_finished', 'node': None, 'time': time.time(), 'success': False,
+                   'dsl': dsl, 'inputs': inputs or {}, 'results': None, 'error': str(e)}
+            return
+        
+        events = state.events = asyncio.Queue()
+        # 运行任务创建时复制当前上下文，其中的节点都使用该引擎
+        with self.activate():
+            run_task = asyncio.create_task(workflow.run_with_state(state))
+        # 运行结束后放入结束标记，此前产生的事件都已在队列中
+        run_task.add_done_callback(lambda _t: events.put_nowait(None))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            
+            error = run_task.exception()
+            if error is not None:
+                result = {'success': False, 'results': None, 'error': str(error)}
+            else:
+                result = {
+                    'success': not state.timed_out,
+                    'results': run_task.result(),
+                    'error': f"运行超过时间预算 {timeout}s，已返回部分结果" if state.timed_out else None
+                }
+            yield {'type': 'run_finished', 'node': None, 'time': time.time(),
+                   'dsl': dsl, 'inputs': inputs or {}, **result}
+        finally:
+            if not run_task.done():
+                run_task.cancel()
+                await asyncio.gather(run_task, return_exceptions=True)
+    
     async def execute_simple_flow(self, user_input: str) -> Dict[str, Any]:
         """
         执行简单的用户输入 -> LLM处理 -> 输出流程
@@ -9,7 +9,8 @@ from .core import (
 )
 
 from .llm_api import (
-    llm_api_call, llm_simple_call, llm_chat_call, _set_model_provider
+    llm_api_call, llm_simple_call, llm_chat_call, _set_model_provider,
+    llm_api_stream, llm_chat_stream, get_stream_stats, get_coalescing_stats, llm_embed_call
 )
 
 from .data_flow import (
@@ -70,6 +71,7 @@ BUILTIN_FUNCTIONS = {
     "llm_api_call": llm_api_call,
     "llm_simple_call": llm_simple_call,
     "llm_chat_call": llm_chat_call,
+    "llm_embed_call": llm_embed_call,
     
     # 数据流处理
     "combine_outputs": combine_outputs,
@@ -3,6 +3,7 @@
 """
 from typing import List, Dict
 from loguru import logger
+from ..llm_errors import LLMError
 
 
 async def agent_process(user_input: str, kb_name: str = None, model: str = "gemma3:4b", 
@@ -64,6 +65,8 @@ async def agent_process(user_input: str, kb_name: str = None, model: str = "gemm
         logger.success(f"Agent处理完成")
         return response
         
+    except LLMError:
+        raise
     except Exception as e:
         logger.error(f"Agent处理失败: {e}")
         return f"处理失败: {str(e)}"
@@ -4,6 +4,7 @@
 import time
 from typing import Dict, List
 from loguru import logger
+from ..llm_errors import LLMError
 
 
 _knowledge_base = {}  # 知识库存储
@@ -118,6 +119,8 @@ async def knowledge_base_qa(kb_name: str, question: str, model: str = "gemma3:4b
         
         logger.info(f"知识库问答完成: {kb_name} - {question}")
         return answer
+    except LLMError:
+        raise
     except Exception as e:
         logger.error(f"知识库问答失败: {e}")
         return f"问答失败: {str(e)}"
@@ -1,19 +1,43 @@
 """
 LLM API调用模块 - 处理各种LLM平台的API调用
 """
-import aiohttp
 import asyncio
-from typing import Any, Dict, List
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+import aiohttp
 from loguru import logger
+from ..http_pool import get_http_pool
+from ..engine_context import engine_component
+from ..llm_cache import LLMResponseCache, get_llm_cache
+from ..semantic_cache import get_semantic_cache
+from ..singleflight import SingleFlight
+from ..rate_limit import estimate_tokens, get_rate_limiters
+from ..adaptive_limit import get_adaptive_limiter
+from ..load_balancer import Endpoint, get_load_balancer
+from ..circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breakers
+from ..llm_response import LLMResponse
+from ..hedging import hedged_call
+from ..executor import call_deadline_expired
+from ..llm_errors import LLMAPIError, LLMConnectionError, parse_retry_after
+
+
+def _is_endpoint_failure(error: BaseException) -> bool:
+    """异常是否说明端点本身异常（429、5xx、连接失败或超时），用于端点健康判断和备用模型切换"""
+    if isinstance(error, LLMAPIError):
+        return error.endpoint_failure
+    return isinstance(error, (LLMConnectionError, aiohttp.ClientError, asyncio.TimeoutError, OSError))
 
 # 全局模型配置提供者 - 会在引擎初始化时注入
 _current_model_provider = None
 
 
 def _get_model_config(model: str) -> dict:
-    """获取模型配置 - 内部使用"""
-    if _current_model_provider:
-        return _current_model_provider.get_model_config(model)
+    """获取模型配置 - 内部使用，优先使用当前引擎的模型配置提供者"""
+    provider = engine_component('model_provider') or _current_model_provider
+    if provider:
+        return provider.get_model_config(model)
     else:
         # 后备方案：使用默认全局配置
         from ..model_config import get_model_config
@@ -26,25 +50,63 @@ def _set_model_provider(provider):
     _current_model_provider = provider
 
 
-async def llm_api_call(user_input: str = None, prompt: str = None, model: str = "gemma3:4b", **kwargs) -> str:
+@asynccontextmanager
+async def _endpoint_slot(api_url: str):
+    """占用端点的自适应并发名额（未启用自适应并发时直接进入），产出限流器或 None"""
+    # 去掉查询参数（Google 的 API key 在 URL 中），同一端点共用一个限流器
+    limiter = get_adaptive_limiter(api_url.split('?', 1)[0])
+    if limiter is None:
+        yield None
+        return
+    await limiter.acquire()
+    try:
+        yield limiter
+    except asyncio.TimeoutError:
+        limiter.record_timeout()
+        raise
+    except asyncio.CancelledError:
+        # 端点无响应直到节点超时，请求被执行器取消，同样视为超时
+        if call_deadline_expired():
+            limiter.record_timeout()
+        raise
+    finally:
+        limiter.release()
+
+
+@asynccontextmanager
+async def _transport_errors(label: str):
+    """把 aiohttp 的连接错误和读取超时转换为 LLMConnectionError，交给重试、熔断和备用模型处理"""
+    try:
+        yield
+    except aiohttp.ContentTypeError:
+        # 响应格式不对不是传输问题，原样抛出
+        raise
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise LLMConnectionError(label, e) from e
+
+
+async def _post_json(api_url: str, payload: dict, headers: dict, label: str) -> Any:
     """
-    通用LLM API调用 - 使用DataProvider模式支持预配置模型
-    
-    Args:
-        user_input: 用户原始输入内容（会作为 role="user" 的消息）
-        prompt: 系统提示词（会作为 role="system" 的消息）
-        model: 模型名称
-        **kwargs: 其他参数
-    
-    支持的模型请调用 list_supported_models() 查看
+    通过引擎的共享连接池发送 JSON POST 请求，返回解析后的 JSON
+
+    非 200 响应抛出 LLMAPIError，携带状态码和 Retry-After；连接失败和超时抛出 LLMConnectionError
     """
+    session = get_http_pool().session()
+    async with _transport_errors(label), _endpoint_slot(api_url) as limiter:
+        start = time.perf_counter()
+        async with session.post(api_url, json=payload, headers=headers) as resp:
+            if limiter is not None:
+                limiter.record(resp.status, time.perf_counter() - start)
+            if resp.status != 200:
+                raise LLMAPIError(label, resp.status, await resp.text(),
+                                  parse_retry_after(resp.headers.get("Retry-After")))
+            return await resp.json()
+
+
+def _prepare_call(user_input: str, prompt: str, model: str, kwargs: dict) -> Tuple[dict, list, dict]:
+    """获取模型配置、构建消息列表并过滤平台支持的参数"""
     # 获取模型配置
     config = _get_model_config(model)
-    platform = config["platform"]
-    
-    # 从配置中提取api_url和api_key
-    api_url = config['api_url']
-    api_key = config.get('api_key', None)
     
     # 构建消息格式
     if "messages" in kwargs:
@@ -66,27 +128,236 @@ async def llm_api_call(user_input: str = None, prompt: str = None, model: str =
         if not messages:
             raise ValueError("必须提供 user_input、prompt 或 messages 参数")
     
-    # 过滤支持的参数
+    # 过滤支持的参数（messages 已单独传递，不能再出现在关键字参数中）
     filtered_kwargs = {}
     for key, value in kwargs.items():
-        if key in config.get("supports", []) or key in ["messages", "max_tokens"]:
+        if key in config.get("supports", []) or key == "max_tokens":
             filtered_kwargs[key] = value
+    return config, messages, filtered_kwargs
+
+
+async def _cache_lookup(config: dict, model: str, messages: list, params: dict,
+                        use_cache: Optional[bool]) -> Tuple[Optional[str], Optional[str]]:
+    """查询响应缓存，返回 (缓存键, 命中的回复)；请求不可缓存时缓存键为 None
+
+    优先级：调用参数 use_cache > 模型配置 response_cache > 默认策略（temperature 为 0）
+    """
+    cache = get_llm_cache()
+    if use_cache is None:
+        use_cache = config.get('response_cache')
+    if not cache.should_cache(params, use_cache):
+        return None, None
+    key = cache.make_key(config["platform"], model, messages, params)
+    return key, await cache.get(key)
+
+
+def _is_cacheable_reply(text: Any) -> bool:
+    """空回复不缓存（调用失败时抛出异常，不会走到缓存）"""
+    return isinstance(text, str) and bool(text)
+
+
+async def _cache_store(key: Optional[str], text: str):
+    """把成功的回复写入响应缓存"""
+    if key is not None and _is_cacheable_reply(text):
+        await get_llm_cache().set(key, text)
+
+
+# 进行中的相同请求合并为一次上游调用
+inflight_requests = SingleFlight()
+
+
+async def llm_api_call(user_input: str = None, prompt: str = None, model: str = "gemma3:4b",
+                       on_token: Callable[[str], Awaitable[None]] = None,
+                       use_cache: Optional[bool] = None, **kwargs) -> str:
+    """
+    通用LLM API调用 - 使用DataProvider模式支持预配置模型
     
-    # 根据平台调用对应API
-    if platform == 'openai' or platform == 'openai_compatible':
-        return await _call_openai_api(api_url, model, messages, api_key, config, **filtered_kwargs)
-    elif platform == 'anthropic':
-        return await _call_anthropic_api(api_url, model, messages, api_key, config, **filtered_kwargs)
-    elif platform == 'ollama':
-        return await _call_ollama_api(api_url, model, messages, api_key, config, **filtered_kwargs)
-    elif platform == 'google':
-        return await _call_google_api(api_url, model, messages, api_key, config, **filtered_kwargs)
-    else:
-        return f"Error: Unsupported platform {platform} for model {model}"
+    Args:
+        user_input: 用户原始输入内容（会作为 role="user" 的消息）
+        prompt: 系统提示词（会作为 role="system" 的消息）
+        model: 模型名称
+        on_token: 异步回调，提供时以流式方式调用并逐个传入文本增量，仍返回完整文本
+        use_cache: 是否使用响应缓存；默认 None 表示只缓存 temperature 为 0 的确定性请求
+        **kwargs: 其他参数
+    
+    支持的模型请调用 list_supported_models() 查看
+    """
+    if on_token is not None:
+        parts = []
+        metadata = {}
+        async for delta in llm_api_stream(user_input, prompt, model, use_cache=use_cache,
+                                          _metadata=metadata, **kwargs):
+            parts.append(delta)
+            await on_token(delta)
+        return LLMResponse("".join(parts).strip(), metadata)
 
+    config, messages, filtered_kwargs = _prepare_call(user_input, prompt, model, kwargs)
+    cache_key, cached = await _cache_lookup(config, model, messages, filtered_kwargs, use_cache)
+    if cached is not None:
+        logger.debug(f"模型 {model} 命中响应缓存")
+        return LLMResponse(cached, {'model': model, 'platform': config["platform"], 'cache_hit': True})
 
-async def _call_openai_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
-    """调用OpenAI格式的API"""
+    # 完全相同的并发请求只发送一次（模型配置 coalesce: false 可关闭）；对冲副本必须独立发送
+    if config.get('coalesce', True) and not hedged_call.get():
+        flight_key = cache_key or LLMResponseCache.make_key(config["platform"], model, messages, filtered_kwargs)
+        result = await inflight_requests.do(
+            flight_key, lambda: _dispatch(config, model, messages, filtered_kwargs, cache_key))
+        # 合并的调用方共享同一个结果，每人拿一份副本，修改 metadata 不会影响其他调用方
+        if isinstance(result, LLMResponse):
+            result = LLMResponse(str(result), dict(result.metadata))
+        return result
+    return await _dispatch(config, model, messages, filtered_kwargs, cache_key)
+
+
+def _fallback_chain(model: str, config: dict) -> List[Tuple[str, Optional[dict]]]:
+    """主模型及模型配置 fallbacks 中按顺序列出的备用模型，备用模型的配置在用到时才读取"""
+    chain = [(model, config)]
+    for name in config.get('fallbacks') or []:
+        if all(name != seen for seen, _ in chain):
+            chain.append((name, None))
+    return chain
+
+
+def _fallback_params(config: dict, params: dict) -> dict:
+    """按备用模型支持的参数重新过滤"""
+    return {key: value for key, value in params.items()
+            if key in config.get("supports", []) or key == "max_tokens"}
+
+
+def _open_endpoint(model: str, config: dict) -> Tuple[dict, Optional[Endpoint], Optional[CircuitBreaker], bool]:
+    """
+    选择端点并通过熔断器检查
+
+    Returns:
+        (使用所选端点的配置, 负载均衡端点, 熔断器, 是否为半开试探请求)；端点熔断时抛出 CircuitOpenError
+    """
+    balancer = get_load_balancer()
+    breakers = get_circuit_breakers()
+    endpoint = balancer.acquire(model, config, breakers.available)
+    if endpoint is not None:
+        config = dict(config, api_url=endpoint.api_url, api_key=endpoint.api_key)
+    breaker = breakers.get(config['api_url'])
+    try:
+        probe = breaker.acquire() if breaker is not None else False
+    except CircuitOpenError:
+        if endpoint is not None:
+            balancer.release(endpoint, None)
+        raise
+    return config, endpoint, breaker, probe
+
+
+def _close_endpoint(endpoint: Optional[Endpoint], breaker: Optional[CircuitBreaker], probe: bool,
+                    ok: Optional[bool], latency: Optional[float]):
+    """请求结束：把结果反馈给负载均衡和熔断器"""
+    if endpoint is not None:
+        get_load_balancer().release(endpoint, ok, latency)
+    if breaker is not None:
+        breaker.record(ok, latency, probe)
+
+
+async def _dispatch(config: dict, model: str, messages: list, filtered_kwargs: dict,
+                    cache_key: Optional[str] = None) -> str:
+    """
+    发送非流式请求，主模型成功的回复写入响应缓存
+
+    主模型端点熔断或返回 429/5xx、连接失败时，立即按顺序改用模型配置 fallbacks 中的备用模型，
+    其他错误（如 400、401）直接抛出；
+    备用模型给出的回复在 metadata 中记录 fallback_from。所有模型都熔断时抛出 CircuitOpenError。
+    """
+    chain = _fallback_chain(model, config)
+    for index, (name, candidate) in enumerate(chain):
+        is_last = index == len(chain) - 1
+        params = filtered_kwargs
+        if index > 0:
+            candidate = _get_model_config(name)
+            params = _fallback_params(candidate, filtered_kwargs)
+        try:
+            result = await _call_model(candidate, name, messages, params)
+        except CircuitOpenError as e:
+            if is_last:
+                raise
+            logger.warning(f"{e}，模型 {name} 改用备用模型 {chain[index + 1][0]}")
+            continue
+        except Exception as e:
+            if is_last or not _is_endpoint_failure(e):
+                raise
+            logger.warning(f"模型 {name} 调用失败: {e}，改用备用模型 {chain[index + 1][0]}")
+            continue
+        if index == 0:
+            await _cache_store(cache_key, result)
+        elif isinstance(result, LLMResponse):
+            # 新建回复对象，不修改可能被其他调用方共享的结果
+            result = LLMResponse(str(result), {**result.metadata, 'fallback_from': model})
+        return result
+
+
+class _UpstreamCall:
+    """一次上游请求：所选端点的配置和请求耗时（成功后才有）"""
+
+    __slots__ = ('config', 'latency')
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.latency: Optional[float] = None
+
+
+@asynccontextmanager
+async def _upstream_call(model: str, config: dict, tokens: float):
+    """
+    选择端点（跳过熔断中的端点）并按模型/端点限流排队，产出 _UpstreamCall
+
+    结束时把结果和耗时反馈给负载均衡和熔断器；400、401 等请求本身的错误不影响端点健康判断。
+    """
+    config, endpoint, breaker, probe = _open_endpoint(model, config)
+    upstream = _UpstreamCall(config)
+    outcome = None
+    latency = None
+    start = None
+    try:
+        await get_rate_limiters().acquire(model, config, tokens)
+        start = time.perf_counter()
+        yield upstream
+        latency = upstream.latency = time.perf_counter() - start
+        outcome = True
+    except asyncio.CancelledError:
+        if start is not None:
+            latency = time.perf_counter() - start
+            # 因节点超时被取消说明端点无响应，算一次失败；其他取消（如对冲副本被取消）不影响健康判断
+            if call_deadline_expired():
+                outcome = False
+        raise
+    except Exception as e:
+        if _is_endpoint_failure(e):
+            outcome = False
+            if start is not None:
+                latency = time.perf_counter() - start
+        raise
+    finally:
+        _close_endpoint(endpoint, breaker, probe, outcome, latency)
+
+
+async def _call_model(config: dict, model: str, messages: list, filtered_kwargs: dict) -> str:
+    """
+    向单个模型发送非流式请求
+
+    返回 LLMResponse，metadata 中记录实际使用的端点和耗时。
+    """
+    platform = config["platform"]
+    call = _PLATFORM_CALLS.get(platform)
+    if call is None:
+        raise ValueError(f"Unsupported platform {platform} for model {model}")
+
+    tokens = estimate_tokens(messages, filtered_kwargs.get("max_tokens", 150))
+    async with _upstream_call(model, config, tokens) as upstream:
+        request_config = upstream.config
+        result = await call(request_config['api_url'], model, messages, request_config.get('api_key', None),
+                            request_config, **filtered_kwargs)
+    return LLMResponse(result, {'model': model, 'platform': platform, 'endpoint': request_config['api_url'],
+                                'latency': upstream.latency})
+
+
+def _openai_request(api_url: str, model: str, messages: list, api_key: str, stream: bool, **kwargs):
+    """构建OpenAI格式的请求 (url, headers, payload)"""
     headers = {"Content-Type": "application/json"}
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
@@ -96,25 +367,25 @@ async def _call_openai_api(api_url: str, model: str, messages: list, api_key: st
         "messages": messages,
         "max_tokens": kwargs.get("max_tokens", 150),
         "temperature": kwargs.get("temperature", 0.7),
-        "stream": False
+        "stream": stream
     }
     
     # 添加OpenAI特有参数
     for key in ["top_p", "frequency_penalty", "presence_penalty", "stop"]:
         if key in kwargs:
             payload[key] = kwargs[key]
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(api_url, json=payload, headers=headers) as resp:
-            if resp.status == 200:
-                result = await resp.json()
-                return result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
-            else:
-                return f"OpenAI API Error: {resp.status} - {await resp.text()}"
+    return api_url, headers, payload
 
 
-async def _call_anthropic_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
-    """调用Anthropic Claude API"""
+async def _call_openai_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
+    """调用OpenAI格式的API"""
+    api_url, headers, payload = _openai_request(api_url, model, messages, api_key, False, **kwargs)
+    result = await _post_json(api_url, payload, headers, "OpenAI")
+    return result.get("choices", [{}])[0].get("message", {}).get("content", "").strip()
+
+
+def _anthropic_request(api_url: str, model: str, messages: list, api_key: str, stream: bool, **kwargs):
+    """构建Anthropic Claude的请求 (url, headers, payload)"""
     headers = {
         "Content-Type": "application/json",
         "x-api-key": api_key or "",
@@ -126,45 +397,53 @@ async def _call_anthropic_api(api_url: str, model: str, messages: list, api_key:
         "messages": messages,
         "max_tokens": kwargs.get("max_tokens", 150)
     }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(api_url, json=payload, headers=headers) as resp:
-            if resp.status == 200:
-                result = await resp.json()
-                return result.get("content", [{}])[0].get("text", "").strip()
-            else:
-                return f"Anthropic API Error: {resp.status} - {await resp.text()}"
+    if stream:
+        payload["stream"] = True
+    return api_url, headers, payload
 
 
-async def _call_ollama_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
-    """调用Ollama本地API"""
+async def _call_anthropic_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
+    """调用Anthropic Claude API"""
+    api_url, headers, payload = _anthropic_request(api_url, model, messages, api_key, False, **kwargs)
+    result = await _post_json(api_url, payload, headers, "Anthropic")
+    return result.get("content", [{}])[0].get("text", "").strip()
+
+
+def _ollama_request(api_url: str, model: str, messages: list, api_key: str, stream: bool, **kwargs):
+    """构建Ollama的请求 (url, headers, payload)"""
     headers = {"Content-Type": "application/json"}
     
     payload = {
         "model": model,
         "messages": messages,
-        "stream": False
+        "stream": stream
     }
     
     # Ollama支持的参数
     for key in ["temperature", "top_p", "top_k"]:
         if key in kwargs:
             payload[key] = kwargs[key]
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(api_url, json=payload, headers=headers) as resp:
-            if resp.status == 200:
-                result = await resp.json()
-                return result.get("message", {}).get("content", "").strip()
-            else:
-                return f"Ollama API Error: {resp.status} - {await resp.text()}"
+    return api_url, headers, payload
 
 
-async def _call_google_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
-    """调用Google Gemini API"""
+async def _call_ollama_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
+    """调用Ollama本地API"""
+    api_url, headers, payload = _ollama_request(api_url, model, messages, api_key, False, **kwargs)
+    result = await _post_json(api_url, payload, headers, "Ollama")
+    return result.get("message", {}).get("content", "").strip()
+
+
+def _google_request(api_url: str, model: str, messages: list, api_key: str, stream: bool, **kwargs):
+    """构建Google Gemini的请求 (url, headers, payload)，流式请求使用 streamGenerateContent + SSE"""
     headers = {"Content-Type": "application/json"}
+    params = []
+    if stream:
+        api_url = api_url.replace(":generateContent", ":streamGenerateContent")
+        params.append("alt=sse")
     if api_key:
-        api_url += f"?key={api_key}"
+        params.append(f"key={api_key}")
+    if params:
+        api_url += ("&" if "?" in api_url else "?") + "&".join(params)
     
     # 转换消息格式为Google格式
     contents = []
@@ -181,26 +460,297 @@ async def _call_google_api(api_url: str, model: str, messages: list, api_key: st
             "temperature": kwargs.get("temperature", 0.7)
         }
     }
-    
-    async with aiohttp.ClientSession() as session:
+    return api_url, headers, payload
+
+
+async def _call_google_api(api_url: str, model: str, messages: list, api_key: str, config: dict, **kwargs) -> str:
+    """调用Google Gemini API"""
+    api_url, headers, payload = _google_request(api_url, model, messages, api_key, False, **kwargs)
+    result = await _post_json(api_url, payload, headers, "Google")
+    candidates = result.get("candidates", [])
+    if candidates:
+        return candidates[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
+    return ""
+
+
+# 平台 -> 非流式调用函数
+_PLATFORM_CALLS = {
+    'openai': _call_openai_api,
+    'openai_compatible': _call_openai_api,
+    'anthropic': _call_anthropic_api,
+    'ollama': _call_ollama_api,
+    'google': _call_google_api,
+}
+
+
+# ---------------------------------------------------------------------------
+# 向量化
+# ---------------------------------------------------------------------------
+
+# 平台 -> (错误标签, 从响应中按输入顺序取出向量)；OpenAI /v1/embeddings 和 Ollama /api/embed 都接受 input 列表
+_EMBEDDING_ADAPTERS = {
+    'openai': ("OpenAI", lambda result: [item["embedding"] for item in
+                                         sorted(result.get("data", []), key=lambda item: item.get("index", 0))]),
+    'ollama': ("Ollama", lambda result: result.get("embeddings", [])),
+}
+_EMBEDDING_ADAPTERS['openai_compatible'] = _EMBEDDING_ADAPTERS['openai']
+
+
+async def llm_embed_call(texts: List[str], model: str) -> List[List[float]]:
+    """
+    一次请求向量化多条文本，按输入顺序返回向量
+
+    模型配置需要声明 embedding: true，api_url 指向 embedding 接口
+    （如 https://api.openai.com/v1/embeddings 或 http://localhost:11434/api/embed）。
+    """
+    config = _get_model_config(model)
+    platform = config["platform"]
+    adapter = _EMBEDDING_ADAPTERS.get(platform)
+    if adapter is None:
+        raise ValueError(f"Unsupported embedding platform {platform} for model {model}")
+    label, parse = adapter
+    tokens = sum(len(text) for text in texts) // 4
+    async with _upstream_call(model, config, tokens) as upstream:
+        headers = {"Content-Type": "application/json"}
+        api_key = upstream.config.get('api_key')
+        if api_key and platform != 'ollama':
+            headers["Authorization"] = f"Bearer {api_key}"
+        result = await _post_json(upstream.config['api_url'], {"model": model, "input": list(texts)}, headers, label)
+        vectors = parse(result)
+    if len(vectors) != len(texts):
+        raise ValueError(f"模型 {model} 返回 {len(vectors)} 个向量，预期 {len(texts)} 个")
+    return vectors
+
+
+# ---------------------------------------------------------------------------
+# 流式调用
+# ---------------------------------------------------------------------------
+
+def _sse_data(line: str):
+    """取出 SSE 的 data 字段，其他字段（event/id 等）返回 None"""
+    if not line.startswith("data:"):
+        return None
+    return line[5:].strip()
+
+
+def _parse_openai_line(line: str) -> Tuple[str, bool]:
+    data = _sse_data(line)
+    if not data:
+        return "", False
+    if data == "[DONE]":
+        return "", True
+    choices = json.loads(data).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or "", False
+
+
+def _parse_anthropic_line(line: str) -> Tuple[str, bool]:
+    data = _sse_data(line)
+    if not data:
+        return "", False
+    event = json.loads(data)
+    if event.get("type") == "content_block_delta":
+        return event.get("delta", {}).get("text") or "", False
+    return "", event.get("type") == "message_stop"
+
+
+def _parse_ollama_line(line: str) -> Tuple[str, bool]:
+    chunk = json.loads(line)
+    return chunk.get("message", {}).get("content") or "", bool(chunk.get("done"))
+
+
+def _parse_google_line(line: str) -> Tuple[str, bool]:
+    data = _sse_data(line)
+    if not data:
+        return "", False
+    candidates = json.loads(data).get("candidates") or []
+    if not candidates:
+        return "", False
+    parts = candidates[0].get("content", {}).get("parts") or [{}]
+    return parts[0].get("text") or "", False
+
+
+# 平台 -> (请求构建函数, 逐行解析函数, 错误信息前缀)
+_STREAM_ADAPTERS = {
+    'openai': (_openai_request, _parse_openai_line, "OpenAI"),
+    'openai_compatible': (_openai_request, _parse_openai_line, "OpenAI"),
+    'anthropic': (_anthropic_request, _parse_anthropic_line, "Anthropic"),
+    'ollama': (_ollama_request, _parse_ollama_line, "Ollama"),
+    'google': (_google_request, _parse_google_line, "Google"),
+}
+
+
+class StreamStats:
+    """流式调用统计：按模型记录首 token 延迟（TTFT）和总耗时"""
+
+    def __init__(self):
+        self._models: Dict[str, Dict[str, float]] = {}
+
+    def record(self, model: str, ttft: float, total: float, chunks: int):
+        entry = self._models.setdefault(model, {'streams': 0, 'ttft_last': 0.0, 'ttft_avg': 0.0,
+                                                'ttft_max': 0.0, 'total_avg': 0.0, 'chunks': 0})
+        entry['streams'] += 1
+        n = entry['streams']
+        entry['ttft_last'] = ttft
+        entry['ttft_avg'] += (ttft - entry['ttft_avg']) / n
+        entry['ttft_max'] = max(entry['ttft_max'], ttft)
+        entry['total_avg'] += (total - entry['total_avg']) / n
+        entry['chunks'] += chunks
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {model: dict(entry) for model, entry in self._models.items()}
+
+
+stream_stats = StreamStats()
+
+
+async def _stream_lines(api_url: str, payload: dict, headers: dict, parse_line, label: str):
+    """通过共享连接池发送流式请求，逐行解析并产出文本增量；非 200 时抛出 LLMAPIError，连接失败时抛出 LLMConnectionError"""
+    session = get_http_pool().session()
+    async with _transport_errors(label), _endpoint_slot(api_url) as limiter:
+        start = time.perf_counter()
         async with session.post(api_url, json=payload, headers=headers) as resp:
-            if resp.status == 200:
-                result = await resp.json()
-                candidates = result.get("candidates", [])
-                if candidates:
-                    return candidates[0].get("content", {}).get("parts", [{}])[0].get("text", "").strip()
-                return ""
-            else:
-                return f"Google API Error: {resp.status} - {await resp.text()}"
+            # 流式请求以首包（响应头）延迟作为自适应并发的信号，名额保持到响应体读完
+            if limiter is not None:
+                limiter.record(resp.status, time.perf_counter() - start)
+            if resp.status != 200:
+                raise LLMAPIError(label, resp.status, await resp.text(),
+                                  parse_retry_after(resp.headers.get("Retry-After")))
+            done = False
+            async for raw in resp.content:
+                line = raw.decode("utf-8").strip()
+                # 结束标记之后继续读完响应体，让连接可以回到连接池复用
+                if done or not line:
+                    continue
+                delta, done = parse_line(line)
+                if delta:
+                    yield delta
 
 
-async def llm_simple_call(user_input: str, model: str = "gemma3:4b", **kwargs) -> str:
+async def llm_api_stream(user_input: str = None, prompt: str = None, model: str = "gemma3:4b",
+                         use_cache: Optional[bool] = None, _metadata: Optional[dict] = None,
+                         **kwargs) -> AsyncIterator[str]:
+    """
+    流式LLM API调用 - 参数与 llm_api_call 相同，逐个产出文本增量
+
+    OpenAI/Anthropic 使用 SSE，Ollama 使用 NDJSON，Google 使用 streamGenerateContent (alt=sse)。
+    首 token 延迟和总耗时记录在 stream_stats 中。命中响应缓存时一次性产出完整回复。
+    主模型端点熔断、返回 429/5xx 或连接失败时，只要还没有产出增量，就与 llm_api_call 一样改用备用模型。
+
+    用法:
+        async for delta in llm_api_stream("你好", model="gemma3:4b"):
+            print(delta, end="")
+    """
+    config, messages, filtered_kwargs = _prepare_call(user_input, prompt, model, kwargs)
+    cache_key, cached = await _cache_lookup(config, model, messages, filtered_kwargs, use_cache)
+    if cached is not None:
+        logger.debug(f"模型 {model} 命中响应缓存")
+        yield cached
+        return
+
+    # 主模型熔断、返回 429/5xx 或连接失败时，在产出第一个增量前按顺序改用 fallbacks 中的备用模型；
+    # 开始产出后不再切换
+    chain = _fallback_chain(model, config)
+    primary_kwargs = filtered_kwargs
+    for index, (name, candidate) in enumerate(chain):
+        is_last = index == len(chain) - 1
+        if index > 0:
+            candidate = _get_model_config(name)
+            filtered_kwargs = _fallback_params(candidate, primary_kwargs)
+            cache_key = None
+        platform = candidate["platform"]
+        adapter = _STREAM_ADAPTERS.get(platform)
+        if adapter is None:
+            raise ValueError(f"Unsupported platform {platform} for model {name}")
+        try:
+            config, endpoint, breaker, probe = _open_endpoint(name, candidate)
+        except CircuitOpenError as e:
+            if is_last:
+                raise
+            logger.warning(f"{e}，模型 {name} 改用备用模型 {chain[index + 1][0]}")
+            continue
+        build_request, parse_line, label = adapter
+        if _metadata is not None:
+            _metadata.update(model=name, platform=platform, endpoint=config['api_url'])
+            if index > 0:
+                _metadata['fallback_from'] = model
+        outcome = None
+        total = None
+        ttft = None
+        try:
+            await get_rate_limiters().acquire(name, config,
+                                              estimate_tokens(messages, filtered_kwargs.get("max_tokens", 150)))
+            api_url, headers, payload = build_request(config['api_url'], name, messages,
+                                                      config.get('api_key', None), True, **filtered_kwargs)
+
+            start = time.perf_counter()
+            chunks = 0
+            parts = []
+            async for delta in _stream_lines(api_url, payload, headers, parse_line, label):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    logger.debug(f"模型 {name} 首 token 延迟: {ttft:.3f}s")
+                    outcome = True
+                chunks += 1
+                if cache_key is not None:
+                    parts.append(delta)
+                yield delta
+            total = time.perf_counter() - start
+            if outcome is None:
+                outcome = True
+        except (asyncio.CancelledError, GeneratorExit):
+            # 首个增量前因节点超时被取消说明端点无响应，算一次失败
+            if outcome is None and call_deadline_expired():
+                outcome = False
+            raise
+        except Exception as e:
+            if not _is_endpoint_failure(e):
+                raise
+            outcome = False
+            if ttft is not None or is_last:
+                raise
+            logger.warning(f"模型 {name} 调用失败: {e}，改用备用模型 {chain[index + 1][0]}")
+            continue
+        finally:
+            _close_endpoint(endpoint, breaker, probe, outcome, ttft if outcome else None)
+        stream_stats.record(name, total if ttft is None else ttft, total, chunks)
+        if _metadata is not None:
+            _metadata['latency'] = total
+        await _cache_store(cache_key, "".join(parts).strip())
+        return
+
+
+async def llm_chat_stream(messages: list, model: str = "gemma3:4b",
+                          system_prompt: str = None, **kwargs) -> AsyncIterator[str]:
+    """流式多轮对话调用 - 参数与 llm_chat_call 相同，逐个产出文本增量"""
+    if system_prompt:
+        stream = llm_api_stream(prompt=system_prompt, model=model, messages=messages, **kwargs)
+    else:
+        stream = llm_api_stream(model=model, messages=messages, **kwargs)
+    async for delta in stream:
+        yield delta
+
+
+def get_stream_stats() -> Dict[str, Dict[str, float]]:
+    """返回各模型的流式调用统计（streams、ttft_last/avg/max、total_avg、chunks）"""
+    return stream_stats.stats()
+
+
+def get_coalescing_stats() -> Dict[str, int]:
+    """返回请求合并统计（in_flight 进行中、leaders 实际发出、coalesced 被合并的请求数）"""
+    return inflight_requests.stats()
+
+
+async def llm_simple_call(user_input: str, model: str = "gemma3:4b",
+                          on_token: Callable[[str], Awaitable[None]] = None,
+                          use_semantic_cache: bool = True, **kwargs) -> str:
     """
     简化的LLM调用
     
     Args:
         user_input: 用户输入
         model: 模型名称
+        on_token: 异步 token 回调（流式执行时由引擎注入）
+        use_semantic_cache: 引擎启用了语义缓存时，是否对本次调用使用语义缓存
         **kwargs: 其他参数
     """
     logger.debug(f"llm_simple_call 被调用，user_input: '{user_input}' (type: {type(user_input)}), model: {model}")
@@ -214,34 +764,62 @@ async def llm_simple_call(user_input: str, model: str = "gemma3:4b", **kwargs) -
     
     if not user_input:
         logger.warning("llm_simple_call 没有收到有效的 user_input")
-        return "Error: No valid user input provided to llm_simple_call"
+        raise ValueError("No valid user input provided to llm_simple_call")
     
     # 获取模型配置
     config = _get_model_config(model)
-    
+    semantic_cache = get_semantic_cache() if use_semantic_cache else None
+    if semantic_cache is None or _uses_mock_response(config):
+        return await _simple_call(user_input, model, config, on_token)
+
+    # 语义缓存：相似的问题直接复用历史回答
+    cached, vector = await semantic_cache.lookup(f"simple:{model}", user_input)
+    if cached is not None:
+        if on_token is not None:
+            await on_token(cached)
+        return cached
+    response = await _simple_call(user_input, model, config, on_token)
+    if _is_cacheable_reply(response):
+        semantic_cache.store(f"simple:{model}", user_input, vector, response)
+    return response
+
+
+def _uses_mock_response(config: dict) -> bool:
+    """云端平台未配置有效 API key 时 llm_simple_call 返回模拟响应"""
+    return (config["platform"] in ["openai", "anthropic", "google", "openai_compatible"]
+            and config.get('api_key') in [None, "your-api-key", "demo-key", ""])
+
+
+async def _simple_call(user_input: str, model: str, config: dict,
+                       on_token: Callable[[str], Awaitable[None]] = None) -> str:
+    """按平台分派 llm_simple_call 的实际调用"""
     # 对于本地模型（如Ollama），直接调用API
     if config["platform"] == "ollama":
         return await llm_api_call(
             user_input=user_input,
             model=model,
             max_tokens=500,
-            temperature=0.7
+            temperature=0.7,
+            on_token=on_token
         )
     
     # 对于需要API key的平台，检查配置中是否有有效的key
     if config["platform"] in ["openai", "anthropic", "google", "openai_compatible"]:
-        api_key = config.get('api_key')
         # 如果没有配置API key或配置的是占位符，返回模拟响应
-        if not api_key or api_key in ["your-api-key", "demo-key", ""]:
+        if _uses_mock_response(config):
             await asyncio.sleep(0.5)
-            return f"AI回复: 我理解了您的输入 '{user_input}'，这是一个模拟响应（需要在模型配置中设置真实API key）。"
+            response = f"AI回复: 我理解了您的输入 '{user_input}'，这是一个模拟响应（需要在模型配置中设置真实API key）。"
+            if on_token is not None:
+                await on_token(response)
+            return response
         
         # 有有效API key，调用真实API
         return await llm_api_call(
             user_input=user_input,
             model=model,
             max_tokens=500,
-            temperature=0.7
+            temperature=0.7,
+            on_token=on_token
         )
     
     # 其他情况，尝试调用API
@@ -254,19 +832,22 @@ async def llm_simple_call(user_input: str, model: str = "gemma3:4b", **kwargs) -
 
 
 async def llm_chat_call(messages: list, model: str = "gemma3:4b", 
-                       system_prompt: str = None, **kwargs) -> str:
-    """高级LLM对话调用 - 支持多轮对话和系统提示"""
+                       system_prompt: str = None, on_token: Callable[[str], Awaitable[None]] = None,
+                       **kwargs) -> str:
+    """高级LLM对话调用 - 支持多轮对话和系统提示，提供 on_token 时以流式方式调用"""
     # 如果提供了系统提示，将其作为prompt参数传递
     if system_prompt:
         return await llm_api_call(
             prompt=system_prompt,
             model=model,
             messages=messages,
+            on_token=on_token,
             **kwargs
         )
     else:
         return await llm_api_call(
             model=model,
             messages=messages,
+            on_token=on_token,
             **kwargs
         )
@@ -6,6 +6,9 @@ import math
 import hashlib
 from typing import Dict, List
 from loguru import logger
+from ..semantic_cache import get_semantic_cache
+from ..micro_batch import get_micro_batcher
+from ..llm_errors import LLMError
 
 
 # 向量存储和检索
@@ -13,8 +16,24 @@ _vector_store = {}  # 简单的内存向量存储
 
 
 async def embedding_text(text: str, model: str = "text-embedding-ada-002") -> List[float]:
-    """文本向量化 - 简化版本，实际应用中可以接入真实的embedding服务"""
-    # 这里使用简单的哈希函数模拟向量，实际应用中应该调用真实的embedding API
+    """
+    文本向量化
+
+    模型配置声明了 embedding: true 时调用真实的 embedding 服务；引擎启用微批处理时，
+    短时间内的多次调用合并为一次批量请求。其他模型使用哈希模拟向量。
+    """
+    from .llm_api import _get_model_config, llm_embed_call
+    config = _get_model_config(model)
+    if not config.get("embedding"):
+        return _hash_embedding(text)
+    batcher = get_micro_batcher()
+    if batcher is None:
+        return (await llm_embed_call([text], model))[0]
+    return await batcher.submit(("embedding", model), text, lambda texts: llm_embed_call(texts, model))
+
+
+def _hash_embedding(text: str) -> List[float]:
+    """简化的向量化，使用哈希函数模拟 512 维向量"""
     hash_obj = hashlib.md5(text.encode())
     hash_hex = hash_obj.hexdigest()
     
@@ -57,6 +76,10 @@ async def vector_store_add(doc_id: str, text: str, metadata: Dict = None) -> str
             "metadata": metadata or {},
             "timestamp": time.time()
         }
+        # 文档变化后历史问答可能已过时，清空 rag_qa 的语义缓存
+        semantic_cache = get_semantic_cache()
+        if semantic_cache is not None:
+            semantic_cache.invalidate('rag_qa:')
         logger.info(f"文档 {doc_id} 已添加到向量存储")
         return f"文档已添加: {doc_id}"
     except Exception as e:
@@ -112,8 +135,20 @@ async def rag_retrieve(query: str, top_k: int = 3, include_metadata: bool = True
         return f"检索失败: {str(e)}"
 
 
-async def rag_qa(question: str, model: str = "gemma3:4b", top_k: int = 3) -> str:
-    """RAG问答 - 基于检索结果回答问题"""
+async def rag_qa(question: str, model: str = "gemma3:4b", top_k: int = 3,
+                 use_semantic_cache: bool = True) -> str:
+    """RAG问答 - 基于检索结果回答问题，引擎启用语义缓存时相似问题直接复用历史回答"""
+    semantic_cache = get_semantic_cache() if use_semantic_cache else None
+    if semantic_cache is None:
+        return await _rag_answer(question, model, top_k)
+    from .llm_api import _is_cacheable_reply
+    return await semantic_cache.get_or_call(f"rag_qa:{model}:{top_k}", question,
+                                            lambda: _rag_answer(question, model, top_k),
+                                            cacheable=lambda answer: _is_cacheable_reply(answer)
+                                            and not answer.startswith("问答失败"))
+
+
+async def _rag_answer(question: str, model: str, top_k: int) -> str:
     from .llm_api import llm_api_call
     
     try:
@@ -135,6 +170,9 @@ async def rag_qa(question: str, model: str = "gemma3:4b", top_k: int = 3) -> str
         
         logger.info(f"RAG问答完成，问题: {question}")
         return answer
+    except LLMError:
+        # 上游调用失败交给执行器重试，不把错误信息当作回答传给下游
+        raise
     except Exception as e:
         logger.error(f"RAG问答失败: {e}")
         return f"问答失败: {str(e)}"
@@ -5,6 +5,7 @@ import asyncio
 import json as pyjson
 from typing import Any, Dict, List
 from loguru import logger
+from ..llm_errors import LLMError
 
 
 # 工具注册表
@@ -124,6 +125,8 @@ PARAMETERS: 参数JSON
         
         return llm_response
         
+    except LLMError:
+        raise
     except Exception as e:
         logger.error(f"LLM工具调用失败: {e}")
         return f"工具调用失败: {str(e)}"
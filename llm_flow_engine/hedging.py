@@ -0,0 +1,137 @@
+"""
+请求对冲 - 请求在观测到的 p95 延迟内未返回时发送一个副本，取先成功的结果并取消另一个
+"""
+import asyncio
+import contextvars
+import math
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+from loguru import logger
+
+# 对冲副本执行期间为 True，下游（如 llm_api_call 的请求合并）据此避免把副本并入原请求
+hedged_call: contextvars.ContextVar = contextvars.ContextVar('hedged_call', default=False)
+
+
+class HedgePolicy:
+    """一个节点或模型的对冲策略和统计
+
+    - 延迟阈值取最近 window 次完成调用的 quantile 分位数；样本不足 min_samples 时使用固定 delay，
+      两者都没有时不对冲
+    - 对冲预算：每个主请求积累 budget 个令牌（最多 max_tokens 个），每发一个副本消耗 1 个，
+      因此副本数量不超过主请求数的 budget 比例
+    """
+
+    def __init__(self, quantile: float = 0.95, budget: float = 0.05, delay: Optional[float] = None,
+                 min_samples: int = 20, window: int = 200, max_tokens: float = 10.0):
+        """
+        Args:
+            quantile: 触发对冲的延迟分位数
+            budget: 副本请求占主请求的最大比例
+            delay: 样本不足时使用的固定对冲延迟（秒）
+            min_samples: 使用分位数前需要的最少样本数
+            window: 保留的最近延迟样本数
+            max_tokens: 预算令牌上限（允许的突发副本数）
+        """
+        self.quantile = quantile
+        self.budget = budget
+        self.fixed_delay = delay
+        self.min_samples = min_samples
+        self.max_tokens = max_tokens
+        self._latencies: deque = deque(maxlen=window)
+        self._cached_delay: Optional[float] = None
+        self._tokens = 1.0
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.skipped = 0
+
+    def record(self, latency: float):
+        self._latencies.append(latency)
+        self._cached_delay = None
+
+    def delay(self) -> Optional[float]:
+        if len(self._latencies) < self.min_samples:
+            return self.fixed_delay
+        if self._cached_delay is None:
+            ordered = sorted(self._latencies)
+            self._cached_delay = ordered[min(len(ordered) - 1, math.ceil(self.quantile * len(ordered)) - 1)]
+        return self._cached_delay
+
+    def _try_spend(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        self.skipped += 1
+        return False
+
+    async def run(self, call: Callable[[Optional[float]], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """执行 call(timeout)，超过对冲延迟时再发送一个副本，返回先成功的结果"""
+        loop = asyncio.get_running_loop()
+        self.primaries += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget)
+        start = loop.time()
+        primary = loop.create_task(call(timeout))
+        tasks = {primary: start}
+        try:
+            delay = self.delay()
+            if delay is not None and (timeout is None or delay < timeout):
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self._try_spend():
+                    self.hedges += 1
+                    logger.debug(f"请求 {delay:.3f}s 内未返回，发送对冲副本")
+                    context = contextvars.copy_context()
+                    context.run(hedged_call.set, True)
+                    remaining = None if timeout is None else timeout - (loop.time() - start)
+                    # Python 3.8 的 create_task 没有 context 参数，在副本上下文中创建任务
+                    hedge = context.run(loop.create_task, call(remaining))
+                    tasks[hedge] = loop.time()
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        self.record(loop.time() - tasks[task])
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error or asyncio.CancelledError()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.delay()
+        return {'delay': round(delay, 4) if delay is not None else None, 'samples': len(self._latencies),
+                'primaries': self.primaries, 'hedges': self.hedges, 'hedge_wins': self.hedge_wins,
+                'skipped_by_budget': self.skipped}
+
+
+class HedgeRegistry:
+    """按键（model:<模型名> 或 node:<工作流>@<DSL 哈希>/<节点>）共享对冲策略，
+    同一模型或同一工作流定义的多次加载共用统计和预算"""
+
+    def __init__(self):
+        self._policies: Dict[str, HedgePolicy] = {}
+        self._options: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, key: str, options: Dict[str, Any] = None) -> HedgePolicy:
+        """获取键对应的策略；参数与已有策略不同时（如模型配置被修改）按新参数重建"""
+        options = dict(options or {})
+        policy = self._policies.get(key)
+        if policy is None or self._options[key] != options:
+            if policy is not None:
+                logger.debug(f"对冲策略 {key} 的参数已变化，重新开始统计")
+            policy = self._policies[key] = HedgePolicy(**options)
+            self._options[key] = options
+        return policy
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {key: policy.stats() for key, policy in self._policies.items()}
+
+
+default_hedging = HedgeRegistry()
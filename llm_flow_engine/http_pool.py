@@ -0,0 +1,78 @@
+"""
+HTTP 连接池 - 由引擎持有、被所有 LLM 平台适配器复用的 aiohttp 会话
+"""
+import asyncio
+from typing import Dict, Optional
+import aiohttp
+from loguru import logger
+from .engine_context import engine_component
+
+
+class HttpClientPool:
+    """按事件循环复用的 aiohttp 会话
+
+    同一事件循环上的所有请求共享一个 ClientSession（及其 TCPConnector），
+    保留 keep-alive 连接并缓存 DNS，避免每次调用都重新进行 TCP/TLS 握手。
+    aiohttp 会话绑定事件循环，因此按循环分别创建，首次请求时才创建。
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 30,
+                 ttl_dns_cache: Optional[int] = 300, total_timeout: Optional[float] = 300,
+                 connect_timeout: Optional[float] = None, sock_read_timeout: Optional[float] = None):
+        """
+        Args:
+            limit: 连接总数上限，0 表示不限制
+            limit_per_host: 每个主机的连接数上限，0 表示不限制
+            keepalive_timeout: 空闲连接保留时间（秒）
+            ttl_dns_cache: DNS 缓存时间（秒），None 表示永久缓存
+            total_timeout: 单个请求的总超时（秒），None 表示不限制
+            connect_timeout: 建立连接的超时（秒）
+            sock_read_timeout: 两次读取之间的超时（秒），适合流式响应
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, connect=connect_timeout,
+                                             sock_read=sock_read_timeout)
+        # 事件循环 -> 会话
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self.sessions_created = 0
+
+    def session(self) -> aiohttp.ClientSession:
+        """返回当前事件循环上的共享会话（必须在协程中调用）"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # 顺便丢弃已关闭事件循环上的会话
+            for old_loop in [l for l in self._sessions if l.is_closed()]:
+                del self._sessions[old_loop]
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout,
+                                             ttl_dns_cache=self.ttl_dns_cache, use_dns_cache=True)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[loop] = session
+            self.sessions_created += 1
+            logger.debug(f"创建 HTTP 连接池会话 (limit={self.limit}, limit_per_host={self.limit_per_host})")
+        return session
+
+    async def close(self):
+        """关闭当前事件循环上的会话，并丢弃其他已失效的会话"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+        for old_loop in [l for l in self._sessions if l.is_closed()]:
+            del self._sessions[old_loop]
+
+    def stats(self) -> Dict[str, int]:
+        return {'sessions': len(self._sessions), 'sessions_created': self.sessions_created}
+
+
+# 不在任何引擎内时使用的默认连接池
+_default_http_pool = HttpClientPool()
+
+
+def get_http_pool() -> HttpClientPool:
+    """获取当前引擎的连接池，不在任何引擎内时使用默认连接池"""
+    return engine_component('http_pool', _default_http_pool)
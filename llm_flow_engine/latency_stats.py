@@ -0,0 +1,43 @@
+"""
+节点延迟历史 - 按 (工作流, 节点名) 记录执行耗时的指数加权移动平均，用于关键路径优先调度
+"""
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class LatencyStats:
+    """节点执行耗时的 EWMA 记录表（有界，按最近使用淘汰）"""
+
+    def __init__(self, alpha: float = 0.3, max_entries: int = 10000):
+        """
+        Args:
+            alpha: EWMA 平滑系数，越大越偏重最近的耗时
+            max_entries: 最多记录的节点数
+        """
+        self.alpha = alpha
+        self.max_entries = max_entries
+        # (工作流名, 节点名) -> [ewma 秒数, 样本数]
+        self._entries: "OrderedDict[Tuple[str, str], list]" = OrderedDict()
+
+    def record(self, workflow: str, node: str, seconds: float):
+        """记录一次节点执行耗时"""
+        key = (workflow, node)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [seconds, 1]
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            entry[0] += self.alpha * (seconds - entry[0])
+            entry[1] += 1
+            self._entries.move_to_end(key)
+
+    def estimate(self, workflow: str, node: str) -> Optional[float]:
+        """返回节点耗时估计（秒），没有历史时返回 None"""
+        entry = self._entries.get((workflow, node))
+        return entry[0] if entry is not None else None
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """返回所有记录，键为 '工作流/节点'"""
+        return {f"{wf}/{node}": {'ewma': entry[0], 'samples': entry[1]}
+                for (wf, node), entry in self._entries.items()}
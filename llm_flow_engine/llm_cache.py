@@ -0,0 +1,170 @@
+"""
+LLM 响应缓存 - 按 (平台, 模型, 消息, 采样参数) 缓存完整回复，SQLite 单文件存储，zlib 压缩
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from loguru import logger
+from .utils import cache_dir
+from .engine_context import engine_component
+
+LLM_CACHE_FILENAME = 'llm_responses.db'
+
+
+class LLMResponseCache:
+    """磁盘上的 LLM 响应缓存
+
+    - 回复以 zlib 压缩后存入单个 SQLite 文件，跨进程、跨重启复用
+    - 总压缩大小超过 max_bytes 时按最近访问时间淘汰，直到降到上限的 90%
+    - 需要显式启用（enabled=True）；启用后默认只缓存确定性请求（temperature 为 0），
+      调用方可以用 use_cache 强制开启或关闭
+    - 数据库在第一次需要缓存时才打开，不使用缓存时不会创建文件
+    - 数据库读写和压缩在缓存专用的单个线程中执行，不阻塞事件循环
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024,
+                 compress_level: int = 6, enabled: bool = False):
+        """
+        Args:
+            path: SQLite 文件路径，默认为缓存目录（见 utils.cache_dir）下的 llm_responses.db
+            max_bytes: 压缩后回复的总大小上限（字节）
+            compress_level: zlib 压缩级别 (1-9)
+            enabled: 是否启用缓存
+        """
+        self.path = path or os.path.join(cache_dir(), LLM_CACHE_FILENAME)
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._total_bytes = 0
+        self._entries = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.raw_bytes_written = 0
+        self.stored_bytes_written = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_responses ("
+                "key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses(accessed)")
+            self._entries, self._total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses").fetchone()
+            self._conn = conn
+            logger.debug(f"已打开 LLM 响应缓存: {self.path}")
+        return self._conn
+
+    def should_cache(self, params: Dict[str, Any], use_cache: Optional[bool] = None) -> bool:
+        """判断请求是否可缓存：显式指定时以调用方为准，否则只缓存 temperature 为 0 的请求"""
+        if not self.enabled:
+            return False
+        if use_cache is not None:
+            return bool(use_cache)
+        return params.get('temperature') == 0
+
+    @staticmethod
+    def make_key(platform: str, model: str, messages: list, params: Dict[str, Any]) -> str:
+        raw = json.dumps([platform, model, messages, params], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """在缓存线程中执行数据库操作；只有一个线程，所有操作按提交顺序串行执行"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='llm-cache')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, text: str):
+        await self._run(self._set, key, text)
+
+    async def clear(self):
+        await self._run(self._clear)
+
+    def _get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        row = conn.execute("SELECT payload FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE llm_responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def _set(self, key: str, text: str):
+        conn = self._connect()
+        raw = text.encode('utf-8')
+        payload = zlib.compress(raw, self.compress_level)
+        old = conn.execute("SELECT size FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_responses (key, payload, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, payload, len(payload), now, now)
+        )
+        self._total_bytes += len(payload) - (old[0] if old else 0)
+        self._entries += 0 if old else 1
+        self.raw_bytes_written += len(raw)
+        self.stored_bytes_written += len(payload)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """按最近访问时间淘汰，直到总大小降到上限的 90%"""
+        conn = self._connect()
+        target = int(self.max_bytes * 0.9)
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM llm_responses ORDER BY accessed"):
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        conn.executemany("DELETE FROM llm_responses WHERE key = ?", evicted)
+        self._entries -= len(evicted)
+        self.evictions += len(evicted)
+        logger.debug(f"LLM 响应缓存淘汰 {len(evicted)} 条，当前大小 {self._total_bytes} 字节")
+
+    def _clear(self):
+        self._connect().execute("DELETE FROM llm_responses")
+        self._total_bytes = 0
+        self._entries = 0
+
+    def close(self):
+        """等待进行中的操作完成，关闭缓存线程和数据库连接"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        ratio = self.stored_bytes_written / self.raw_bytes_written if self.raw_bytes_written else 0.0
+        return {'enabled': self.enabled, 'entries': self._entries, 'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'compression_ratio': round(ratio, 3)}
+
+
+# 不在任何引擎内时使用的默认响应缓存（未启用，不打开数据库）
+_default_llm_cache = LLMResponseCache()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """获取当前引擎的响应缓存，不在任何引擎内时使用默认缓存"""
+    return engine_component('llm_cache', _default_llm_cache)
@@ -0,0 +1,65 @@
+"""
+LLM 调用异常 - 上游返回非 200 时抛出带状态码的异常，区分可重试与不可重试的错误
+"""
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# 可以重试的状态码：请求超时、冲突、限流，以及除 501（未实现）以外的 5xx
+_RETRYABLE_STATUS = frozenset({408, 409, 425, 429})
+
+
+class LLMError(Exception):
+    """LLM 调用失败的基类
+
+    Attributes:
+        retryable: 重试是否可能成功，Executor 只重试可重试的错误
+        retry_after: 上游要求的最短重试等待（秒），None 表示未指定
+    """
+
+    retryable = True
+    retry_after: Optional[float] = None
+
+
+class LLMAPIError(LLMError):
+    """上游平台返回了非 200 响应"""
+
+    def __init__(self, platform: str, status: int, body: str = "", retry_after: Optional[float] = None):
+        super().__init__(f"{platform} API Error: {status} - {body}")
+        self.platform = platform
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in _RETRYABLE_STATUS or (self.status >= 500 and self.status != 501)
+
+    @property
+    def endpoint_failure(self) -> bool:
+        """是否说明端点本身异常（429 或 5xx），用于负载均衡、熔断和自适应并发"""
+        return self.status == 429 or self.status >= 500
+
+
+class LLMConnectionError(LLMError):
+    """连接失败、连接中断或读取超时等传输层错误，可以重试"""
+
+    def __init__(self, platform: str, error: BaseException):
+        super().__init__(f"{platform} API Connection Error: {error or type(error).__name__}")
+        self.platform = platform
+        self.error = error
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
@@ -0,0 +1,19 @@
+"""
+LLM 调用结果 - 带元数据的回复文本
+"""
+from typing import Any, Dict
+
+
+class LLMResponse(str):
+    """LLM 回复文本，附带本次调用的元数据（endpoint、model、platform、latency 等）
+
+    是 str 的子类，可以像普通字符串一样使用和序列化。
+    """
+
+    def __new__(cls, text: str, metadata: Dict[str, Any] = None):
+        obj = super().__new__(cls, text)
+        obj.metadata = metadata or {}
+        return obj
+
+    def __reduce__(self):
+        return LLMResponse, (str(self), self.metadata)
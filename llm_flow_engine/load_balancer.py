@@ -0,0 +1,170 @@
+"""
+多端点负载均衡 - 同一模型名配置多个 api_url，按在途请求数或延迟 EWMA 选择端点，故障端点暂时摘除
+"""
+import itertools
+import time
+from typing import Any, Callable, Dict, List, Optional
+from loguru import logger
+from .engine_context import engine_component
+
+LOAD_BALANCE_STRATEGIES = ('least_outstanding', 'latency_ewma')
+
+
+class Endpoint:
+    """单个端点的负载和健康状态"""
+
+    def __init__(self, api_url: str, api_key: Optional[str] = None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def stats(self) -> Dict[str, Any]:
+        return {'outstanding': self.outstanding,
+                'latency_ewma': round(self.latency, 4) if self.latency is not None else None,
+                'requests': self.requests, 'failures': self.failures, 'ejections': self.ejections,
+                'ejected': self.ejected_until > time.monotonic()}
+
+
+class EndpointGroup:
+    """一个模型的端点集合"""
+
+    def __init__(self, model: str, endpoints: List[Endpoint], strategy: str):
+        self.model = model
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self._round_robin = itertools.count()
+
+    def choose(self, usable: Optional[Callable[[str], bool]] = None) -> Endpoint:
+        """选择端点；usable 按 api_url 进一步过滤（如跳过熔断中的端点），全部不可用时不过滤"""
+        now = time.monotonic()
+        pool = [ep for ep in self.endpoints if usable(ep.api_url)] if usable is not None else []
+        pool = pool or self.endpoints
+        candidates = [ep for ep in pool if ep.available(now)]
+        if not candidates:
+            # 全部被摘除时不拒绝请求，选择最早恢复的端点
+            candidates = [min(pool, key=lambda ep: ep.ejected_until)]
+            logger.warning(f"模型 {self.model} 的所有端点都已被摘除，临时使用 {candidates[0].api_url}")
+        offset = next(self._round_robin)
+        # 轮转起点，分数相同时请求均匀分布到各端点
+        candidates = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+        if self.strategy == 'latency_ewma':
+            return min(candidates, key=self._expected_latency)
+        return min(candidates, key=lambda ep: (ep.outstanding, ep.latency or 0.0))
+
+    @staticmethod
+    def _expected_latency(endpoint: Endpoint) -> float:
+        # 在途请求越多，预期等待越长；延迟未知的端点一次只放一个试探请求
+        if endpoint.latency is None:
+            return 0.0 if endpoint.outstanding == 0 else float('inf')
+        return endpoint.latency * (endpoint.outstanding + 1)
+
+
+class LoadBalancer:
+    """按模型管理端点组
+
+    模型配置中的 ``endpoints``（字符串或 {"api_url", "api_key"} 字典）或 ``api_urls`` 列表
+    定义多个端点，``load_balance`` 选择策略。连续失败 failure_threshold 次的端点被摘除
+    cooldown 秒，恢复后再失败一次会立即被再次摘除。
+    """
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 30.0, smoothing: float = 0.3):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后摘除端点
+            cooldown: 摘除时长（秒）
+            smoothing: 延迟 EWMA 的平滑系数
+        """
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self._groups: Dict[str, EndpointGroup] = {}
+        self._signatures: Dict[str, tuple] = {}
+
+    @staticmethod
+    def endpoint_specs(config: dict) -> List[Dict[str, Any]]:
+        """解析模型配置中的端点列表，没有配置多端点时返回空列表"""
+        specs = []
+        for item in config.get('endpoints') or config.get('api_urls') or []:
+            if isinstance(item, str):
+                specs.append({'api_url': item, 'api_key': config.get('api_key')})
+            else:
+                specs.append({'api_url': item['api_url'], 'api_key': item.get('api_key', config.get('api_key'))})
+        return specs
+
+    def group_for(self, model: str, config: dict) -> Optional[EndpointGroup]:
+        specs = self.endpoint_specs(config)
+        if not specs:
+            return None
+        strategy = config.get('load_balance', 'least_outstanding')
+        if strategy not in LOAD_BALANCE_STRATEGIES:
+            raise ValueError(f"模型 {model} 的 load_balance 无效: {strategy}，可选值: {', '.join(LOAD_BALANCE_STRATEGIES)}")
+        signature = (strategy,) + tuple((spec['api_url'], spec['api_key']) for spec in specs)
+        # 端点列表变化时重建
+        if self._signatures.get(model) != signature:
+            self._groups[model] = EndpointGroup(
+                model, [Endpoint(spec['api_url'], spec['api_key']) for spec in specs], strategy)
+            self._signatures[model] = signature
+        return self._groups[model]
+
+    def acquire(self, model: str, config: dict,
+                usable: Optional[Callable[[str], bool]] = None) -> Optional[Endpoint]:
+        """为一次请求选择端点并计入在途数；未配置多端点时返回 None"""
+        group = self.group_for(model, config)
+        if group is None:
+            return None
+        endpoint = group.choose(usable)
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        return endpoint
+
+    def release(self, endpoint: Endpoint, ok: Optional[bool], latency: Optional[float] = None):
+        """
+        请求结束：更新延迟和健康状态
+
+        ok 为 None 表示请求被取消（如对冲落败），不影响健康状态；此时 latency 是已等待的时间，
+        作为延迟的下界，只在高于当前估计时计入，避免慢端点因请求总被取消而显得很快。
+        """
+        endpoint.outstanding -= 1
+        if ok is None:
+            if latency is not None and (endpoint.latency is None or latency > endpoint.latency):
+                self._observe(endpoint, latency)
+            return
+        if ok:
+            endpoint.consecutive_failures = 0
+            if latency is not None:
+                self._observe(endpoint, latency)
+            return
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.ejected_until = time.monotonic() + self.cooldown
+            endpoint.ejections += 1
+            # 恢复后处于试探状态，再失败一次就会被再次摘除
+            endpoint.consecutive_failures = self.failure_threshold - 1
+            logger.warning(f"端点 {endpoint.api_url} 连续失败，摘除 {self.cooldown}s")
+
+    def _observe(self, endpoint: Endpoint, latency: float):
+        endpoint.latency = latency if endpoint.latency is None else \
+            endpoint.latency + self.smoothing * (latency - endpoint.latency)
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return {model: {ep.api_url: ep.stats() for ep in group.endpoints}
+                for model, group in self._groups.items()}
+
+
+# 不在任何引擎内时使用的默认负载均衡器
+_default_load_balancer = LoadBalancer()
+
+
+def get_load_balancer() -> LoadBalancer:
+    """获取当前引擎的负载均衡器，不在任何引擎内时使用默认负载均衡器"""
+    return engine_component('load_balancer', _default_load_balancer)
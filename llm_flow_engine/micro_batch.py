@@ -0,0 +1,97 @@
+"""
+微批处理 - 把短时间窗口内到达的单条请求合并成一次批量调用，再把结果分发回各调用方
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+from loguru import logger
+from .engine_context import engine_component
+
+
+class _Batch:
+    """一个正在收集的批次"""
+
+    def __init__(self, call: Callable[[List[Any]], Awaitable[List[Any]]], loop: asyncio.AbstractEventLoop):
+        self.call = call
+        self.loop = loop
+        self.items: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """按键收集请求，凑满 max_batch 条或等待 max_wait 秒后发送一次批量调用
+
+    - 同一个键（如 ("embedding", 模型名)）的请求进入同一批次，批量函数接收条目列表，
+      按相同顺序返回结果列表
+    - 批量调用失败时，同批的所有调用方收到同一个异常
+    - 调用方在批次发出前被取消时，其条目不再发送
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait: float = 0.005):
+        """
+        Args:
+            max_batch: 单个批次的最大条目数
+            max_wait: 第一条请求到达后最多等待多久（秒）发送批次
+        """
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait
+        self._pending: Dict[Hashable, _Batch] = {}
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, key: Hashable, item: Any, call: Callable[[List[Any]], Awaitable[List[Any]]]) -> Any:
+        """提交一条请求并等待它所在批次的结果"""
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(key)
+        if batch is None or batch.loop is not loop:
+            batch = self._pending[key] = _Batch(call, loop)
+            batch.timer = loop.call_later(self.max_wait, self._flush, key, batch)
+        future = loop.create_future()
+        batch.items.append(item)
+        batch.futures.append(future)
+        if len(batch.items) >= self.max_batch:
+            self._flush(key, batch)
+        return await future
+
+    def _flush(self, key: Hashable, batch: _Batch):
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        task = batch.loop.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: _Batch):
+        live = [(item, future) for item, future in zip(batch.items, batch.futures) if not future.done()]
+        if not live:
+            return
+        self.batches += 1
+        self.items += len(live)
+        self.largest = max(self.largest, len(live))
+        try:
+            results = await batch.call([item for item, _ in live])
+            if len(results) != len(live):
+                raise ValueError(f"批量调用返回 {len(results)} 条结果，预期 {len(live)} 条")
+        except Exception as e:
+            logger.debug(f"批量调用失败（{len(live)} 条）: {e}")
+            for _, future in live:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(live, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'batches': self.batches, 'items': self.items, 'largest_batch': self.largest,
+                'avg_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+                'pending': sum(len(batch.items) for batch in self._pending.values())}
+
+
+def get_micro_batcher() -> Optional[MicroBatcher]:
+    """获取当前引擎的微批处理器，未启用或不在任何引擎内时返回 None"""
+    return engine_component('micro_batcher')
@@ -293,11 +293,23 @@ class ModelConfigProvider:
         return models_by_platform
     
     def add_model(self, model_name: str, config: dict):
-        """添加新模型配置"""
-        required_fields = ["platform", "api_url", "message_format", "max_tokens", "supports"]
+        """添加新模型配置，多端点时用 endpoints / api_urls 列表代替 api_url，fallbacks 为按顺序尝试的备用模型名"""
+        endpoints = config.get("endpoints") or config.get("api_urls")
+        if endpoints and "api_url" not in config:
+            # 第一个端点作为主地址，供资源池、限流等按 api_url 区分的功能使用
+            first = endpoints[0]
+            config = dict(config, api_url=first if isinstance(first, str) else first["api_url"])
+        # embedding 模型只用于向量化，不需要对话相关字段
+        if config.get("embedding"):
+            required_fields = ["platform", "api_url"]
+        else:
+            required_fields = ["platform", "api_url", "message_format", "max_tokens", "supports"]
         for field in required_fields:
             if field not in config:
                 raise ValueError(f"模型配置缺少必需字段: {field}")
+        fallbacks = config.get("fallbacks")
+        if fallbacks is not None and (isinstance(fallbacks, str) or model_name in fallbacks):
+            raise ValueError(f"模型 {model_name} 的 fallbacks 必须是其他模型名的列表")
         
         self.providers[model_name] = config
     
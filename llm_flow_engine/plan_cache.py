@@ -0,0 +1,70 @@
+"""
+工作流执行计划缓存 - 按DSL文本哈希缓存已编译的工作流，避免重复解析和构建
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from loguru import logger
+
+
+class PlanCache:
+    """已编译工作流的LRU缓存
+
+    缓存键由DSL文本哈希、DSL类型和函数注册表版本组成，
+    注册表变化（注册新函数、切换模型配置提供者）后旧计划自动失效。
+    """
+
+    def __init__(self, max_size: int = 128):
+        """
+        Args:
+            max_size: 最多缓存的工作流数量，<= 0 表示禁用缓存
+        """
+        self.max_size = max_size
+        self._plans: "OrderedDict[Tuple[str, str, int], Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(dsl: str, dsl_type: str, registry_version: int) -> Tuple[str, str, int]:
+        """生成缓存键"""
+        digest = hashlib.sha256(dsl.encode('utf-8')).hexdigest()
+        return (digest, dsl_type, registry_version)
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[Any]:
+        """查找缓存的工作流，命中时将其移动到最近使用位置"""
+        plan = self._plans.get(key)
+        if plan is None:
+            self.misses += 1
+            return None
+        self._plans.move_to_end(key)
+        self.hits += 1
+        return plan
+
+    def put(self, key: Tuple[str, str, int], plan: Any):
+        """写入缓存，超出容量时淘汰最久未使用的工作流"""
+        if self.max_size <= 0:
+            return
+        self._plans[key] = plan
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+            self.evictions += 1
+            logger.debug("执行计划缓存已满，淘汰最久未使用的工作流")
+
+    def clear(self):
+        """清空缓存（不重置统计计数）"""
+        self._plans.clear()
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存命中统计"""
+        return {
+            'size': len(self._plans),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,149 @@
+"""
+速率限制 - 按模型和 API 端点的每分钟请求数 (rpm) 与每分钟 token 数 (tpm) 令牌桶
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from .engine_context import engine_component
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟额度，按恒定速率连续补充"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def deficit_time(self, amount: float) -> float:
+        """还需等待多少秒才能取出 amount 个令牌（超过容量的请求按容量计算，避免永远等不到）"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        # 超过容量的请求允许把余额扣成负数，之后的请求相应地多等
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """rpm / tpm 组合限流器
+
+    等待者通过 asyncio.Lock 按到达顺序排队（FIFO），队首请求等到两个桶都有足够令牌后才放行，
+    后到的请求不会插队，请求只会排队而不会失败。
+    """
+
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+        self.waiting = 0
+        self.admitted = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+
+    def _get_lock(self) -> asyncio.Lock:
+        # 锁按事件循环创建，引擎在不同事件循环中使用时各自排队
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    async def acquire(self, tokens: float = 0):
+        """等待一个请求名额和 tokens 个 token 额度"""
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._get_lock():
+                while True:
+                    wait = 0.0
+                    if self._requests is not None:
+                        wait = self._requests.deficit_time(1)
+                    if self._tokens is not None and tokens:
+                        wait = max(wait, self._tokens.deficit_time(tokens))
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                if self._requests is not None:
+                    self._requests.take(1)
+                if self._tokens is not None and tokens:
+                    self._tokens.take(tokens)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.admitted += 1
+        if waited > 0.001:
+            self.delayed += 1
+            self.total_wait += waited
+            logger.debug(f"限流器 {self.name} 排队 {waited:.3f}s 后放行")
+
+    def stats(self) -> Dict[str, Any]:
+        return {'rpm': self.rpm, 'tpm': self.tpm, 'waiting': self.waiting, 'admitted': self.admitted,
+                'delayed': self.delayed, 'total_wait': round(self.total_wait, 3)}
+
+
+class RateLimiterRegistry:
+    """引擎级限流器注册表
+
+    - 模型配置中的 rpm / tpm 对应 "model:<模型名>" 限流器
+    - 引擎 rate_limits 参数可以为模型或端点单独配置，例如
+      {"api_url:http://localhost:11434/api/chat": {"rpm": 120}, "model:gpt-4o": {"tpm": 30000}}
+      引擎参数优先于模型配置
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]] = None):
+        self.limits = dict(limits or {})
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def _limiter(self, name: str, rpm: Optional[float], tpm: Optional[float]) -> Optional[RateLimiter]:
+        if not rpm and not tpm:
+            return None
+        limiter = self._limiters.get(name)
+        # 配置变化（如重新 add_model）时重建
+        if limiter is None or limiter.rpm != rpm or limiter.tpm != tpm:
+            limiter = self._limiters[name] = RateLimiter(name, rpm, tpm)
+        return limiter
+
+    def limiters_for(self, model: str, config: dict) -> List[RateLimiter]:
+        limiters = []
+        for name, defaults in ((f"model:{model}", config), (f"api_url:{config.get('api_url')}", {})):
+            conf = self.limits.get(name, defaults)
+            limiter = self._limiter(name, conf.get('rpm'), conf.get('tpm'))
+            if limiter is not None:
+                limiters.append(limiter)
+        return limiters
+
+    async def acquire(self, model: str, config: dict, tokens: float = 0):
+        """依次获取模型和端点限流器的额度"""
+        for limiter in self.limiters_for(model, config):
+            await limiter.acquire(tokens)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+def estimate_tokens(messages: list, max_tokens: int) -> int:
+    """粗略估计一次请求消耗的 token：提示词按 4 个字符 1 个 token，加上输出上限"""
+    chars = sum(len(str(message.get('content', ''))) for message in messages if isinstance(message, dict))
+    return chars // 4 + int(max_tokens or 0)
+
+
+# 不在任何引擎内时使用的默认限流器注册表
+_default_rate_limiters = RateLimiterRegistry()
+
+
+def get_rate_limiters() -> RateLimiterRegistry:
+    """获取当前引擎的限流器注册表，不在任何引擎内时使用默认注册表"""
+    return engine_component('rate_limiters', _default_rate_limiters)
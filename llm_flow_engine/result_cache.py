@@ -0,0 +1,249 @@
+"""
+节点结果缓存 - 按函数、解析后的参数和模型配置的内容哈希缓存节点输出
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import marshal
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from loguru import logger
+from .utils import cache_dir
+
+# 缓存未命中时 get 返回的哨兵值（输出本身可能是 None）
+MISS = object()
+
+
+def function_id(func: Callable, name: str = '', registry_version: int = 0) -> str:
+    """
+    函数标识，作为结果缓存键的一部分
+
+    同一作用域内的 lambda、闭包的 模块.限定名 相同，因此还要加上注册名、注册表版本
+    （重新注册同名函数后版本变化）和代码摘要（磁盘缓存跨进程复用时区分不同的实现）。
+    """
+    code = getattr(func, '__code__', None)
+    digest = hashlib.sha256(marshal.dumps(code)).hexdigest()[:12] if code is not None else ''
+    qualname = getattr(func, '__qualname__', type(func).__qualname__)
+    return f"{name}@{registry_version}:{getattr(func, '__module__', '')}.{qualname}:{digest}"
+
+
+def _detached(value: Any) -> Any:
+    # 容器类型保存和返回副本，调用方之后修改对象不会影响缓存
+    return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+
+def _json_default(value):
+    # 参数中出现无法稳定序列化的对象（如 TokenStream、回调函数）时放弃缓存
+    raise TypeError(f"不可缓存的参数类型: {type(value).__name__}")
+
+
+class MemoryResultCache:
+    """进程内 LRU 缓存"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # key -> (过期时间或 None, 输出)
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.time()):
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return MISS
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return _detached(entry[1])
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.time() + ttl if ttl else None, _detached(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self):
+        self._entries.clear()
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._entries), 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class SQLiteResultCache:
+    """SQLite 磁盘缓存，输出以 JSON 保存，跨进程、跨重启复用
+
+    数据库在第一次读写时打开；读写和 JSON 编解码在缓存专用的单个线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._size = 0
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS node_results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_node_results_accessed ON node_results(accessed)")
+            self._size = conn.execute("SELECT COUNT(*) FROM node_results").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """在缓存线程中执行数据库操作；只有一个线程，所有操作按提交顺序串行执行"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-cache')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, key: str) -> Any:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        await self._run(self._set, key, value, ttl)
+
+    async def clear(self):
+        await self._run(self._clear)
+
+    def _get(self, key: str) -> Any:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires FROM node_results WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < now):
+            if row is not None:
+                conn.execute("DELETE FROM node_results WHERE key = ?", (key,))
+                self._size -= 1
+            self.misses += 1
+            return MISS
+        conn.execute("UPDATE node_results SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl: Optional[float]):
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            logger.debug(f"节点输出无法序列化为 JSON，跳过磁盘缓存: {type(value).__name__}")
+            return
+        conn = self._connect()
+        now = time.time()
+        exists = conn.execute("SELECT 1 FROM node_results WHERE key = ?", (key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO node_results (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, payload, now + ttl if ttl else None, now)
+        )
+        if exists is None:
+            self._size += 1
+        self._writes += 1
+        # 每写入一定次数检查一次容量，淘汰最久未访问的条目
+        if self._writes % 100 == 0:
+            self._evict()
+
+    def _evict(self):
+        overflow = self._size - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM node_results WHERE key IN "
+                "(SELECT key FROM node_results ORDER BY accessed LIMIT ?)", (overflow,)
+            )
+            self._size -= overflow
+            self.evictions += overflow
+
+    def _clear(self):
+        self._connect().execute("DELETE FROM node_results")
+        self._size = 0
+
+    def close(self):
+        """等待进行中的操作完成，关闭缓存线程和数据库连接"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': self._size, 'max_entries': self.max_entries,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class ResultCacheRegistry:
+    """按后端类型和路径共享缓存实例，同一引擎上的所有工作流共用"""
+
+    def __init__(self, memory_max_entries: int = 1024):
+        self.memory_max_entries = memory_max_entries
+        self._backends: Dict[str, Any] = {}
+
+    def get(self, backend: str = 'memory', path: Optional[str] = None):
+        if backend == 'memory':
+            name = 'memory'
+            if name not in self._backends:
+                self._backends[name] = MemoryResultCache(self.memory_max_entries)
+        elif backend == 'sqlite':
+            path = os.path.abspath(path or os.path.join(cache_dir(), 'node_results.db'))
+            name = f"sqlite:{path}"
+            if name not in self._backends:
+                self._backends[name] = SQLiteResultCache(path)
+        else:
+            raise ValueError(f"未知的缓存后端: {backend}，可选值: memory, sqlite")
+        return self._backends[name]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: backend.stats() for name, backend in self._backends.items()}
+
+    def close(self):
+        """关闭磁盘后端的数据库连接，之后再次使用时重新打开"""
+        for backend in self._backends.values():
+            backend.close()
+
+
+default_result_caches = ResultCacheRegistry()
+
+
+class NodeCache:
+    """单个节点的缓存配置：后端、过期时间，以及计划构建时固定的模型配置指纹"""
+
+    def __init__(self, backend, ttl: Optional[float] = None, salt: str = ''):
+        self.backend = backend
+        self.ttl = ttl
+        self.salt = salt
+
+    def make_key(self, func_id: str, args: tuple, kwargs: dict) -> Optional[str]:
+        """计算缓存键，参数无法稳定序列化时返回 None（本次不缓存）"""
+        try:
+            raw = json.dumps([func_id, self.salt, list(args), kwargs], sort_keys=True,
+                             ensure_ascii=False, default=_json_default)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    async def get(self, key: str) -> Any:
+        return await self.backend.get(key)
+
+    async def set(self, key: str, value: Any):
+        await self.backend.set(key, value, self.ttl)
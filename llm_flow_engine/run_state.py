@@ -0,0 +1,86 @@
+"""
+工作流单次运行状态 - 与不可变的执行计划（WorkFlow）分离
+"""
+import asyncio
+import time
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+from .concurrency import ResourcePools
+from .executor_result import ExecutorResult
+from .latency_stats import LatencyStats
+
+
+class RunState:
+    """一次工作流运行的可变状态
+
+    WorkFlow 只保存执行器、依赖图和模板等不可变的计划数据，
+    每次 run() 都创建一个新的 RunState，因此同一个工作流可以在同一事件循环上
+    被大量并发运行而互不干扰。
+    """
+
+    def __init__(self, args: Tuple = (), inputs: Dict[str, Any] = None, global_context: Dict[str, Any] = None,
+                 run_pools: Optional[ResourcePools] = None, engine_pools: Optional[ResourcePools] = None,
+                 latency_stats: Optional[LatencyStats] = None, deadline: Optional[float] = None):
+        """
+        Args:
+            args: 运行时位置参数
+            inputs: 运行时关键字输入
+            global_context: 工作流静态输入上下文（DSL input 节点），会被复制一份，
+                ${workflow_input.key} 占位符在运行时按合并了运行时输入的副本解析
+            run_pools: 本次运行专用的资源池（DSL 中的 concurrency 配置）
+            engine_pools: 引擎级资源池，被该引擎上的所有运行共享
+            latency_stats: 节点耗时历史，用于关键路径优先调度，并记录本次运行的耗时
+            deadline: 运行截止时间（事件循环时钟 loop.time()），None 表示不限制
+        """
+        self.args = args
+        self.run_pools = run_pools
+        self.engine_pools = engine_pools
+        self.latency_stats = latency_stats
+        self.deadline = deadline
+        # 运行是否因超过截止时间而中止
+        self.timed_out = False
+        # 流式执行时的事件队列（见 FlowEngine.execute_dsl_stream），None 表示不产生事件
+        self.events: Optional[asyncio.Queue] = None
+        self.inputs = dict(inputs or {})
+        # 运行时输入覆盖 DSL 中的静态输入（字典按键合并），只修改本次运行的副本
+        self.global_context = dict(global_context or {})
+        for key, value in self.inputs.items():
+            if key not in self.global_context:
+                continue
+            default = self.global_context[key]
+            if isinstance(default, dict) and isinstance(value, dict):
+                value = {**default, **value}
+            self.global_context[key] = value
+        # 节点名 -> ExecutorResult
+        self.results: Dict[str, ExecutorResult] = {}
+        # 占位符解析上下文：工作流输入（如 workflow_input），'节点名.output' -> 输出, 节点名 -> ExecutorResult
+        self.context: Dict[str, Any] = dict(self.global_context)
+        # 提供给执行器的只读视图，随 context 增量更新，无需为每个节点复制
+        self.context_view: Mapping[str, Any] = MappingProxyType(self.context)
+
+    def set_timeout(self, timeout: Optional[float]):
+        """以当前时间为起点设置运行时间预算（秒）"""
+        if timeout is not None:
+            self.deadline = asyncio.get_running_loop().time() + timeout
+
+    def remaining(self) -> Optional[float]:
+        """距截止时间剩余的秒数，未设置截止时间时返回 None"""
+        if self.deadline is None:
+            return None
+        return self.deadline - asyncio.get_running_loop().time()
+
+    def emit(self, event_type: str, node: Optional[str] = None, **data):
+        """产生一个运行事件（仅在流式执行时），事件为 {'type', 'node', 'time', ...} 字典"""
+        if self.events is not None:
+            self.events.put_nowait({'type': event_type, 'node': node, 'time': time.time(), **data})
+
+    def record(self, name: str, result: ExecutorResult):
+        """记录节点结果，并把有效输出写入解析上下文"""
+        self.results[name] = result
+        if getattr(result, 'output', None) is not None:
+            self.context[f"{name}.output"] = result.output
+            self.context[name] = result
+        if self.events is not None:
+            self.emit('node_finished', name, status=getattr(result, 'status', 'failed'),
+                      output=getattr(result, 'output', None), error=getattr(result, 'error', None),
+                      exec_time=getattr(result, 'exec_time', 0.0))
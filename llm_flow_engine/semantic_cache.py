@@ -0,0 +1,175 @@
+"""
+语义缓存 - 对提示词做向量化，相似度超过阈值时直接复用历史回答，跳过 LLM 调用
+"""
+import math
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from .engine_context import engine_component
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else list(vector)
+
+
+class _Namespace:
+    """单个命名空间（模型）的向量索引，固定容量，满了按最近命中时间淘汰
+
+    安装了 numpy 时向量存放在预分配的矩阵中，一次矩阵乘法算出全部相似度；
+    否则退化为纯 Python 的逐条点积。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._reset(None)
+
+    def _reset(self, dim: Optional[int]):
+        self.prompts: List[str] = []
+        self.answers: List[str] = []
+        self.last_used: List[int] = []
+        self.dim = dim
+        self._vectors: List[List[float]] = []
+        self._matrix = np.zeros((self.capacity, dim), dtype=np.float32) if np is not None and dim else None
+
+    def __len__(self):
+        return len(self.answers)
+
+    def search(self, vector: List[float]) -> Tuple[Optional[int], float]:
+        """返回最相似条目的下标和相似度（向量需已归一化）"""
+        if not self.answers or len(vector) != self.dim:
+            return None, 0.0
+        if self._matrix is not None:
+            scores = self._matrix[:len(self.answers)] @ np.asarray(vector, dtype=np.float32)
+            slot = int(scores.argmax())
+            return slot, float(scores[slot])
+        best_slot, best_score = None, -1.0
+        for slot, stored in enumerate(self._vectors):
+            score = sum(a * b for a, b in zip(stored, vector))
+            if score > best_score:
+                best_slot, best_score = slot, score
+        return best_slot, best_score
+
+    def add(self, vector: List[float], prompt: str, answer: str, clock: int) -> bool:
+        """写入一条记录，返回是否淘汰了旧条目"""
+        if self.dim != len(vector):
+            # 向量维度变化（换了 embedding 模型）时旧索引不可比较，直接重建
+            if self.dim is not None:
+                logger.warning(f"语义缓存向量维度由 {self.dim} 变为 {len(vector)}，清空该命名空间")
+            self._reset(len(vector))
+        evicted = len(self.answers) >= self.capacity
+        if evicted:
+            slot = min(range(len(self.last_used)), key=self.last_used.__getitem__)
+            self.prompts[slot], self.answers[slot], self.last_used[slot] = prompt, answer, clock
+        else:
+            slot = len(self.answers)
+            self.prompts.append(prompt)
+            self.answers.append(answer)
+            self.last_used.append(clock)
+            self._vectors.append(None)
+        if self._matrix is not None:
+            self._matrix[slot] = vector
+        else:
+            self._vectors[slot] = vector
+        return evicted
+
+
+class SemanticCache:
+    """语义缓存
+
+    - 提示词用 embed 函数或 embedding_model 指定的 embedding 模型向量化，两者都未提供时拒绝启用
+      （embedding_text 对普通模型使用的哈希占位向量与语义无关，不相关的提示词也会“命中”）
+    - 按命名空间（如 "simple:gemma3:4b"、"rag_qa:gemma3:4b"）隔离，不同模型的回答互不复用
+    - 每个命名空间最多保存 max_entries 条，满了淘汰最久未命中的条目
+    - 余弦相似度不低于 threshold 时视为命中
+    """
+
+    def __init__(self, threshold: float = 0.92, max_entries: int = 1000,
+                 embed: Callable[[str], Awaitable[List[float]]] = None, embedding_model: Optional[str] = None,
+                 enabled: bool = True, model_provider=None):
+        """
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            max_entries: 每个命名空间的最大条目数
+            embed: 异步向量化函数
+            embedding_model: 未提供 embed 时使用的模型名，模型配置必须声明 embedding: true，
+                通过 rag.embedding_text 调用（引擎启用微批处理时合并请求）
+            enabled: 是否启用
+            model_provider: 用于检查 embedding_model 的模型配置提供者，默认使用全局配置
+        """
+        if embed is None and enabled:
+            if not embedding_model:
+                raise ValueError("语义缓存需要提供 embed 函数或 embedding_model（声明了 embedding: true 的模型）")
+            if model_provider is None:
+                from .model_config import default_model_provider as model_provider
+            if not model_provider.get_model_config(embedding_model).get('embedding'):
+                raise ValueError(f"语义缓存的 embedding_model {embedding_model} 未声明 embedding: true")
+            from .functions.rag import embedding_text
+
+            async def embed(text: str) -> List[float]:
+                return await embedding_text(text, model=embedding_model)
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embed = embed
+        self.enabled = enabled
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def lookup(self, namespace: str, prompt: str) -> Tuple[Optional[str], List[float]]:
+        """查找相似提示词的历史回答，返回 (回答或 None, 归一化后的提示词向量)"""
+        vector = _normalize(await self.embed(prompt))
+        index = self._namespaces.get(namespace)
+        slot, score = index.search(vector) if index is not None else (None, 0.0)
+        if slot is not None and score >= self.threshold:
+            self._clock += 1
+            index.last_used[slot] = self._clock
+            self.hits += 1
+            logger.debug(f"语义缓存命中 [{namespace}] 相似度 {score:.3f}: {index.prompts[slot][:50]}")
+            return index.answers[slot], vector
+        self.misses += 1
+        return None, vector
+
+    def store(self, namespace: str, prompt: str, vector: List[float], answer: str):
+        """保存一条回答，vector 为 lookup 返回的向量"""
+        index = self._namespaces.get(namespace)
+        if index is None:
+            index = self._namespaces[namespace] = _Namespace(self.max_entries)
+        self._clock += 1
+        if index.add(vector, prompt, answer, self._clock):
+            self.evictions += 1
+
+    async def get_or_call(self, namespace: str, prompt: str, call: Callable[[], Awaitable[Any]],
+                          cacheable: Callable[[Any], bool] = None) -> Any:
+        """命中时返回历史回答，否则执行 call 并在 cacheable 判定通过时保存结果"""
+        cached, vector = await self.lookup(namespace, prompt)
+        if cached is not None:
+            return cached
+        answer = await call()
+        if isinstance(answer, str) and answer and (cacheable is None or cacheable(answer)):
+            self.store(namespace, prompt, vector, answer)
+        return answer
+
+    def invalidate(self, prefix: str = ''):
+        """清空名称以 prefix 开头的命名空间（默认全部）"""
+        for name in [name for name in self._namespaces if name.startswith(prefix)]:
+            del self._namespaces[name]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'enabled': self.enabled, 'embedding_model': self.embedding_model,
+                'threshold': self.threshold, 'max_entries': self.max_entries,
+                'backend': 'numpy' if np is not None else 'python',
+                'namespaces': {name: len(index) for name, index in self._namespaces.items()},
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """获取当前引擎的语义缓存，未启用或不在任何引擎内时返回 None"""
+    cache = engine_component('semantic_cache')
+    return cache if cache is not None and cache.enabled else None
@@ -0,0 +1,49 @@
+"""
+请求合并（singleflight）- 相同的并发请求只执行一次上游调用，所有等待者共享结果
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+from loguru import logger
+
+
+class SingleFlight:
+    """按键合并进行中的异步调用
+
+    第一个请求（leader）启动上游调用，调用完成前到达的相同请求直接等待同一个任务。
+    上游调用在独立任务中执行：单个等待者被取消不影响其他等待者，
+    只有所有等待者都离开时才取消上游调用。结果不做持久化，调用结束即移除。
+    """
+
+    def __init__(self):
+        # key -> [上游任务, 等待者数量]
+        self._inflight: Dict[str, List[Any]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        flight = self._inflight.get(key)
+        if flight is None or flight[0].get_loop() is not loop:
+            flight = [loop.create_task(call()), 0]
+            self._inflight[key] = flight
+            flight[0].add_done_callback(lambda _task: self._finish(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"合并相同的进行中请求，当前等待者 {flight[1] + 1}")
+        flight[1] += 1
+        try:
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                # 立即移除，之后到达的相同请求重新发起，而不是加入正在取消的调用
+                self._finish(key, flight)
+                flight[0].cancel()
+
+    def _finish(self, key: str, flight: List[Any]):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {'in_flight': len(self._inflight), 'leaders': self.leaders, 'coalesced': self.coalesced}
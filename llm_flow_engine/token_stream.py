@@ -0,0 +1,84 @@
+"""
+节点间的流式边 - 上游节点边生成边写入，下游节点以异步迭代器的方式边读边处理
+"""
+import asyncio
+from collections import deque
+from typing import Any, Optional
+
+
+class TokenStreamError(Exception):
+    """上游节点失败或被取消，流式输入不完整"""
+
+
+class TokenStream:
+    """有界的文本增量流
+
+    上游节点通过 on_token 回调写入（缓冲区满时等待，形成背压），
+    下游节点用 ``async for delta in stream`` 读取，或用 ``await stream.text()`` 读取完整文本。
+    上游失败时，下游在读完已有内容后收到 TokenStreamError。
+    """
+
+    def __init__(self, producer: str, maxsize: int = 64):
+        """
+        Args:
+            producer: 上游节点名
+            maxsize: 缓冲的最大增量数
+        """
+        self.producer = producer
+        self.maxsize = max(1, int(maxsize))
+        self.chunks = 0
+        self._buffer: deque = deque()
+        self._closed = False
+        self._error: Optional[str] = None
+        # 下游已结束，之后写入的内容直接丢弃，上游不会因背压而阻塞
+        self._detached = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    async def put(self, delta: str):
+        """写入一个增量，缓冲区满时等待下游读取"""
+        while len(self._buffer) >= self.maxsize and not self._detached:
+            self._writable.clear()
+            await self._writable.wait()
+        if self._detached or self._closed:
+            return
+        self._buffer.append(delta)
+        self.chunks += 1
+        self._readable.set()
+
+    def finish(self, output: Any = None, error: Optional[str] = None):
+        """上游结束：没有写入过增量时把完整输出作为唯一的增量，然后关闭流"""
+        if self._closed:
+            return
+        if error is None and output is not None and not self.chunks and not self._detached:
+            self._buffer.append(output if isinstance(output, str) else str(output))
+            self.chunks += 1
+        self._closed = True
+        self._error = error
+        self._readable.set()
+
+    def detach(self):
+        """下游结束，丢弃未读内容并唤醒等待的上游"""
+        self._detached = True
+        self._buffer.clear()
+        self._writable.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        while not self._buffer:
+            if self._closed:
+                if self._error is not None:
+                    raise TokenStreamError(f"上游节点 {self.producer} 未能完成: {self._error}")
+                raise StopAsyncIteration
+            self._readable.clear()
+            await self._readable.wait()
+        delta = self._buffer.popleft()
+        self._writable.set()
+        return delta
+
+    async def text(self) -> str:
+        """读取剩余的全部内容"""
+        return ''.join([delta async for delta in self])
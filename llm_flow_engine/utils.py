@@ -1,52 +1,212 @@
+import os
 import re
-from loguru import logger
+from functools import lru_cache
+from typing import Any, Optional, Tuple
 
-def resolve_placeholders(value, context):
-    """解析占位符 ${...}，并用 context 中的值替换"""
-    logger.debug(f"resolve_placeholders: value={value}, context keys={list(context.keys()) if isinstance(context, dict) else 'not dict'}")
-    
-    if isinstance(value, str):
-        # 匹配 ${node.output} 或 ${workflow_input.key} 格式的占位符
-        matches = re.findall(r'\$\{(\w+)\.(\w+)\}', value)
-        for node_name, attr in matches:
-            placeholder = f'${{{node_name}.{attr}}}'
-            resolved_value = None
-            
-            # 首先尝试直接匹配 "node.attr" 格式的key
-            full_key = f"{node_name}.{attr}"
-            if full_key in context:
-                resolved_value = context[full_key]
-                logger.debug(f"直接匹配到占位符 {placeholder} -> {resolved_value}")
-            # 然后尝试从 context 中查找对应的值
-            elif node_name in context:
-                node_output = context[node_name]
-                if isinstance(node_output, dict) and attr in node_output:
-                    resolved_value = node_output[attr]
-                elif hasattr(node_output, attr):
-                    resolved_value = getattr(node_output, attr)
-                else:
-                    # 如果attr是'output'且找不到，直接使用节点输出作为默认值
-                    if attr == 'output':
-                        resolved_value = node_output
-                        logger.debug(f"使用节点输出作为默认值 {placeholder} -> {resolved_value}")
-                
-                if resolved_value is not None:
-                    logger.debug(f"从节点属性解析占位符 {placeholder} -> {resolved_value}")
+# 匹配 ${node.output}、${workflow_input.key} 以及嵌套路径 ${node.output.a.b[0]} 格式的占位符
+PLACEHOLDER_PATTERN = re.compile(
+    r'\$\{(\w+)\.(\w+)((?:\.\w+|\[-?\d+\]|\[\'[^\'\]]*\'\]|\["[^"\]]*"\])*)\}'
+)
+# 拆分嵌套路径中的每一级访问
+_PATH_STEP_PATTERN = re.compile(r'\.(\w+)|\[(-?\d+)\]|\[\'([^\'\]]*)\'\]|\["([^"\]]*)"\]')
+
+# 路径访问失败时的哨兵值
+_MISSING = object()
+
+
+def cache_dir() -> str:
+    """
+    磁盘缓存的默认目录：环境变量 LLM_FLOW_CACHE_DIR，否则为用户缓存目录下的 llm_flow_engine
+    （$XDG_CACHE_HOME 或 ~/.cache，Windows 为 %LOCALAPPDATA%）
+    """
+    configured = os.environ.get('LLM_FLOW_CACHE_DIR')
+    if configured:
+        return configured
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'llm_flow_engine')
+
+
+def _compile_path(path: str) -> Tuple:
+    """把 '.a.b[0]["k"]' 编译为访问步骤元组，整数表示下标，字符串表示键或属性"""
+    steps = []
+    for name, index, single_quoted, double_quoted in _PATH_STEP_PATTERN.findall(path):
+        if index:
+            steps.append(int(index))
+        else:
+            steps.append(name or single_quoted or double_quoted)
+    return tuple(steps)
+
+
+def _walk_path(value: Any, steps: Tuple) -> Any:
+    """沿访问步骤逐级取值（不复制中间结果），任一级不存在或是以 _ 开头的属性时返回 _MISSING"""
+    for step in steps:
+        if value is None:
+            return _MISSING
+        if step.__class__ is int:
+            if isinstance(value, (list, tuple)):
+                if -len(value) <= step < len(value):
+                    value = value[step]
+                    continue
+                return _MISSING
+            if isinstance(value, dict):
+                if step in value:
+                    value = value[step]
+                    continue
+                if str(step) in value:
+                    value = value[str(step)]
+                    continue
+            return _MISSING
+        if isinstance(value, dict):
+            if step in value:
+                value = value[step]
+                continue
+            return _MISSING
+        if step.startswith('_'):
+            # 不允许通过占位符访问私有和特殊属性（如 __globals__），避免 DSL 读取模块全局或内置函数
+            return _MISSING
+        value = getattr(value, step, _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+class PlaceholderRef:
+    """单个占位符引用 ${node.attr...}
+
+    前两级（节点名和属性）的解析规则与历史行为保持一致，
+    之后的嵌套路径（字典键、列表下标、对象属性）由预编译的访问步骤逐级解析。
+    """
+
+    def __init__(self, text: str, node_name: str, attr: str, path: Tuple = ()):
+        self.text = text
+        self.node_name = node_name
+        self.attr = attr
+        self.path = path
+        self.full_key = f"{node_name}.{attr}"
+
+    def _resolve_base(self, context) -> Any:
+        # 首先尝试直接匹配 "node.attr" 格式的key
+        if self.full_key in context:
+            return context[self.full_key]
+        # 然后尝试从 context 中查找对应的值
+        if self.node_name in context:
+            node_output = context[self.node_name]
+            attr = self.attr
+            if isinstance(node_output, dict) and attr in node_output:
+                return node_output[attr]
+            if not attr.startswith('_') and hasattr(node_output, attr):
+                return getattr(node_output, attr)
+            # 如果attr是'output'且找不到，直接使用节点输出作为默认值
+            if attr == 'output':
+                return node_output
+        return None
+
+    def resolve(self, context) -> Any:
+        """从 context 中取值，找不到时返回 None"""
+        value = self._resolve_base(context)
+        if not self.path or value is None:
+            return value
+        value = _walk_path(value, self.path)
+        return None if value is _MISSING else value
+
+
+class Template:
+    """预编译的字符串模板：字面量片段与占位符引用交替组成"""
+
+    def __init__(self, source: str, segments: Tuple, whole: Optional[PlaceholderRef]):
+        self.source = source
+        self.segments = segments
+        # 整个字符串只包含一个占位符时，渲染直接返回被引用的对象
+        self.whole = whole
+        self.refs = tuple(seg for seg in segments if isinstance(seg, PlaceholderRef))
+
+    def render(self, context) -> Any:
+        whole = self.whole
+        if whole is not None:
+            value = whole.resolve(context)
+            return self.source if value is None else value
+        parts = []
+        for seg in self.segments:
+            if seg.__class__ is str:
+                parts.append(seg)
             else:
-                logger.debug(f"找不到匹配的值: {node_name} in context keys: {list(context.keys()) if isinstance(context, dict) else context}")
-            
-            # 执行替换
-            if resolved_value is not None:
-                # 如果整个字符串就是一个占位符，直接返回值
-                if value.strip() == placeholder:
-                    return resolved_value
-                # 否则进行字符串替换
-                value = value.replace(placeholder, str(resolved_value))
-        
+                value = seg.resolve(context)
+                parts.append(seg.text if value is None else str(value))
+        return ''.join(parts)
+
+
+class DictTemplate:
+    """字典模板，渲染时递归渲染每个值"""
+
+    def __init__(self, items: Tuple):
+        self.items = items
+
+    def render(self, context) -> dict:
+        return {key: (val.render(context) if isinstance(val, _TEMPLATE_TYPES) else val)
+                for key, val in self.items}
+
+
+class ListTemplate:
+    """列表模板，渲染时递归渲染每个元素"""
+
+    def __init__(self, items: Tuple):
+        self.items = items
+
+    def render(self, context) -> list:
+        return [val.render(context) if isinstance(val, _TEMPLATE_TYPES) else val for val in self.items]
+
+
+_TEMPLATE_TYPES = (Template, DictTemplate, ListTemplate)
+
+
+@lru_cache(maxsize=4096)
+def _compile_string(value: str):
+    """把字符串编译为 Template，不含占位符时原样返回字符串"""
+    segments = []
+    pos = 0
+    for match in PLACEHOLDER_PATTERN.finditer(value):
+        if match.start() > pos:
+            segments.append(value[pos:match.start()])
+        path = _compile_path(match.group(3)) if match.group(3) else ()
+        segments.append(PlaceholderRef(match.group(0), match.group(1), match.group(2), path))
+        pos = match.end()
+    if not segments:
         return value
+    if pos < len(value):
+        segments.append(value[pos:])
+    refs = [seg for seg in segments if isinstance(seg, PlaceholderRef)]
+    whole = refs[0] if len(refs) == 1 and value.strip() == refs[0].text else None
+    return Template(value, tuple(segments), whole)
+
+
+def compile_placeholders(value):
+    """
+    预编译 DSL 值中的占位符
+
+    字符串编译为 Template，字典/列表递归编译（渲染时总是生成新的容器，
+    避免函数修改参数时污染执行计划）；其他值原样返回。
+    渲染时用 render_placeholders 即可，无需再做正则扫描。
+    """
+    if isinstance(value, str):
+        return _compile_string(value)
     elif isinstance(value, dict):
-        return {k: resolve_placeholders(v, context) for k, v in value.items()}
+        return DictTemplate(tuple((k, compile_placeholders(v)) for k, v in value.items()))
     elif isinstance(value, list):
-        return [resolve_placeholders(v, context) for v in value]
+        return ListTemplate(tuple(compile_placeholders(v) for v in value))
     else:
         return value
+
+
+def render_placeholders(compiled, context):
+    """渲染 compile_placeholders 的结果"""
+    if isinstance(compiled, _TEMPLATE_TYPES):
+        return compiled.render(context)
+    return compiled
+
+
+def resolve_placeholders(value, context):
+    """解析占位符 ${...}，并用 context 中的值替换"""
+    return render_placeholders(compile_placeholders(value), context)
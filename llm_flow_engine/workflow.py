@@ -1,22 +1,62 @@
+import asyncio
+import time
+from types import MappingProxyType
 from typing import Any, Callable, Dict, List, Optional
 from loguru import logger
+from .concurrency import ResourcePools, hold_slots
 from .executor import Executor
 from .executor_result import ExecutorResult
+from .run_state import RunState
+from .token_stream import TokenStream
+
+# 节点失败策略：继续运行下游 / 跳过所有下游 / 取消整个运行
+FAILURE_POLICIES = ('continue', 'skip_dependents', 'cancel')
 
 class WorkFlow:
-    def __init__(self, executors: List[Executor], force_sequential: bool = True, 
-                 dep_map: Optional[Dict[str, List[str]]] = None):
-        self.executors = executors
+    """工作流执行计划
+
+    只保存不可变的计划数据（执行器、依赖图及其反向索引），
+    每次运行的中间结果都保存在独立的 RunState 中，同一个实例可安全地并发运行。
+    """
+
+    def __init__(self, executors: List[Executor], force_sequential: bool = True,
+                 dep_map: Optional[Dict[str, List[str]]] = None,
+                 max_in_flight: Optional[int] = None, pool_limits: Optional[Dict[str, int]] = None,
+                 on_failure: str = 'continue'):
+        if on_failure not in FAILURE_POLICIES:
+            raise ValueError(f"未知的失败策略: {on_failure}，可选值: {', '.join(FAILURE_POLICIES)}")
+        self.executors = tuple(executors)
+        # 工作流名称
+        self.name = ''
+        # 工作流定义的统计键（名称 + DSL 内容哈希），用于按工作流区分节点延迟历史
+        self.key = ''
         self.force_sequential = force_sequential
-        self.context = {}  # 添加 context 属性
-        self.dep_map = dep_map or {}  # 依赖映射，如果为空则表示无依赖
-        
-        # DSL 相关属性
+        # 依赖映射，如果为空则表示无依赖
+        self.dep_map = {name: tuple(deps) for name, deps in (dep_map or {}).items()}
+        # 每次运行的并发限制：最大在途节点数和命名资源池上限
+        self.max_in_flight = max_in_flight
+        self.pool_limits = dict(pool_limits or {})
+        # 节点失败时的默认处理策略，节点可单独配置 on_failure 覆盖
+        self.on_failure = on_failure
+
+        # DSL 相关属性（静态定义，运行期间只读）
         self.metadata: Dict = {}
         self.input: Dict = {}
         self.output: Dict = {}
         self.global_context: Dict = {}
 
+        # 依赖图索引，首次运行时构建一次，之后所有运行共享
+        self._indexed = False
+        self._executors_by_name: Dict[str, Executor] = {}
+        self._reverse_dep: Dict[str, List[str]] = {}
+        self._dep_count: Dict[str, int] = {}
+        self._topo_order: List[str] = []
+        # 流式边：上游节点名 -> 以流式方式消费其输出的下游节点名
+        self._stream_consumers: Dict[str, List[str]] = {}
+        # 流式下游的其它依赖 -> 要等它完成才能启动的流式上游
+        self._stream_gates: Dict[str, List[str]] = {}
+        self._is_dag = False
+
     def _validate(self):
         # 简单参数合法性校验
         logger.debug("开始验证工作流配置...")
@@ -26,6 +66,19 @@ class WorkFlow:
             assert callable(exe.func), 'Executor func must be callable'
         logger.debug("工作流配置验证通过")
 
+    def failure_policy(self, exe: Executor) -> str:
+        """节点失败时的处理策略：节点配置优先，否则使用工作流配置"""
+        return exe.on_failure or self.on_failure
+
+    def _should_cancel(self, exe: Executor, res) -> bool:
+        return getattr(res, 'status', None) == 'failed' and self.failure_policy(exe) == 'cancel'
+
+    @staticmethod
+    def _not_run_result(exe: Executor, status: str, reason: str) -> ExecutorResult:
+        """未执行（skipped）或被中途取消（cancelled）的节点结果"""
+        now = time.time()
+        return ExecutorResult(exe.exec_type, now, now, status, reason)
+
     def _build_reverse_dep(self):
         """构建反向依赖映射"""
         executor_names = {exe.name for exe in self.executors}
@@ -36,132 +89,384 @@ class WorkFlow:
                     rev[dep].append(node)
         return rev
 
+    def _build_indexes(self):
+        """构建依赖图索引（只依赖计划数据，结果在各次运行间共享）"""
+        if self._indexed:
+            return
+        self._executors_by_name = {exe.name: exe for exe in self.executors}
+        self._reverse_dep = self._build_reverse_dep()
+        self._dep_count = {exe.name: len(self.dep_map.get(exe.name, ())) for exe in self.executors}
+        self._is_dag = self._has_dependencies()
+        self._topo_order = self._build_topo_order()
+        self._stream_consumers = {}
+        self._stream_gates = {}
+        for exe in self.executors:
+            if exe.stream_from:
+                self._stream_consumers.setdefault(exe.stream_from, []).append(exe.name)
+                # 流式下游的其它依赖完成后上游才启动（拓扑序已算完，不影响关键路径估计）
+                for dep in self.dep_map.get(exe.name, ()):
+                    if dep != exe.stream_from:
+                        self._stream_gates.setdefault(dep, []).append(exe.stream_from)
+                        self._dep_count[exe.stream_from] += 1
+        self._indexed = True
+
+    def _build_topo_order(self) -> List[str]:
+        """Kahn 算法计算拓扑序（用于关键路径估计，环上的节点不包含在内）"""
+        remaining = dict(self._dep_count)
+        order = [name for name, count in remaining.items() if count == 0]
+        for name in order:
+            for nxt in self._reverse_dep[name]:
+                remaining[nxt] -= 1
+                if remaining[nxt] == 0:
+                    order.append(nxt)
+        return order
+
+    def _critical_path_ranks(self, state: RunState) -> Dict[str, float]:
+        """
+        按历史耗时估计每个节点的剩余关键路径长度：
+        rank(v) = est(v) + max(rank(下游))，按逆拓扑序一次计算，O(V+E)。
+        没有历史的节点使用已知节点耗时的平均值（都没有时为 1 秒）。
+        """
+        latency_stats = state.latency_stats
+        estimates = {}
+        if latency_stats is not None:
+            for exe in self.executors:
+                est = latency_stats.estimate(self.key, exe.name)
+                if est is not None:
+                    estimates[exe.name] = est
+        default = sum(estimates.values()) / len(estimates) if estimates else 1.0
+
+        ranks: Dict[str, float] = {}
+        for name in reversed(self._topo_order):
+            downstream = max((ranks[nxt] for nxt in self._reverse_dep[name] if nxt in ranks), default=0.0)
+            ranks[name] = estimates.get(name, default) + downstream
+        return ranks
+
     def _has_dependencies(self):
         """检查是否有依赖关系"""
-        return any(self.dep_map.get(exe.name, []) for exe in self.executors)
+        return any(self.dep_map.get(exe.name, ()) for exe in self.executors)
+
+    def new_run_state(self, *args, **kwargs) -> RunState:
+        """为一次运行创建独立的运行状态（含本次运行专用的资源池）"""
+        run_pools = None
+        if self.max_in_flight or self.pool_limits:
+            run_pools = ResourcePools(self.pool_limits, self.max_in_flight)
+        return RunState(args, kwargs, self.global_context, run_pools=run_pools)
+
+    async def _run_executor(self, exe: Executor, state: RunState, args: tuple, kwargs: dict,
+                            priority: float = 0.0, token_streams: tuple = ()) -> ExecutorResult:
+        """
+        在并发限制下运行单个执行器，名额紧张时 priority 高的先运行
+
+        token_streams 为流式下游的输入流：执行器的 token 增量写入这些流，结束时关闭。
+        流式下游节点（stream_from）不占用资源池名额，避免与被背压阻塞的上游互相等待。
+        """
+        pool_groups = () if exe.stream_from else (state.run_pools, state.engine_pools)
+        res = None
+        error = None
+        try:
+            async with hold_slots(exe.resources, *pool_groups, priority=priority):
+                if state.events is not None:
+                    state.emit('node_started', exe.name)
+
+                async def forward_token(delta: str, _name=exe.name):
+                    state.emit('node_token', _name, delta=delta)
+                    for stream in token_streams:
+                        await stream.put(delta)
+
+                if exe.binding.accepts_on_token and (state.events is not None or token_streams):
+                    on_token = forward_token
+                else:
+                    on_token = None
+                res = await exe.run(*args, _deadline=state.deadline, _on_token=on_token, **kwargs)
+        except BaseException as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            for stream in token_streams:
+                if error is None and getattr(res, 'status', None) != 'success':
+                    error = getattr(res, 'error', None) or '执行失败'
+                stream.finish(getattr(res, 'output', None), error)
+        # 命中结果缓存的耗时不代表节点真实耗时，不计入延迟历史
+        if state.latency_stats is not None and getattr(res, 'status', None) == 'success' and not res.cache_hit:
+            state.latency_stats.record(self.key, exe.name, res.exec_time)
+        return res
 
     async def run(self, *args, **kwargs) -> Dict[str, 'ExecutorResult']:
+        state = self.new_run_state(*args, **kwargs)
+        return await self.run_with_state(state)
+
+    async def run_with_state(self, state: RunState) -> Dict[str, 'ExecutorResult']:
+        """
+        使用给定的运行状态执行工作流
+
+        state.deadline 设置了截止时间时，超时后取消所有在途节点（等待其真正结束，
+        包括进行中的 HTTP 请求），在途节点记为 cancelled，未运行的节点记为 skipped，
+        并返回已有的部分结果（state.timed_out 为 True）。调用方取消时同样会先取消所有子任务。
+        """
         self._validate()
-        
+        self._build_indexes()
+
         # 如果有依赖关系，使用DAG执行模式
-        if self._has_dependencies():
-            return await self._run_dag(*args, **kwargs)
-        else:
-            return await self._run_simple(*args, **kwargs)
+        runner = self._run_dag(state) if self._is_dag else self._run_simple(state)
+        remaining = state.remaining()
+        if remaining is None:
+            return await runner
+        try:
+            return await asyncio.wait_for(runner, timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            state.timed_out = True
+            reason = '已超过运行截止时间'
+            logger.warning("工作流运行超时，返回部分结果")
+            for exe in self.executors:
+                if exe.name not in state.results:
+                    state.record(exe.name, self._not_run_result(exe, 'skipped', reason))
+            return state.results
+
+    async def _run_simple(self, state: RunState) -> Dict[str, 'ExecutorResult']:
+        """简单执行模式（顺序或并行）
+
+        节点之间没有依赖，失败策略只有 cancel 生效：顺序模式跳过剩余节点，
+        并行模式取消仍在运行的节点。
+        """
+        args = state.args
+        # 节点之间不传递输出，占位符上下文只有工作流输入
+        kwargs = {**state.inputs, '_global_context': MappingProxyType(state.global_context)}
 
-    async def _run_simple(self, *args, **kwargs) -> Dict[str, 'ExecutorResult']:
-        """简单执行模式（顺序或并行）"""
-        results = {}
-        
         if self.force_sequential:
             logger.info(f"开始顺序执行 {len(self.executors)} 个执行器")
+            cancel_reason = None
             for exe in self.executors:
-                res = await exe.run(*args, **kwargs)
-                results[exe.name] = res
-                # 更新全局 context
-                if res.output is not None:
-                    self.context[f"{exe.name}.output"] = res.output
+                if cancel_reason is not None:
+                    state.record(exe.name, self._not_run_result(exe, 'skipped', cancel_reason))
+                    continue
+                try:
+                    res = await self._run_executor(exe, state, args, kwargs)
+                except asyncio.CancelledError:
+                    state.record(exe.name, self._not_run_result(exe, 'cancelled', '运行被取消或超时'))
+                    raise
+                state.record(exe.name, res)
+                if self._should_cancel(exe, res):
+                    cancel_reason = f"节点 {exe.name} 执行失败，运行已取消"
+                    logger.warning(cancel_reason)
         else:
             logger.info(f"开始并行执行 {len(self.executors)} 个执行器")
-            import asyncio
-            tasks = {exe.name: exe.run(*args, **kwargs) for exe in self.executors}
-            done = await asyncio.gather(*tasks.values(), return_exceptions=True)
-            for i, exe in enumerate(self.executors):
-                results[exe.name] = done[i]
-                # 更新全局 context
-                if done[i].output is not None:
-                    self.context[f"{exe.name}.output"] = done[i].output
-                
+            tasks = {asyncio.create_task(self._run_executor(exe, state, args, kwargs)): exe
+                     for exe in self.executors}
+            pending = set(tasks)
+            cancel_reason = None
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    if cancel_reason is not None:
+                        continue
+                    for task in done:
+                        exe = tasks[task]
+                        if not task.cancelled() and task.exception() is None and self._should_cancel(exe, task.result()):
+                            cancel_reason = f"节点 {exe.name} 执行失败，运行已取消"
+                            logger.warning(cancel_reason)
+                            for other in pending:
+                                other.cancel()
+                            break
+            finally:
+                for task in pending:
+                    task.cancel()
+                # 等待被取消的任务真正结束，然后按定义顺序记录结果
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+                for task, exe in tasks.items():
+                    self._record_task(state, exe, task, cancel_reason)
+
         logger.success("工作流执行完成")
-        return results
+        return state.results
+
+    def _record_task(self, state: RunState, exe: Executor, task: asyncio.Task, cancel_reason: Optional[str]):
+        """记录并行模式下单个任务的结果"""
+        if exe.name in state.results:
+            return
+        if task.cancelled() or not task.done():
+            state.record(exe.name, self._not_run_result(exe, 'cancelled', cancel_reason or '运行被取消或超时'))
+        elif task.exception() is not None:
+            state.record(exe.name, task.exception())
+        else:
+            state.record(exe.name, task.result())
+
+    async def _run_dag(self, state: RunState) -> Dict[str, 'ExecutorResult']:
+        """DAG执行模式（处理依赖关系）
+
+        调度总开销为 O(V+E)：每个节点完成时只遍历其直接下游，
+        所有节点共享同一个增量更新的只读上下文视图，任务完成后通过回调直接映射回节点名。
+        就绪节点立即创建任务，并发上限由资源池控制，等待名额的节点只是挂起的协程。
+        存在并发限制时按“最长剩余关键路径优先”排序：根据历史耗时估计每个节点到终点的
+        最长路径，名额紧张时关键路径上的节点先获得名额。
+
+        节点失败时按失败策略处理：continue 照常运行下游；skip_dependents 把所有下游
+        （传递地）记录为 skipped，不再调用；cancel 取消在途节点（记录为 cancelled），
+        其余未运行的节点记录为 skipped。
+
+        声明了 stream_from 的节点在上游开始时即启动，通过有界的 TokenStream 边读边处理
+        上游的 token 增量，上下游的耗时可以重叠。上游要等流式下游的其它依赖都完成后才启动：
+        上游被背压阻塞时仍占用资源池名额，如果下游还在等其它依赖，而依赖又在等名额，就会互相等待。
+        """
+        args, kwargs = state.args, state.inputs
+        results = state.results
+        dep_map = self.dep_map
+        reverse_dep = self._reverse_dep
+        executors_by_name = self._executors_by_name
+
+        # 依赖计数（每次运行一份副本）
+        dep_count = dict(self._dep_count)
+        # 所有节点共享的只读上下文视图（已完成节点的输出），随节点完成增量更新
+        context_view = state.context_view
+        # 已完成节点名队列，由任务完成回调写入
+        completed: asyncio.Queue = asyncio.Queue()
+        # 正在运行的任务：节点名 -> 任务
+        running: Dict[str, asyncio.Task] = {}
+        # 流式边：下游节点名 -> 输入流，以及已经开始（流式边已释放）的上游节点
+        stream_consumers = self._stream_consumers
+        streams: Dict[str, TokenStream] = {}
+        stream_started = set()
+        stream_gates = self._stream_gates
+        # 只有存在并发限制时优先级才有意义
+        if state.run_pools or state.engine_pools:
+            ranks = self._critical_path_ranks(state)
+        else:
+            ranks = {}
+
+        async def run_node(name, token_streams):
+            exe = executors_by_name[name]
+            # 收集依赖节点输出，只传递上游output字段；流式边传递上游的 TokenStream
+            deps = dep_map.get(name, ())
+            stream = streams.get(name)
+            dep_outputs = [stream if stream is not None and dep == stream.producer
+                           else getattr(results[dep], 'output', None) for dep in deps]
+
+            # 运行时输入 + 共享上下文视图（不再为每个节点复制已完成节点的输出）
+            node_kwargs = {**kwargs, '_global_context': context_view}
 
-    async def _run_dag(self, *args, **kwargs) -> Dict[str, 'ExecutorResult']:
-        """DAG执行模式（处理依赖关系）"""
-        from typing import Set
-        import asyncio
-        
-        # 将executors转换为字典形式便于查找
-        executors_dict = {exe.name: exe for exe in self.executors}
-        
-        # 记录每个节点的输出
-        results = {}
-        # 记录已完成节点
-        finished: Set[str] = set()
-        # 记录正在运行的任务
-        running = {}
-        # 构建反向依赖
-        reverse_dep = self._build_reverse_dep()
-        # 记录依赖计数
-        dep_count = {exe.name: len(self.dep_map.get(exe.name, [])) for exe in self.executors}
-        # 初始化可运行节点
-        ready = [exe.name for exe in self.executors if dep_count[exe.name] == 0]
-
-        # 更新全局上下文 - 运行时输入覆盖 DSL 中的静态输入
-        if hasattr(self, 'global_context'):
-            # 合并运行时输入
-            for key, value in kwargs.items():
-                if key in self.global_context:
-                    # 运行时输入覆盖 DSL 中的静态值
-                    self.global_context[key] = value
-                    logger.debug(f"运行时输入覆盖了 DSL 静态值: {key} = {value}")
-
-        async def run_node(name):
-            # 收集依赖节点输出
-            deps = self.dep_map.get(name, [])
-            dep_outputs = [results[dep] for dep in deps]
-            # 只传递上游output字段
-            dep_outputs = [o.output if hasattr(o, 'output') else o.get('output') for o in dep_outputs]
-            exe = executors_dict[name]
-            
-            # 构建全局上下文，包含所有已完成节点的输出和运行时输入
-            global_context = {}
-            
-            # 添加运行时输入
-            for key, value in kwargs.items():
-                global_context[key] = value
-            
-            # 添加已完成节点的输出
-            for finished_name, finished_result in results.items():
-                if hasattr(finished_result, 'output') and finished_result.output is not None:
-                    global_context[f"{finished_name}.output"] = finished_result.output
-                    global_context[finished_name] = finished_result  # 也保存完整的ExecutorResult
-            
-            # 将全局上下文添加到kwargs中
-            node_kwargs = {**kwargs, '_global_context': global_context}
-            
             # 合并参数：支持单输入或多输入
-            if dep_outputs:
-                res = await exe.run(*dep_outputs, **node_kwargs)
-            else:
-                res = await exe.run(*args, **node_kwargs)
-            results[name] = res  # 直接存储ExecutorResult对象
-            finished.add(name)
-            # 检查下游节点，收集所有新准备好的节点
-            new_ready = []
-            for nxt in reverse_dep[name]:
+            priority = ranks.get(name, 0.0)
+            try:
+                if dep_outputs:
+                    res = await self._run_executor(exe, state, dep_outputs, node_kwargs, priority, token_streams)
+                else:
+                    res = await self._run_executor(exe, state, args, node_kwargs, priority, token_streams)
+            finally:
+                if stream is not None:
+                    stream.detach()
+            state.record(name, res)  # 直接存储ExecutorResult对象
+
+        def skip_reason(name):
+            # 任一上游被跳过/取消，或以 skip_dependents 策略失败时，跳过该节点
+            for dep in dep_map.get(name, ()):
+                status = getattr(results.get(dep), 'status', None)
+                if status in ('skipped', 'cancelled'):
+                    return f"上游节点 {dep} 未执行"
+                if status == 'failed' and self.failure_policy(executors_by_name[dep]) == 'skip_dependents':
+                    return f"上游节点 {dep} 执行失败"
+            return None
+
+        def release_downstream(name):
+            # 更新下游依赖计数，新就绪的节点要么启动，要么连同其下游一起被跳过
+            ready = []
+            finished = [name]
+
+            def count_down(nxt):
                 dep_count[nxt] -= 1
                 if dep_count[nxt] == 0:
-                    new_ready.append(nxt)
-            # 并行启动所有新准备好的节点
-            for ready_node in new_ready:
-                running[ready_node] = asyncio.create_task(run_node(ready_node))
+                    reason = skip_reason(nxt)
+                    if reason is None:
+                        ready.append(nxt)
+                    else:
+                        logger.warning(f"跳过节点 {nxt}: {reason}")
+                        state.record(nxt, self._not_run_result(executors_by_name[nxt], 'skipped', reason))
+                        finished.append(nxt)
+
+            while finished:
+                done_name = finished.pop()
+                for nxt in reverse_dep[done_name]:
+                    if done_name in stream_started and executors_by_name[nxt].stream_from == done_name:
+                        # 流式边在上游开始时已经计数
+                        continue
+                    count_down(nxt)
+                for producer in stream_gates.get(done_name, ()):
+                    count_down(producer)
+            start_ready(ready)
+
+        def start_ready(names):
+            # 同时就绪的节点按关键路径长度从大到小启动
+            if ranks and len(names) > 1:
+                names.sort(key=lambda n: ranks.get(n, 0.0), reverse=True)
+            for ready in names:
+                start_node(ready)
+
+        def start_node(name):
+            # 流式下游不等待上游完成：上游开始时即释放流式边。此时下游的其它依赖都已完成，
+            # 可以直接决定下游是启动还是跳过
+            ready = []
+            skipped = []
+            if name in stream_consumers:
+                stream_started.add(name)
+            for consumer in stream_consumers.get(name, ()):
+                dep_count[consumer] -= 1
+                if dep_count[consumer] == 0:
+                    reason = skip_reason(consumer)
+                    if reason is None:
+                        ready.append(consumer)
+                    else:
+                        logger.warning(f"跳过节点 {consumer}: {reason}")
+                        state.record(consumer, self._not_run_result(executors_by_name[consumer], 'skipped', reason))
+                        skipped.append(consumer)
+            token_streams = tuple(streams.setdefault(consumer, TokenStream(name, executors_by_name[consumer].stream_buffer))
+                                  for consumer in ready)
+            task = asyncio.create_task(run_node(name, token_streams))
+            task.add_done_callback(lambda _t, _name=name: completed.put_nowait(_name))
+            running[name] = task
+            start_ready(ready)
+            for consumer in skipped:
+                release_downstream(consumer)
 
         # 并行启动所有初始ready节点
-        for name in ready:
-            running[name] = asyncio.create_task(run_node(name))
-        
-        # 动态等待任务完成，支持并行执行
-        while running:
-            done, pending = await asyncio.wait(running.values(), return_when=asyncio.FIRST_COMPLETED)
-            # 移除已完成的任务
-            completed_names = []
-            for task in done:
-                for name, t in running.items():
-                    if t == task:
-                        completed_names.append(name)
-                        break
-            for name in completed_names:
-                del running[name]
-        
+        start_ready([exe.name for exe in self.executors if dep_count[exe.name] == 0])
+
+        cancel_reason = None
+        try:
+            while running:
+                name = await completed.get()
+                task = running.pop(name)
+                exe = executors_by_name[name]
+                if task.cancelled():
+                    state.record(name, self._not_run_result(exe, 'cancelled', cancel_reason or '节点被取消'))
+                elif task.exception() is not None:
+                    err = task.exception()
+                    logger.error(f"节点 {name} 调度异常: {err}")
+                    now = time.time()
+                    state.record(name, ExecutorResult(exe.exec_type, now, now, 'failed', str(err)))
+                if cancel_reason is not None:
+                    # 已取消的运行只等待在途任务结束，不再启动新节点
+                    continue
+                if self._should_cancel(exe, results.get(name)):
+                    cancel_reason = f"节点 {name} 执行失败，运行已取消"
+                    logger.warning(cancel_reason)
+                    for other in running.values():
+                        other.cancel()
+                    continue
+                # 检查下游节点，并行启动所有新准备好的节点
+                release_downstream(name)
+        finally:
+            # 调用方取消或运行超时时，不留下孤儿任务：取消并等待在途节点结束
+            for task in running.values():
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.values(), return_exceptions=True)
+                for name in running:
+                    if name not in results:
+                        state.record(name, self._not_run_result(executors_by_name[name], 'cancelled', '运行被取消或超时'))
+
+        if cancel_reason is not None:
+            for exe in self.executors:
+                if exe.name not in results:
+                    state.record(exe.name, self._not_run_result(exe, 'skipped', cancel_reason))
+
         logger.success("DAG工作流执行完成")
         return results
@@ -7,6 +7,9 @@ LLM Flow Engine 项目验证脚本
 import sys
 import asyncio
 import os
+import socket
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 # 设置UTF-8编码，解决Windows环境下的编码问题
@@ -243,6 +246,1121 @@ def test_project_structure():
         safe_print("[PASS] Project structure is complete")
         return True
 
+# ---------------------------------------------------------------------------
+# 行为检查：每个检查函数（可以是协程函数）用 assert 验证一项功能，抛出异常即失败
+# ---------------------------------------------------------------------------
+
+BEHAVIOR_CHECKS = []
+
+
+def behavior_check(name):
+    """注册一个行为检查"""
+    def register(func):
+        BEHAVIOR_CHECKS.append((name, func))
+        return func
+    return register
+
+
+def run_check(name, func):
+    safe_print(f"\n[CHECK] {name}...")
+    try:
+        result = func()
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+        safe_print(f"[PASS] {name}")
+        return True
+    except Exception as e:
+        safe_print(f"[FAIL] {name}: {e!r}")
+        return False
+
+
+@asynccontextmanager
+async def mock_llm_server(handler):
+    """启动本地 HTTP 服务模拟 LLM 接口，所有 POST 请求交给 handler，产出基础 URL"""
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_route('POST', '/{tail:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    try:
+        yield f"http://127.0.0.1:{runner.addresses[0][1]}"
+    finally:
+        await runner.cleanup()
+
+
+def ollama_model(api_url, **extra):
+    """Ollama 格式的测试模型配置"""
+    config = {"platform": "ollama", "api_url": api_url, "message_format": "ollama",
+              "max_tokens": 100, "supports": ["temperature"]}
+    config.update(extra)
+    return config
+
+
+def closed_port_url():
+    """一个当前没有服务监听的本地地址"""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}/api/chat"
+
+
+@behavior_check("Compiled plans are cached and invalidated on registry changes")
+async def check_plan_cache():
+    from llm_flow_engine import FlowEngine
+
+    async def shout(text):
+        return text.upper()
+
+    async def exclaim(text):
+        return text + '!'
+
+    dsl = """
+executors:
+  - name: a
+    type: task
+    func: shout
+    custom_vars: {text: hi}
+"""
+    engine = FlowEngine(plan_cache_size=2)
+    engine.register_function('shout', shout)
+    plan = engine.load_workflow(dsl)
+    assert engine.load_workflow(dsl) is plan
+    assert engine.plan_cache_stats()['hits'] == 1 and engine.plan_cache_stats()['misses'] == 1
+    # 同一份计划可以反复运行，结果互不影响
+    for _ in range(2):
+        assert (await engine.execute_dsl(dsl, inputs={}))['results']['a'].output == 'HI'
+    # 重新注册函数后旧计划失效，新计划使用新函数
+    engine.register_function('shout', exclaim)
+    assert engine.load_workflow(dsl) is not plan
+    assert (await engine.execute_dsl(dsl, inputs={}))['results']['a'].output == 'hi!'
+    # 添加模型同样使计划失效；超出容量时淘汰最久未使用的计划
+    engine.add_model('extra', ollama_model('http://127.0.0.1:1/api/chat'))
+    engine.load_workflow(dsl)
+    for text in ('x', 'y'):
+        engine.load_workflow(dsl.replace('hi', text))
+    stats = engine.plan_cache_stats()
+    assert stats['size'] == 2 and stats['evictions'] >= 1, stats
+
+
+@behavior_check("Concurrent runs of one plan keep separate state")
+async def check_run_state_isolation():
+    from llm_flow_engine import FlowEngine
+
+    async def greet(who, pause):
+        await asyncio.sleep(pause)
+        return f"hello {who}"
+
+    async def upper(text):
+        return text.upper()
+
+    dsl = """
+input:
+  data: {name: nobody, delay: 0}
+executors:
+  - name: a
+    type: task
+    func: greet
+    custom_vars: {who: "${workflow_input.name}", pause: "${workflow_input.delay}"}
+  - name: b
+    type: task
+    func: upper
+    depends_on: [a]
+"""
+    engine = FlowEngine()
+    engine.register_function('greet', greet)
+    engine.register_function('upper', upper)
+    names = [f"user{i}" for i in range(20)]
+    runs = await asyncio.gather(*(engine.execute_dsl(dsl, inputs={'workflow_input': {'name': name, 'delay': (i % 5) / 100}})
+                                  for i, name in enumerate(names)))
+    assert [run['results']['b'].output for run in runs] == [f"HELLO {name.upper()}" for name in names]
+    # 运行时输入按键覆盖 DSL 默认输入，未提供的键（delay）使用默认值；没有运行时输入时使用默认值
+    run = await engine.execute_dsl(dsl, inputs={'workflow_input': {'name': 'partial'}})
+    assert run['results']['b'].output == "HELLO PARTIAL", run
+    assert (await engine.execute_dsl(dsl))['results']['b'].output == "HELLO NOBODY"
+    # 无依赖的顺序模式同样按运行时输入解析
+    simple = dsl.split("  - name: b")[0]
+    assert (await engine.execute_dsl(simple, inputs={'workflow_input': {'name': 'solo'}}))['results']['a'].output == "hello solo"
+    # 计划中的静态输入不被运行时输入修改
+    assert engine.load_workflow(dsl).global_context['workflow_input'] == {'name': 'nobody', 'delay': 0}
+
+
+@behavior_check("Call bindings filter and place arguments")
+def check_call_binding():
+    from llm_flow_engine.executor import CallBinding
+
+    def combine(first, second, sep=' '):
+        return f"{first}{sep}{second}"
+
+    binding = CallBinding(combine)
+    assert binding.positional_names == ('first', 'second', 'sep') and not binding.is_coroutine
+    # 多余的上游输出被丢弃，内部参数被过滤
+    args, kwargs = binding.bind(('a', 'b', 'c'), {'sep': '-', '_global_context': {}}, {})
+    assert combine(*args, **kwargs) == 'a-b', (args, kwargs)
+    # 关键字参数优先于同名位置上的上游输出
+    args, kwargs = binding.bind(('a', 'b'), {'second': 'kw'}, {})
+    assert args == ('a',) and combine(*args, **kwargs) == 'a kw', (args, kwargs)
+    assert binding.runtime_params == {'first', 'second', 'sep'}
+
+    async def llm_simple_call(user_input, model='m', on_token=None):
+        return user_input
+
+    binding = CallBinding(llm_simple_call)
+    args, kwargs = binding.bind(('upstream',), {'user_input': 'question', 'prompt': 'x', 'model': 'm2'}, {})
+    assert args == ('question',) and kwargs == {'model': 'm2'}, (args, kwargs)
+    assert binding.is_coroutine and binding.accepts_on_token and 'on_token' not in binding.runtime_params
+
+
+@behavior_check("Placeholder templates compile once and render per run")
+def check_compiled_templates():
+    from llm_flow_engine.utils import compile_placeholders, render_placeholders
+    template = compile_placeholders({'whole': '${a.output}', 'text': 'got ${a.output} and ${b.output}',
+                                     'items': ['${b.output}', 3], 'plain': 'no placeholders'})
+    assert compile_placeholders('x ${a.output}') is compile_placeholders('x ${a.output}')
+    context = {'a.output': {'k': 1}, 'b': 'B'}
+    first = render_placeholders(template, context)
+    # 单个占位符返回被引用的对象本身，混合文本转为字符串，未解析的占位符保留原文
+    assert first == {'whole': {'k': 1}, 'text': "got {'k': 1} and B", 'items': ['B', 3],
+                     'plain': 'no placeholders'}, first
+    assert render_placeholders(compile_placeholders('${missing.output} left'), {}) == '${missing.output} left'
+    # 每次渲染生成新的容器，函数修改参数不会污染计划
+    first['items'].append('mutated')
+    assert render_placeholders(template, context)['items'] == ['B', 3]
+
+
+@behavior_check("Nested placeholder paths resolve keys, indexes and attributes")
+async def check_nested_placeholders():
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.utils import resolve_placeholders
+
+    class Doc:
+        title = 'T'
+
+        def to_dict(self):
+            return {'title': self.title}
+
+    context = {'a': {'items': [{'name': 'x'}, {'name': 'y'}], 'odd key': 5, 'doc': Doc(), '_key': 1}}
+    assert resolve_placeholders('${a.items[1].name}', context) == 'y'
+    assert resolve_placeholders('${a.items[-1].name}', context) == 'y'
+    assert resolve_placeholders("${a.output['odd key']}", context) == 5
+    assert resolve_placeholders('${a.doc.title}', context) == 'T'
+    # 路径不存在时保留占位符原文
+    assert resolve_placeholders('${a.items[5].name}', context) == '${a.items[5].name}'
+    # 以 _ 开头的属性不可访问（字典键不受影响），占位符无法取到模块全局或内置函数
+    for text in ("${a.doc.to_dict.__globals__['__builtins__']}", '${a.doc.__class__}', '${a.__class__}'):
+        assert resolve_placeholders(text, context) == text, text
+    assert resolve_placeholders('${a._key}', context) == 1
+
+    dsl = """
+executors:
+  - name: a
+    type: task
+    func: make
+  - name: b
+    type: task
+    func: echo
+    custom_vars: {text: "first=${a.output.rows[0].id}, last=${a.output.rows[-1].id}"}
+    depends_on: [a]
+"""
+    engine = FlowEngine()
+    engine.register_function('make', lambda: {'rows': [{'id': 1}, {'id': 2}, {'id': 3}]})
+    engine.register_function('echo', lambda text: text)
+    result = await engine.execute_dsl(dsl, inputs={})
+    assert result['results']['b'].output == 'first=1, last=3', result['results']['b'].output
+
+
+@behavior_check("DAG scheduler runs ready nodes in parallel and joins in order")
+async def check_dag_scheduling():
+    from llm_flow_engine import FlowEngine
+
+    async def work(value):
+        await asyncio.sleep(0.1)
+        return value
+
+    def join(*values):
+        return list(values)
+
+    branches = [f"b{i}" for i in range(10)]
+    lines = ["executors:"]
+    for i, name in enumerate(branches):
+        lines += [f"  - name: {name}", "    type: task", "    func: work", f"    custom_vars: {{value: {i}}}"]
+    lines += ["  - name: join", "    type: task", "    func: join", f"    depends_on: [{', '.join(reversed(branches))}]"]
+    engine = FlowEngine()
+    engine.register_function('work', work)
+    engine.register_function('join', join)
+    start = time.perf_counter()
+    result = await engine.execute_dsl("\n".join(lines), inputs={})
+    assert time.perf_counter() - start < 0.5, "独立分支没有并行执行"
+    assert result['results']['join'].output == list(range(9, -1, -1)), result['results']['join'].output
+
+    # 长链按依赖顺序逐个执行，调度开销与节点数成线性关系
+    lines = ["executors:", "  - {name: n0, type: task, func: inc, custom_vars: {value: 0}}"]
+    lines += [f"  - {{name: n{i}, type: task, func: inc, depends_on: [n{i - 1}]}}" for i in range(1, 500)]
+    engine.register_function('inc', lambda value: value + 1)
+    result = await engine.execute_dsl("\n".join(lines), inputs={})
+    assert result['results']['n499'].output == 500, result['results']['n499'].output
+
+
+@behavior_check("Concurrency limits cap nodes per run, per resource and per engine")
+async def check_concurrency_limits():
+    from llm_flow_engine import FlowEngine
+    active = {'all': 0, 'search': 0}
+    peak = {'all': 0, 'search': 0}
+
+    async def work(kind):
+        for key in {'all', kind}:
+            active[key] = active.get(key, 0) + 1
+            peak[key] = max(peak.get(key, 0), active[key])
+        await asyncio.sleep(0.02)
+        for key in {'all', kind}:
+            active[key] -= 1
+        return kind
+
+    def dsl(max_in_flight):
+        # 没有依赖的工作流按顺序执行，加一个根节点使其进入 DAG 调度
+        lines = ["concurrency:", f"  max_in_flight: {max_in_flight}", "  pools: {search: 1}", "executors:",
+                 "  - {name: root, type: task, func: work, custom_vars: {kind: root}}"]
+        for i in range(6):
+            kind = 'search' if i % 2 else 'other'
+            lines += [f"  - name: n{i}", "    type: task", "    func: work", f"    custom_vars: {{kind: {kind}}}",
+                      "    depends_on: [root]"]
+            if kind == 'search':
+                lines.append("    resources: [search]")
+        return "\n".join(lines)
+
+    engine = FlowEngine()
+    engine.register_function('work', work)
+    await engine.execute_dsl(dsl(2), inputs={})
+    assert peak['all'] == 2 and peak['search'] == 1, peak
+    # 引擎级上限由所有运行共享
+    engine = FlowEngine(max_concurrency=3)
+    engine.register_function('work', work)
+    peak.update(all=0, search=0)
+    await asyncio.gather(*(engine.execute_dsl(dsl(6), inputs={}) for _ in range(3)))
+    assert peak['all'] == 3, peak
+    # 运行结束后名额全部归还
+    assert engine.concurrency_stats()['*'] == {'limit': 3, 'in_use': 0, 'waiting': 0}, engine.concurrency_stats()
+
+
+@behavior_check("Scarce slots go to the longest remaining path first")
+async def check_critical_path_priority():
+    from llm_flow_engine import FlowEngine
+    order = []
+
+    async def work(name, delay):
+        order.append(name)
+        await asyncio.sleep(delay)
+        return name
+
+    dsl = """
+concurrency: {max_in_flight: 1}
+executors:
+  - {name: root, type: task, func: work, custom_vars: {name: root, delay: 0}}
+  - {name: slow, type: task, func: work, custom_vars: {name: slow, delay: 0.15}, depends_on: [root]}
+  - {name: f1, type: task, func: work, custom_vars: {name: f1, delay: 0.01}, depends_on: [root]}
+  - {name: f2, type: task, func: work, custom_vars: {name: f2, delay: 0.01}, depends_on: [f1]}
+"""
+    engine = FlowEngine()
+    engine.register_function('work', work)
+    # 没有历史时按节点数估计：两节点的链先于单个节点
+    await engine.execute_dsl(dsl, inputs={})
+    assert order[1] == 'f1', order
+    # 有了耗时历史后，慢节点所在的路径更长，先获得名额
+    order.clear()
+    await engine.execute_dsl(dsl, inputs={})
+    assert order[1] == 'slow', order
+    # 耗时历史按 DSL 哈希区分：节点名相同的另一个未命名工作流没有历史，仍按节点数估计
+    order.clear()
+    await engine.execute_dsl(dsl.replace('delay: 0.15', 'delay: 0.02'), inputs={})
+    assert order[1] == 'f1', order
+
+
+@behavior_check("Failure policies continue, skip dependents or cancel the run")
+async def check_failure_policies():
+    from llm_flow_engine import FlowEngine
+    calls = []
+
+    async def ok(tag, delay=0.0):
+        calls.append(tag)
+        await asyncio.sleep(delay)
+        return tag
+
+    def boom():
+        raise RuntimeError("boom")
+
+    def dsl(policy, node_policy=None):
+        node_line = f"\n    on_failure: {node_policy}" if node_policy else ""
+        return f"""
+on_failure: {policy}
+executors:
+  - name: a
+    type: task
+    func: boom{node_line}
+  - name: slow
+    type: task
+    func: ok
+    custom_vars: {{tag: slow, delay: 0.2}}
+  - name: b
+    type: task
+    func: ok
+    custom_vars: {{tag: b}}
+    depends_on: [a]
+  - name: c
+    type: task
+    func: ok
+    custom_vars: {{tag: c}}
+    depends_on: [b]
+  - name: d
+    type: task
+    func: ok
+    custom_vars: {{tag: d}}
+    depends_on: [slow]
+"""
+    engine = FlowEngine()
+    engine.register_function('ok', ok)
+    engine.register_function('boom', boom)
+
+    async def statuses(policy, node_policy=None):
+        calls.clear()
+        result = await engine.execute_dsl(dsl(policy, node_policy), inputs={})
+        return {name: res.status for name, res in result['results'].items()}
+
+    assert await statuses('continue') == {'a': 'failed', 'b': 'success', 'c': 'success',
+                                          'slow': 'success', 'd': 'success'}
+    # skip_dependents 传递地跳过下游，不相关的分支照常运行；节点配置优先于工作流配置
+    for policy, node_policy in (('skip_dependents', None), ('continue', 'skip_dependents')):
+        assert await statuses(policy, node_policy) == {'a': 'failed', 'b': 'skipped', 'c': 'skipped',
+                                                       'slow': 'success', 'd': 'success'}
+        assert sorted(calls) == ['d', 'slow'], calls
+    # cancel 取消在途节点，其余节点不再运行
+    assert await statuses('cancel') == {'a': 'failed', 'slow': 'cancelled', 'b': 'skipped',
+                                        'c': 'skipped', 'd': 'skipped'}
+    result = await engine.execute_dsl(dsl('bogus'), inputs={})
+    assert not result['success'] and 'bogus' in result['error'], result
+
+
+@behavior_check("Run deadlines return partial results and cancel cleanly")
+async def check_run_deadline():
+    from llm_flow_engine import FlowEngine
+    live = set()
+
+    async def work(tag, delay):
+        live.add(tag)
+        try:
+            await asyncio.sleep(delay)
+            return tag
+        finally:
+            live.discard(tag)
+
+    dsl = """
+executors:
+  - {name: a, type: task, func: work, custom_vars: {tag: a, delay: 0.05}}
+  - {name: b, type: task, func: work, custom_vars: {tag: b, delay: 5}, depends_on: [a]}
+  - {name: c, type: task, func: work, custom_vars: {tag: c, delay: 5}, depends_on: [a], retry: 3}
+  - {name: d, type: task, func: work, custom_vars: {tag: d, delay: 0}, depends_on: [b]}
+"""
+    engine = FlowEngine()
+    engine.register_function('work', work)
+    start = time.perf_counter()
+    result = await engine.execute_dsl(dsl, inputs={}, timeout=0.3)
+    assert time.perf_counter() - start < 1.0 and not result['success'], result['error']
+    statuses = {name: res.status for name, res in result['results'].items()}
+    assert statuses == {'a': 'success', 'b': 'cancelled', 'c': 'cancelled', 'd': 'skipped'}, statuses
+    # 在途节点（包括重试中的节点）都已真正结束
+    assert not live, live
+    # 调用方取消同样不留下孤儿任务
+    task = asyncio.create_task(engine.execute_dsl(dsl, inputs={}))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    assert not live, live
+
+
+@behavior_check("LLM adapters share one pooled keep-alive session")
+async def check_http_pool():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.functions.llm_api import llm_api_call
+    peers = set()
+
+    async def handler(request):
+        peers.add(request.transport.get_extra_info('peername'))
+        return web.json_response({'message': {'content': 'ok'}})
+
+    async with mock_llm_server(handler) as base:
+        async with FlowEngine() as engine:
+            engine.add_model('a', ollama_model(base + '/a'))
+            engine.add_model('b', ollama_model(base + '/b'))
+            for model in ('a', 'b') * 5:
+                await llm_api_call('hi', model=model)
+            # 顺序调用复用同一个 keep-alive 连接
+            assert len(peers) == 1, peers
+            assert engine.http_pool.stats() == {'sessions': 1, 'sessions_created': 1}, engine.http_pool.stats()
+        assert engine.http_pool.stats()['sessions'] == 0, "close() 没有关闭会话"
+
+        # 连接池属于各自的引擎：之后创建的引擎不会接管已有引擎的请求，关闭它也不影响已有引擎
+        dsl = """
+executors:
+  - name: ask
+    type: task
+    func: llm_api_call
+    custom_vars: {user_input: hi, model: a}
+"""
+        first = FlowEngine()
+        second = FlowEngine()
+        node = (await first.execute_dsl(dsl, inputs={}))['results']['ask']
+        assert node.status == 'success', node.error
+        await second.close()
+        node = (await first.execute_dsl(dsl, inputs={}))['results']['ask']
+        assert node.status == 'success', node.error
+        assert first.http_pool.stats()['sessions_created'] == 1 and second.http_pool.stats()['sessions_created'] == 0
+        await first.close()
+
+
+@behavior_check("Streaming LLM calls yield deltas in order as they arrive")
+async def check_llm_streaming():
+    import json
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.functions.llm_api import llm_api_call, llm_api_stream
+    tokens = ["Hel", "lo", " wor", "ld"]
+
+    async def handler(request):
+        body = await request.json()
+        assert body['stream'] is True
+        if request.path == '/openai':
+            lines = [f"data: {json.dumps({'choices': [{'delta': {'content': t}}]})}\n" for t in tokens]
+            lines.append("data: [DONE]\n")
+        else:
+            lines = [json.dumps({'message': {'content': t}, 'done': False}) for t in tokens]
+            lines.append(json.dumps({'message': {'content': ''}, 'done': True}))
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for line in lines:
+            await response.write((line + "\n").encode())
+            await asyncio.sleep(0.05)
+        await response.write_eof()
+        return response
+
+    async with mock_llm_server(handler) as base, FlowEngine() as engine:
+        engine.add_model('oa', ollama_model(base + '/openai', platform='openai', message_format='openai'))
+        engine.add_model('ol', ollama_model(base + '/ollama'))
+        for model in ('oa', 'ol'):
+            start = time.perf_counter()
+            arrivals = []
+            async for delta in llm_api_stream('hi', model=model):
+                arrivals.append((delta, time.perf_counter() - start))
+            assert [delta for delta, _ in arrivals] == tokens, arrivals
+            # 第一个增量在上游写完之前就已到达
+            assert arrivals[0][1] < arrivals[-1][1] - 0.1, arrivals
+        received = []
+
+        async def on_token(delta):
+            received.append(delta)
+
+        reply = await llm_api_call('hi', model='ol', on_token=on_token)
+        assert reply == "Hello world" and received == tokens, (reply, received)
+
+
+@behavior_check("Workflow event stream reports nodes and tokens in order")
+async def check_event_stream():
+    from llm_flow_engine import FlowEngine
+
+    async def speak(text, on_token=None):
+        for word in text.split():
+            if on_token is not None:
+                await on_token(word)
+        return text
+
+    dsl = """
+executors:
+  - name: a
+    type: task
+    func: speak
+    custom_vars: {text: "one two three"}
+  - name: b
+    type: task
+    func: speak
+    depends_on: [a]
+"""
+    engine = FlowEngine()
+    engine.register_function('speak', speak)
+    events = [event async for event in engine.execute_dsl_stream(dsl, inputs={})]
+    seen = [(e['type'], e.get('node'), e.get('delta')) for e in events if e['type'] != 'run_finished']
+    assert seen[:5] == [('node_started', 'a', None), ('node_token', 'a', 'one'), ('node_token', 'a', 'two'),
+                        ('node_token', 'a', 'three'), ('node_finished', 'a', None)], seen
+    assert seen[5] == ('node_started', 'b', None) and seen[-1] == ('node_finished', 'b', None), seen
+    assert events[-1]['type'] == 'run_finished' and events[-1]['results']['b'].output == "one two three"
+    # 非流式运行不注入回调
+    result = await engine.execute_dsl(dsl, inputs={})
+    assert result['results']['b'].output == "one two three"
+
+
+@behavior_check("Streaming producers do not deadlock on concurrency slots")
+async def check_stream_backpressure_slots():
+    from llm_flow_engine import FlowEngine
+
+    async def produce(text, on_token=None):
+        for i in range(20):
+            await on_token(f"{i},")
+        return "done"
+
+    async def consume(other, stream):
+        return (await stream.text()) + other
+
+    dsl = """
+concurrency: {max_in_flight: 1}
+executors:
+  - name: p
+    type: task
+    func: produce
+    custom_vars: {text: go}
+  - name: b
+    type: task
+    func: echo
+    custom_vars: {text: "|b"}
+  - name: c
+    type: task
+    func: consume
+    stream_from: p
+    stream_buffer: 2
+    depends_on: [b]
+"""
+    engine = FlowEngine()
+    engine.register_function('produce', produce)
+    engine.register_function('consume', consume)
+    engine.register_function('echo', lambda text: text)
+    result = await asyncio.wait_for(engine.execute_dsl(dsl, inputs={}), timeout=5)
+    node = result['results']['c']
+    assert node.status == 'success', node.error
+    assert node.output == ''.join(f"{i}," for i in range(20)) + "|b", node.output
+
+
+@behavior_check("Node result cache hits, expires and persists")
+async def check_result_cache():
+    import tempfile
+    from llm_flow_engine import FlowEngine
+    calls = []
+
+    async def lookup(query):
+        calls.append(query)
+        return {'answer': query.upper()}
+
+    def dsl(query, cache):
+        return f"""
+executors:
+  - name: a
+    type: task
+    func: lookup
+    custom_vars: {{query: {query}}}
+    cache: {cache}
+"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_cache = f"{{backend: sqlite, path: {os.path.join(tmp, 'results.db')}}}"
+        for _ in range(2):
+            async with FlowEngine() as engine:
+                engine.register_function('lookup', lookup)
+                first = (await engine.execute_dsl(dsl('q', sqlite_cache), inputs={}))['results']['a']
+                again = (await engine.execute_dsl(dsl('q', sqlite_cache), inputs={}))['results']['a']
+                assert again.cache_hit and again.output == {'answer': 'Q'}, again.output
+        # 第二个引擎直接命中磁盘上的结果
+        assert calls == ['q'] and first.cache_hit, calls
+
+        async with FlowEngine() as engine:
+            engine.register_function('lookup', lookup)
+            results = [(await engine.execute_dsl(dsl(query, '{ttl: 0.3}'), inputs={}))['results']['a']
+                       for query in ('m', 'm', 'n')]
+            assert [r.cache_hit for r in results] == [False, True, False], [r.cache_hit for r in results]
+            # 缓存保存和返回的都是副本，调用方修改输出不影响缓存内容
+            results[0].output['answer'] = 'changed'
+            results[1].output['answer'] = 'changed'
+            assert (await engine.execute_dsl(dsl('m', '{ttl: 0.3}'), inputs={}))['results']['a'].output == {'answer': 'M'}
+            await asyncio.sleep(0.35)
+            expired = (await engine.execute_dsl(dsl('m', '{ttl: 0.3}'), inputs={}))['results']['a']
+            assert not expired.cache_hit and expired.output == {'answer': 'M'}
+            uncached = (await engine.execute_dsl(dsl('m', 'false'), inputs={}))['results']['a']
+            assert uncached.cache_hit is None and calls == ['q', 'm', 'n', 'm', 'm'], calls
+
+        # 同一作用域的多个 lambda 不共用缓存键；重新注册同名函数后旧结果不再命中
+        def node(func):
+            return f"executors:\n  - {{name: a, type: task, func: {func}, custom_vars: {{text: Hi}}, cache: true}}\n"
+        async with FlowEngine() as engine:
+            engine.register_function('up', lambda text: text.upper())
+            engine.register_function('low', lambda text: text.lower())
+            assert (await engine.execute_dsl(node('up')))['results']['a'].output == 'HI'
+            low = (await engine.execute_dsl(node('low')))['results']['a']
+            assert low.output == 'hi' and not low.cache_hit, (low.output, low.cache_hit)
+            engine.register_function('up', lambda text: text.title())
+            assert (await engine.execute_dsl(node('up')))['results']['a'].output == 'Hi'
+
+
+@behavior_check("LLM response cache is opt-in, persistent and evicts by size")
+async def check_llm_cache():
+    import tempfile
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.functions.llm_api import llm_api_call
+    hits = []
+
+    async def handler(request):
+        hits.append((await request.json())['messages'][-1]['content'])
+        return web.json_response({'message': {'content': f"reply {len(hits)} {os.urandom(100).hex()}"}})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_dir = os.environ.get('LLM_FLOW_CACHE_DIR')
+        os.environ['LLM_FLOW_CACHE_DIR'] = tmp
+        try:
+            async with mock_llm_server(handler) as base:
+                # 默认不启用：不创建文件，确定性请求也每次都发送
+                async with FlowEngine() as engine:
+                    engine.add_model('cached', ollama_model(base + '/chat'))
+                    for _ in range(2):
+                        await llm_api_call('q', model='cached', temperature=0)
+                    assert len(hits) == 2 and os.listdir(tmp) == [], (hits, os.listdir(tmp))
+                options = {'enabled': True, 'max_bytes': 400}
+                async with FlowEngine(llm_cache_options=options) as engine:
+                    engine.add_model('cached', ollama_model(base + '/chat'))
+                    # 缓存属于各自的引擎，之后创建的引擎（默认不启用缓存）不影响它
+                    FlowEngine()
+                    first = await llm_api_call('q', model='cached', temperature=0)
+                    again = await llm_api_call('q', model='cached', temperature=0)
+                    assert again == first and again.metadata['cache_hit'] and len(hits) == 3, hits
+                    await llm_api_call('q', model='cached', temperature=0.7)
+                    assert len(hits) == 4, "非确定性请求不应命中缓存"
+                    for question in 'abcdef':
+                        await llm_api_call(question, model='cached', use_cache=True)
+                    stats = engine.llm_cache_stats()
+                    assert stats['evictions'] > 0 and stats['bytes'] <= 400, stats
+                    cache = engine.llm_cache
+                assert cache._conn is None, "引擎关闭后数据库连接仍然打开"
+                assert os.path.exists(os.path.join(tmp, 'llm_responses.db'))
+                # 缓存跨引擎（进程重启）复用
+                async with FlowEngine(llm_cache_options=options) as engine:
+                    engine.add_model('cached', ollama_model(base + '/chat'))
+                    assert (await llm_api_call('f', model='cached', use_cache=True)).metadata.get('cache_hit')
+        finally:
+            if old_dir is None:
+                os.environ.pop('LLM_FLOW_CACHE_DIR', None)
+            else:
+                os.environ['LLM_FLOW_CACHE_DIR'] = old_dir
+    from llm_flow_engine.flow_engine import flow_engine
+    assert not flow_engine.llm_cache.enabled and flow_engine.llm_cache._conn is None
+
+
+@behavior_check("Semantic cache reuses answers for paraphrased prompts per model")
+async def check_semantic_cache():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine, default_model_provider
+    from llm_flow_engine.functions.llm_api import llm_simple_call
+    from llm_flow_engine.semantic_cache import get_semantic_cache
+    hits = []
+    vocab = 'how do i reset my password where is order'.split()
+
+    async def embed(text):
+        # 词袋向量：换个说法的同一问题彼此接近
+        words = text.lower().replace('?', '').split()
+        return [float(words.count(word)) for word in vocab] + [0.01]
+
+    async def handler(request):
+        if request.path == '/embed':
+            texts = (await request.json())['input']
+            return web.json_response({'embeddings': [await embed(text) for text in texts]})
+        hits.append(request.path)
+        return web.json_response({'message': {'content': f"answer {len(hits)}"}})
+
+    async with mock_llm_server(handler) as base:
+        # 没有 embed 函数或 embedding 模型时拒绝启用：哈希占位向量会让不相关的提示词“命中”
+        for bad in ({}, {'embedding_model': 'm1'}):
+            try:
+                FlowEngine(semantic_cache_options=bad)
+                raise AssertionError(f"语义缓存没有拒绝 {bad}")
+            except ValueError:
+                pass
+        options = {'threshold': 0.8, 'embed': embed}
+        async with FlowEngine(semantic_cache_options=options) as engine:
+            engine.add_model('m1', ollama_model(base + '/m1'))
+            engine.add_model('m2', ollama_model(base + '/m2'))
+            # 语义缓存属于各自的引擎，之后创建的引擎（未启用语义缓存）不影响它
+            FlowEngine()
+            first = await llm_simple_call('How do I reset my password?', model='m1')
+            assert await llm_simple_call('how do i reset password', model='m1') == first
+            assert await llm_simple_call('Where is my order?', model='m1') != first
+            # 不同模型、显式关闭时不复用
+            assert await llm_simple_call('how do i reset password', model='m2') != first
+            await llm_simple_call('how do i reset password', model='m1', use_semantic_cache=False)
+            assert len(hits) == 4, hits
+            stats = engine.semantic_cache_stats()
+            assert stats['hits'] == 1 and set(stats['namespaces']) == {'simple:m1', 'simple:m2'}, stats
+        # 默认不启用
+        assert FlowEngine().semantic_cache_stats() is None and get_semantic_cache() is None
+
+        # 通过 embedding 模型向量化：近义改写命中，不相关的提示词不命中
+        hits.clear()
+        default_model_provider.add_model('embedder', ollama_model(base + '/embed', embedding=True))
+        options = {'threshold': 0.8, 'embedding_model': 'embedder'}
+        async with FlowEngine(semantic_cache_options=options) as engine:
+            first = await llm_simple_call('How do I reset my password?', model='m1')
+            assert await llm_simple_call('how do i reset password', model='m1') == first
+            for unrelated in ('What is 2+2?', 'Translate hello to French'):
+                assert await llm_simple_call(unrelated, model='m1') != first, unrelated
+            assert len(hits) == 3 and engine.semantic_cache_stats()['hits'] == 1, hits
+
+
+@behavior_check("Identical concurrent LLM calls are coalesced into one request")
+async def check_singleflight():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.functions.llm_api import get_coalescing_stats, llm_api_call
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        await asyncio.sleep(0.1)
+        return web.json_response({'message': {'content': 'shared'}})
+
+    async with mock_llm_server(handler) as base, FlowEngine() as engine:
+        engine.add_model('flight', ollama_model(base + '/flight'))
+        engine.add_model('solo', ollama_model(base + '/solo', coalesce=False))
+        coalesced = get_coalescing_stats()['coalesced']
+        replies = await asyncio.gather(*(llm_api_call('same', model='flight') for _ in range(5)))
+        assert len(hits) == 1 and all(reply == 'shared' for reply in replies), hits
+        # 每个调用方拿到独立的元数据
+        replies[0].metadata['marker'] = True
+        assert all('marker' not in reply.metadata for reply in replies[1:])
+        await asyncio.gather(*(llm_api_call('same', model='solo') for _ in range(3)))
+        assert hits.count('/solo') == 3, hits
+        assert get_coalescing_stats()['coalesced'] - coalesced == 4, get_coalescing_stats()
+
+
+@behavior_check("Rate limits delay requests in arrival order instead of failing")
+async def check_rate_limits():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.functions.llm_api import llm_api_call
+    arrivals = []
+
+    async def handler(request):
+        arrivals.append(((await request.json())['messages'][-1]['content'], time.perf_counter()))
+        return web.json_response({'message': {'content': 'ok'}})
+
+    async with mock_llm_server(handler) as base, FlowEngine() as engine:
+        engine.add_model('limited', ollama_model(base + '/chat', rpm=600))
+        # 限流器属于各自的引擎，之后创建的引擎不影响它
+        FlowEngine()
+        await llm_api_call('warm up', model='limited')
+        [limiter] = engine.rate_limiters.limiters_for('limited', engine.model_provider.get_model_config('limited'))
+        # 清空令牌桶：之后每 0.1s 补充一个请求名额
+        limiter._requests.tokens = 0
+        start = time.perf_counter()
+        await asyncio.gather(*(llm_api_call(f"q{i}", model='limited') for i in range(3)))
+        sent = arrivals[1:]
+        assert [prompt for prompt, _ in sent] == ['q0', 'q1', 'q2'], sent
+        assert sent[-1][1] - start >= 0.25, [t - start for _, t in sent]
+        stats = engine.rate_limit_stats()['model:limited']
+        assert stats['admitted'] == 4 and stats['delayed'] == 3 and stats['waiting'] == 0, stats
+
+
+@behavior_check("Adaptive concurrency grows while healthy and backs off on 5xx")
+async def check_adaptive_concurrency():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine, LLMAPIError
+    from llm_flow_engine.functions.llm_api import llm_api_call
+    state = {'active': 0, 'peak': 0, 'status': 200}
+
+    async def handler(request):
+        if request.path == '/hang':
+            await asyncio.sleep(10)
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(0.02)
+        state['active'] -= 1
+        if state['status'] != 200:
+            return web.Response(status=state['status'], text='overloaded')
+        return web.json_response({'message': {'content': 'ok'}})
+
+    # 放宽延迟突增的判定，机器负载造成的抖动不会额外下调上限
+    options = {'initial_limit': 2, 'max_limit': 4, 'latency_tolerance': 10}
+    async with mock_llm_server(handler) as base, FlowEngine(adaptive_concurrency=options,
+                                                            circuit_breaker_options={'enabled': False}) as engine:
+        url = base + '/chat'
+        engine.add_model('adaptive', ollama_model(url))
+        # 自适应限流器属于各自的引擎，之后创建的引擎（未启用）不影响它
+        FlowEngine()
+        await asyncio.gather(*(llm_api_call(f"q{i}", model='adaptive') for i in range(30)))
+        grown = engine.adaptive_concurrency_stats()[url]
+        # 上限随成功请求增长，但在途请求数从未超过 max_limit
+        assert grown['limit'] > 2 and 2 < state['peak'] <= 4, (grown, state)
+        state['status'] = 503
+        try:
+            await llm_api_call('overloaded', model='adaptive')
+            raise AssertionError("503 没有抛出异常")
+        except LLMAPIError:
+            pass
+        backed_off = engine.adaptive_concurrency_stats()[url]
+        assert backed_off['limit'] == max(1, int(grown['limit'] * 0.5)) and backed_off['decreases'] == 1, backed_off
+        # 端点无响应、请求被节点超时取消，同样算超时并下调上限
+        engine.add_model('hung', ollama_model(base + '/hang'))
+        dsl = """
+executors:
+  - name: ask
+    type: task
+    func: llm_api_call
+    custom_vars: {user_input: hi, model: hung}
+    timeout: 0.2
+"""
+        node = (await engine.execute_dsl(dsl, inputs={}))['results']['ask']
+        hung = engine.adaptive_concurrency_stats()[base + '/hang']
+        assert node.status == 'failed' and hung['failures'] == 1 and hung['limit'] == 1, (node.status, hung)
+
+
+@behavior_check("Multi-endpoint models spread load and eject failing endpoints")
+async def check_load_balancing():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine, LLMAPIError
+    from llm_flow_engine.functions.llm_api import llm_api_call
+    hits = {'e1': 0, 'e2': 0}
+    broken = set()
+
+    async def handler(request):
+        name = request.path.strip('/')
+        hits[name] += 1
+        # e1 较慢，空闲时的顺序请求优先发往 e2
+        await asyncio.sleep(0.04 if name == 'e1' else 0.02)
+        if name in broken:
+            return web.Response(status=503, text='unavailable')
+        return web.json_response({'message': {'content': name}})
+
+    async with mock_llm_server(handler) as base, FlowEngine(load_balancer_options={'failure_threshold': 2}) as engine:
+        engine.add_model('pool', ollama_model(base + '/e1', endpoints=[base + '/e1', base + '/e2']))
+        # 负载均衡器属于各自的引擎，之后创建的引擎不影响它
+        FlowEngine()
+        replies = await asyncio.gather(*(llm_api_call(f"q{i}", model='pool') for i in range(10)))
+        assert hits == {'e1': 5, 'e2': 5}, hits
+        assert all(reply.metadata['endpoint'] == base + '/' + str(reply) for reply in replies)
+        broken.add('e2')
+        failures = 0
+        for i in range(6):
+            try:
+                await llm_api_call(f"r{i}", model='pool')
+            except LLMAPIError:
+                failures += 1
+        # e2 连续失败 2 次后被摘除，之后的请求只发往 e1
+        assert failures == 2 and hits['e2'] == 7, (failures, hits)
+        stats = engine.endpoint_stats()['pool']
+        assert stats[base + '/e2']['ejected'] and stats[base + '/e2']['ejections'] == 1, stats
+        assert not stats[base + '/e1']['ejected'] and stats[base + '/e1']['failures'] == 0, stats
+
+
+@behavior_check("Slow calls are hedged and hedge stats stay per workflow")
+async def check_hedging():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        # 第一个请求很慢，对冲副本很快返回
+        await asyncio.sleep(1.0 if len(hits) == 1 else 0.0)
+        return web.json_response({'message': {'content': f"reply {len(hits)}"}})
+
+    def dsl(question, delay):
+        return f"""
+executors:
+  - name: ask
+    type: task
+    func: llm_api_call
+    custom_vars: {{user_input: {question}, model: hedged}}
+    hedge: {{delay: {delay}, budget: 1.0}}
+"""
+    async with mock_llm_server(handler) as base, FlowEngine() as engine:
+        engine.add_model('hedged', ollama_model(base + '/chat'))
+        start = time.perf_counter()
+        node = (await engine.execute_dsl(dsl('first', 0.05), inputs={}))['results']['ask']
+        assert node.status == 'success' and node.output == 'reply 2', (node.output, node.error)
+        assert time.perf_counter() - start < 0.8, "对冲副本没有提前返回"
+        [(key, stats)] = engine.hedge_stats().items()
+        assert stats['hedges'] == 1 and stats['hedge_wins'] == 1, stats
+        # 另一个未命名的工作流使用独立的统计
+        await engine.execute_dsl(dsl('second', 0.05), inputs={})
+        assert len(engine.hedge_stats()) == 2 and engine.hedge_stats()[key]['primaries'] == 1
+        # 同一个键的参数变化时按新参数重建
+        policy = engine.hedging.get(key, {'delay': 0.05, 'budget': 1.0})
+        assert engine.hedging.get(key, {'delay': 0.05, 'budget': 1.0}) is policy
+        assert engine.hedging.get(key, {'delay': 0.2}).delay() == 0.2
+
+
+@behavior_check("Circuit breakers open, probe half-open and fall back")
+async def check_circuit_breaker():
+    from aiohttp import web
+    from llm_flow_engine import CircuitOpenError, FlowEngine
+    from llm_flow_engine.functions.llm_api import llm_api_call, llm_api_stream
+    hits = {'down': 0, 'backup': 0, 'hang': 0, 'flaky': 0}
+    healthy = {'down': False}
+
+    async def handler(request):
+        name = request.path.strip('/')
+        hits[name] += 1
+        if name == 'hang':
+            await asyncio.sleep(10)
+        if name == 'flaky' or (name == 'down' and not healthy['down']):
+            return web.Response(status=503, text='unavailable')
+        return web.json_response({'message': {'content': name}})
+
+    options = {'min_calls': 2, 'window': 2, 'open_duration': 0.2}
+    async with mock_llm_server(handler) as base, FlowEngine(circuit_breaker_options=options) as engine:
+        engine.add_model('primary', ollama_model(base + '/down', fallbacks=['backup']))
+        engine.add_model('backup', ollama_model(base + '/backup'))
+        engine.add_model('alone', ollama_model(base + '/down'))
+        # 熔断器属于各自的引擎，之后创建的引擎不影响它
+        FlowEngine()
+        for _ in range(2):
+            reply = await llm_api_call('hi', model='primary')
+            assert reply == 'backup' and reply.metadata['fallback_from'] == 'primary', reply.metadata
+        breaker = engine.circuit_breaker_stats()[base + '/down']
+        assert breaker['state'] == 'open', breaker
+        # 熔断中：不再请求主端点，直接改用备用模型；没有备用模型时快速失败
+        assert await llm_api_call('hi', model='primary') == 'backup' and hits['down'] == 2, hits
+        try:
+            await llm_api_call('hi', model='alone')
+            raise AssertionError("熔断中的端点没有被拒绝")
+        except CircuitOpenError as e:
+            assert not e.retryable
+        # 半开：放行一次试探请求，成功后关闭
+        await asyncio.sleep(0.25)
+        healthy['down'] = True
+        assert await llm_api_call('hi', model='primary') == 'down'
+        assert engine.circuit_breaker_stats()[base + '/down']['state'] == 'closed'
+        # 端点无响应、请求被节点超时取消，算作失败，连续两次后熔断
+        engine.add_model('hung', ollama_model(base + '/hang'))
+        dsl = """
+executors:
+  - name: ask
+    type: task
+    func: llm_api_call
+    custom_vars: {user_input: hi, model: hung}
+    timeout: 0.2
+    retry: 1
+    retry_interval: 0.01
+"""
+        node = (await engine.execute_dsl(dsl, inputs={}))['results']['ask']
+        hung = engine.circuit_breaker_stats()[base + '/hang']
+        assert node.status == 'failed' and hung['failures'] == 2 and hung['state'] == 'open', (node.status, hung)
+        # 流式调用：主模型返回 5xx 且尚未产出时同样改用备用模型
+        engine.add_model('flaky', ollama_model(base + '/flaky', fallbacks=['backup']))
+        metadata = {}
+        deltas = [delta async for delta in llm_api_stream('hi', model='flaky', _metadata=metadata)]
+        assert deltas == ['backup'] and metadata['fallback_from'] == 'flaky', (deltas, metadata)
+        assert hits['flaky'] == 1 and engine.circuit_breaker_stats()[base + '/flaky']['failures'] == 1
+
+
+@behavior_check("Connection errors are typed, retried and fail the node")
+async def check_connection_errors():
+    import aiohttp
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine, LLMConnectionError
+    from llm_flow_engine.functions.llm_api import llm_api_call
+
+    async def handler(request):
+        return web.Response(status=200, text='<html>maintenance</html>', content_type='text/html')
+
+    async with mock_llm_server(handler) as base, FlowEngine() as engine:
+        # 200 但不是 JSON 的响应是格式错误，原样抛出，不当作连接错误
+        engine.add_model('html', ollama_model(base + '/chat'))
+        try:
+            await llm_api_call('hi', model='html')
+            raise AssertionError("非 JSON 响应没有抛出异常")
+        except LLMConnectionError:
+            raise AssertionError("非 JSON 响应被当作连接错误")
+        except aiohttp.ContentTypeError:
+            pass
+        closed_url = closed_port_url()
+        engine.add_model('closed-port', ollama_model(closed_url))
+        try:
+            await llm_api_call('hi', model='closed-port')
+            raise AssertionError("连接失败没有抛出异常")
+        except LLMConnectionError as e:
+            assert e.retryable
+        # rag_qa 内部捕获一般异常，连接错误必须穿过它让节点失败并重试
+        dsl = """
+executors:
+  - name: ask
+    type: task
+    func: rag_qa
+    custom_vars: {question: hi, model: closed-port}
+    retry: 2
+    retry_interval: 0.01
+"""
+        node = (await engine.execute_dsl(dsl, inputs={}))['results']['ask']
+        assert node.status == 'failed' and 'Connection Error' in node.error, (node.status, node.error)
+        # 直接调用 1 次 + 节点 3 次尝试，熔断器都记为失败
+        breaker = engine.circuit_breaker_stats()[closed_url]
+        assert breaker['failures'] == 4, breaker
+
+
+@behavior_check("Retries honor Retry-After and skip non-retryable errors")
+async def check_retry_after():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    hits = {}
+
+    async def handler(request):
+        name = request.path.strip('/')
+        hits[name] = hits.get(name, 0) + 1
+        if name == 'busy' and hits[name] == 1:
+            return web.Response(status=429, text='slow down', headers={'Retry-After': '0.3'})
+        if name == 'bad':
+            return web.Response(status=400, text='bad request')
+        return web.json_response({'message': {'content': name}})
+
+    def dsl(model):
+        return f"""
+executors:
+  - name: ask
+    type: task
+    func: llm_api_call
+    custom_vars: {{user_input: hi, model: {model}}}
+    retry: 3
+    retry_interval: 0.01
+"""
+    async with mock_llm_server(handler) as base, FlowEngine() as engine:
+        engine.add_model('busy', ollama_model(base + '/busy'))
+        engine.add_model('bad', ollama_model(base + '/bad'))
+        start = time.perf_counter()
+        node = (await engine.execute_dsl(dsl('busy'), inputs={}))['results']['ask']
+        assert node.status == 'success' and node.output == 'busy', node.error
+        assert time.perf_counter() - start >= 0.3, "没有等待 Retry-After"
+        node = (await engine.execute_dsl(dsl('bad'), inputs={}))['results']['ask']
+        assert node.status == 'failed' and hits['bad'] == 1, hits
+
+
+
+@behavior_check("Concurrent embedding calls are micro-batched in order")
+async def check_micro_batch():
+    from aiohttp import web
+    from llm_flow_engine import FlowEngine
+    from llm_flow_engine.functions.rag import embedding_text
+    batches = []
+
+    async def handler(request):
+        texts = (await request.json())['input']
+        batches.append(len(texts))
+        return web.json_response({'embeddings': [[float(text[1:])] for text in texts]})
+
+    async with mock_llm_server(handler) as base, FlowEngine(micro_batch={'max_batch': 8, 'max_wait': 0.01}) as engine:
+        engine.add_model('embedder', ollama_model(base + '/api/embed', embedding=True))
+        # 微批处理器属于各自的引擎，之后创建的引擎（未启用）不影响它
+        FlowEngine()
+        vectors = await asyncio.gather(*(embedding_text(f"t{i}", model='embedder') for i in range(20)))
+        # 20 条请求合并为 8 + 8 + 4 三次调用，每个调用方拿到自己那条文本的向量
+        assert vectors == [[float(i)] for i in range(20)], vectors
+        assert batches == [8, 8, 4], batches
+        stats = engine.micro_batch_stats()
+        assert stats['batches'] == 3 and stats['items'] == 20 and stats['largest_batch'] == 8, stats
+
 def main():
     """主验证函数"""
     safe_print("[START] LLM Flow Engine Project Validation")
@@ -258,6 +1376,7 @@ def main():
         ("DSL加载", test_dsl_loading),
         ("异步执行", test_async_wrapper),
     ]
+    tests += [(name, lambda name=name, func=func: run_check(name, func)) for name, func in BEHAVIOR_CHECKS]
     
     passed = 0
     total = len(tests)